@@ -0,0 +1,130 @@
+"""
+Image preprocessing check: image tokens of the adaptive per-block-type
+encoding vs. the baseline (2000 px, RGB, JPEG q85) on a processed document,
+and an optional accuracy spot check that extracts a sample of blocks with
+both encodings and compares the answers.
+
+Usage:
+    python -m benchmarks.bench_image_prep output/<document>
+    python -m benchmarks.bench_image_prep output/<document> --spot-check --per-type 5
+"""
+import argparse
+import difflib
+import json
+import random
+import sys
+import tempfile
+from pathlib import Path
+from PIL import Image
+import config
+import image_prep
+import metrics
+from pipeline.artifact_store import open_store
+from pipeline.step_2_targeted_extraction import crop_image, extract_block, select_prompt
+
+def collect_blocks(doc_dir: Path) -> list:
+    """
+    (page image path, block type, box) of every block in the document's layouts.
+    """
+    blocks = []
+    with open_store(doc_dir) as store:
+        for page in store.pages("layout"):
+            image_path = doc_dir / f"page_{page}.png"
+            if not image_path.exists():
+                continue
+            for block in store.get("layout", page) or []:
+                if isinstance(block, dict) and block.get("box") and select_prompt(block.get("type")):
+                    blocks.append((image_path, block["type"], block["box"]))
+    return blocks
+
+def token_counts(crop: Image.Image, block_type: str) -> tuple:
+    """
+    (baseline tokens, adaptive tokens) of one crop.
+    """
+    baseline = image_prep.image_tokens(*image_prep.baseline_size(crop.size))
+    prepared, _, _ = image_prep.prepare_image(crop, config.IMAGE_PROFILES.get(block_type))
+    return baseline, image_prep.image_tokens(*prepared.size)
+
+def as_text(content) -> str:
+    if isinstance(content, str):
+        return " ".join(content.split())
+    return json.dumps(content, ensure_ascii=False, sort_keys=True)
+
+def extract_with(prep_enabled: bool, crop_path: Path, block_type: str):
+    config.IMAGE_PREP_ENABLED = prep_enabled
+    with metrics.tags(stage="extraction", block_type=block_type):
+        return extract_block(crop_path, block_type, select_prompt(block_type))
+
+def main():
+    parser = argparse.ArgumentParser(description="Image tokens and accuracy of the adaptive image preprocessing.")
+    parser.add_argument("document", type=Path, help="Processed document folder (page images + layout).")
+    parser.add_argument("--spot-check", action="store_true",
+                        help="Extract sampled blocks with both encodings and compare the answers (model calls).")
+    parser.add_argument("--per-type", type=int, default=3, help="Blocks per type in the spot check.")
+    parser.add_argument("--min-similarity", type=float, default=0.9,
+                        help="Minimum mean answer similarity per block type to pass the spot check.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    blocks = collect_blocks(args.document)
+    if not blocks:
+        print(f"No layout blocks found in {args.document}. Run steps 0-1 first.")
+        return 1
+
+    per_type = {} # block type -> [baseline tokens, adaptive tokens, blocks]
+    for image_path, block_type, box in blocks:
+        with Image.open(image_path) as page:
+            baseline, adaptive = token_counts(crop_image(page, box), block_type)
+        totals = per_type.setdefault(block_type, [0, 0, 0])
+        totals[0] += baseline
+        totals[1] += adaptive
+        totals[2] += 1
+
+    print(f"{'block type':<14}{'blocks':>8}{'baseline tok':>14}{'adaptive tok':>14}{'saved':>8}")
+    for block_type, (baseline, adaptive, count) in sorted(per_type.items()):
+        saved = 1 - adaptive / baseline if baseline else 0.0
+        print(f"{block_type:<14}{count:>8}{baseline:>14}{adaptive:>14}{saved:>8.0%}")
+    baseline_total = sum(v[0] for v in per_type.values())
+    adaptive_total = sum(v[1] for v in per_type.values())
+    print(f"Total: {baseline_total} -> {adaptive_total} image tokens ({baseline_total - adaptive_total} saved)")
+
+    if not args.spot_check:
+        return 0
+
+    rng = random.Random(args.seed)
+    by_type = {}
+    for block in blocks:
+        by_type.setdefault(block[1], []).append(block)
+
+    failed = False
+    prep_enabled = config.IMAGE_PREP_ENABLED
+    # extract_with switches the flag: restore it even if the spot check is interrupted
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            print(f"\nSpot check ({args.per_type} blocks per type, baseline vs adaptive answers):")
+            for block_type, candidates in sorted(by_type.items()):
+                similarities = []
+                for k, (image_path, _, box) in enumerate(rng.sample(candidates, min(args.per_type, len(candidates)))):
+                    crop_path = Path(tmp) / f"{block_type}_{k}.png"
+                    with Image.open(image_path) as page:
+                        crop_image(page, box).save(crop_path)
+                    try:
+                        baseline = extract_with(False, crop_path, block_type)
+                        adaptive = extract_with(True, crop_path, block_type)
+                    except Exception as e:
+                        print(f"  {block_type}: extraction failed ({e})")
+                        continue
+                    similarities.append(difflib.SequenceMatcher(None, as_text(baseline), as_text(adaptive)).ratio())
+                if not similarities:
+                    continue
+                mean = sum(similarities) / len(similarities)
+                status = "OK" if mean >= args.min_similarity else "FAIL"
+                failed = failed or mean < args.min_similarity
+                print(f"  {block_type:<14} mean similarity {mean:.3f} (min {min(similarities):.3f}) {status}")
+    finally:
+        config.IMAGE_PREP_ENABLED = prep_enabled
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
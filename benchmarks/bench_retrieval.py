@@ -0,0 +1,97 @@
+"""
+Benchmark: per-query Chroma retrieval vs. one batched NumPy matmul over the
+exported embedding matrix, plus an equality check on the top-k results.
+
+Usage:
+    python -m benchmarks.bench_retrieval [--k 10] [--repeat 3]
+"""
+import argparse
+import sys
+import time
+import config
+from pipeline import rule_plans
+from pipeline.collection_registry import resolve_collections
+from pipeline.dense_retrieval import DenseIndex
+from pipeline.embeddings import get_client, get_embedding_function
+from run_audit import load_rules
+
+def collect_queries(rules: list) -> list:
+    """
+    Uses compiled rule queries where available, otherwise the rule text itself
+    (the benchmark must not depend on LLM calls).
+    """
+    queries = []
+    for rule_obj in rules:
+        rule_text = rule_obj.get("text", "")
+        plan = rule_plans.find_plan(rule_text)
+        queries.extend(plan["queries"] if plan else [rule_text])
+    return queries
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Chroma vs NumPy retrieval.")
+    parser.add_argument("--k", type=int, default=10, help="Top-k per query.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions (best is reported).")
+    parser.add_argument("--min-overlap", type=float, default=1.0,
+                        help="Minimum mean top-k set overlap to pass (HNSW is approximate on large indexes).")
+    parser.add_argument("--collection", help="Collection to benchmark (default: the first of the default project).")
+    args = parser.parse_args()
+
+    queries = collect_queries(load_rules())
+    if not queries:
+        print("No queries to benchmark.")
+        return 1
+
+    embedding_fn = get_embedding_function()
+    query_embeddings = embedding_fn(queries)
+
+    name = args.collection or next(iter(resolve_collections()), None)
+    if name is None:
+        print(f"No indexed collections for project '{config.DEFAULT_PROJECT}'.")
+        return 1
+
+    client = get_client()
+    collection = client.get_collection(name=name)
+    index = DenseIndex.load(name)
+    k = min(args.k, len(index))
+    print(f"{len(queries)} queries, {len(index)} chunks, k={k}")
+
+    # --- Chroma: one collection.query per query (current audit loop) ---
+    chroma_best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        chroma_ids = []
+        for emb in query_embeddings:
+            results = collection.query(query_embeddings=[emb], n_results=k, include=["distances"])
+            chroma_ids.append(results["ids"][0])
+        chroma_best = min(chroma_best, time.perf_counter() - start)
+
+    # --- NumPy: one batched matmul + argpartition ---
+    numpy_best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        indices, _ = index.search(query_embeddings, k)
+        numpy_best = min(numpy_best, time.perf_counter() - start)
+    numpy_ids = [[index.ids[i] for i in row] for row in indices]
+
+    # --- Equality check ---
+    exact = 0
+    overlap_sum = 0.0
+    for q, (a, b) in enumerate(zip(chroma_ids, numpy_ids)):
+        if a == b:
+            exact += 1
+        overlap = len(set(a) & set(b)) / max(len(a), 1)
+        overlap_sum += overlap
+        if overlap < 1.0:
+            print(f"  Mismatch for query #{q} '{queries[q][:40]}': chroma={a} numpy={b}")
+    mean_overlap = overlap_sum / len(queries)
+
+    print("\n--- Results ---")
+    print(f"Chroma:  {chroma_best * 1000:.1f} ms ({len(queries) / chroma_best:.0f} queries/s)")
+    print(f"NumPy:   {numpy_best * 1000:.1f} ms ({len(queries) / numpy_best:.0f} queries/s)")
+    print(f"Speedup: {chroma_best / max(numpy_best, 1e-9):.1f}x")
+    print(f"Top-k identical (same order): {exact}/{len(queries)}, mean set overlap: {mean_overlap:.3f}")
+
+    return 0 if mean_overlap >= args.min_overlap else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
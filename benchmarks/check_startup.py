@@ -0,0 +1,93 @@
+"""
+Import-time budget check for the CLI entry points.
+
+Runs light commands (--help, module imports) in fresh interpreters and fails if
+cold start exceeds the budget or a heavy dependency gets imported eagerly.
+
+Usage:
+    python -m benchmarks.check_startup [--budget-ms 800] [--runs 3]
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Modules that must not be loaded by light commands
+HEAVY_MODULES = ("torch", "chromadb", "sentence_transformers", "transformers", "numpy", "openai", "pdf2image")
+
+# (name, python code run in a fresh interpreter, modules it must not load, time-budgeted)
+# run_audit needs the OpenAI client anyway, so it is only checked for ML imports.
+LIGHT_COMMANDS = [
+    ("cli --help", "import cli\ntry:\n    cli.main(['--help'])\nexcept SystemExit:\n    pass", HEAVY_MODULES, True),
+    ("cli query --help", "import cli\ntry:\n    cli.main(['query', '--help'])\nexcept SystemExit:\n    pass", HEAVY_MODULES, True),
+    ("import config", "import config", HEAVY_MODULES, True),
+    ("import query_rag", "import query_rag", HEAVY_MODULES, True),
+    ("import run_audit", "import run_audit", ("torch", "chromadb", "sentence_transformers", "transformers", "numpy"), False),
+    ("import page_routing", "import pipeline.page_routing", HEAVY_MODULES, False),
+]
+
+PROBE = """
+import sys, time, json, io, contextlib
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+{code}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+def probe(code: str) -> dict:
+    indented = "\n".join("    " + line for line in code.splitlines())
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE.format(code=indented)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip())
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["wall"] = wall
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Check cold-start import time of light CLI commands.")
+    parser.add_argument("--budget-ms", type=float, default=800.0, help="Max import time per light command (best of runs).")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per command (best is used).")
+    args = parser.parse_args()
+
+    failures = []
+    for name, code, forbidden, budgeted in LIGHT_COMMANDS:
+        try:
+            runs = [probe(code) for _ in range(args.runs)]
+        except RuntimeError as e:
+            failures.append(f"{name}: failed to run: {e}")
+            continue
+
+        best_ms = min(r["elapsed"] for r in runs) * 1000
+        wall_ms = min(r["wall"] for r in runs) * 1000
+        loaded = sorted({m.split(".")[0] for m in runs[0]["modules"]} & set(forbidden))
+
+        status = "OK"
+        if budgeted and best_ms > args.budget_ms:
+            status = "SLOW"
+            failures.append(f"{name}: {best_ms:.0f} ms > budget {args.budget_ms:.0f} ms")
+        if loaded:
+            status = "HEAVY"
+            failures.append(f"{name}: eagerly imports {', '.join(loaded)}")
+        print(f"{name:<22} import {best_ms:>7.0f} ms   process {wall_ms:>7.0f} ms   {status}")
+
+    if failures:
+        print("\nStartup budget check FAILED:")
+        for failure in failures:
+            print(f"  - {failure}")
+        return 1
+
+    print("\nStartup budget check passed.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
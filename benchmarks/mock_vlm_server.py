@@ -0,0 +1,275 @@
+"""
+Local stub of an OpenAI-compatible chat completions server.
+
+Returns canned layout / extraction / compliance JSON depending on the prompt,
+with configurable latency and error rate, so the pipeline can be benchmarked
+without a live Qwen-VL endpoint.
+
+Usage:
+    python -m benchmarks.mock_vlm_server --port 8880 --latency-ms 200 --error-rate 0.02
+    # then point QWEN_BASE_URL at http://localhost:8880/v1
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_LAYOUT = [
+    {"type": "header", "box": [40, 80, 90, 920]},
+    {"type": "text_block", "box": [100, 80, 300, 920]},
+    {"type": "table", "box": [320, 80, 560, 920]},
+    {"type": "drawing", "box": [580, 80, 840, 600]},
+    {"type": "text_block", "box": [580, 620, 840, 920]},
+    {"type": "title_block", "box": [860, 500, 980, 990]}
+]
+
+CANNED_TITLE_BLOCK = {
+    "Номер_проекта": "123-2024-ПЗ",
+    "Название_листа": "Пояснительная записка",
+    "Организация": "ООО Проект",
+    "Лист": "1",
+    "Листов": "10",
+    "Стадия": "П"
+}
+
+CANNED_TABLE = """| Поз. | Наименование | Кол. | Примечание |
+|---|---|---|---|
+| 1 | Бетон B25 | 120 м3 | |
+| 2 | Арматура А500С | 8 т | ГОСТ 34028-2016 |
+| 3 | Кирпич КР-р-по 250х120х65 | 15000 шт | |"""
+
+CANNED_DRAWING = {
+    "description": "План 1-го этажа",
+    "content": [
+        {"text": "А", "box": [100, 50, 130, 80]},
+        {"text": "1", "box": [100, 900, 130, 930]},
+        {"text": "3600", "box": [500, 500, 550, 600]},
+        {"text": "Помещение охраны", "box": [300, 300, 330, 450]}
+    ]
+}
+
+CANNED_TEXT = (
+    "Проектная документация разработана на основании договора № 15/24 от 10.01.2024 "
+    "и задания на проектирование, утвержденного заказчиком. Класс бетона фундаментов B25, "
+    "уровень ответственности здания - нормальный."
+)
+
+CANNED_SINGLE_PASS = [
+    {"type": "header", "box": [40, 80, 90, 920], "content": "1. Общие данные"},
+    {"type": "text_block", "box": [100, 80, 600, 920], "content": CANNED_TEXT},
+    {"type": "title_block", "box": [860, 500, 980, 990], "content": CANNED_TITLE_BLOCK}
+]
+
+CANNED_QUERIES = ["реквизиты договора на проектирование", "задание на проектирование", "исходные данные"]
+
+CANNED_VERDICT = {
+    "status": "ВЫПОЛНЕНО",
+    "reason": "В пояснительной записке указаны реквизиты договора.",
+    "evidence": "договора № 15/24 от 10.01.2024",
+    "source_page": "1"
+}
+
+def keyed_text_blocks(text: str) -> str:
+    """
+    Answer for MULTI_TEXT_BLOCK_PROMPT: the same text for every requested key.
+    """
+    match = re.search(r"Ключи блоков: (.+)", text)
+    keys = [k.strip() for k in match.group(1).split(",")] if match else []
+    return json.dumps({key: CANNED_TEXT for key in keys}, ensure_ascii=False)
+
+# (marker in prompt, canned response or function of the prompt text). First match
+# wins; markers are distinctive phrases of the prompts in prompts.py / step_6_compliance.py.
+CANNED_RESPONSES = [
+    ("несколько изображений небольших текстовых блоков", keyed_text_blocks),
+    ("За один проход", json.dumps(CANNED_SINGLE_PASS, ensure_ascii=False)),
+    ("Проанализируй структуру страницы", json.dumps(CANNED_LAYOUT, ensure_ascii=False)),
+    ("изображения штампа", json.dumps(CANNED_TITLE_BLOCK, ensure_ascii=False)),
+    ("Извлеки все данные из этой таблицы", CANNED_TABLE),
+    ("Проанализируй этот фрагмент чертежа", json.dumps(CANNED_DRAWING, ensure_ascii=False)),
+    ("Распознай весь текст", CANNED_TEXT),
+    ("поисковых запроса", json.dumps(CANNED_QUERIES, ensure_ascii=False)),
+    ("проверить соответствие", json.dumps(CANNED_VERDICT, ensure_ascii=False)),
+]
+
+# Prose that real models tend to append after the JSON (exercises early stop)
+TRAILING_PROSE = "\n\nПояснение: ответ сформирован на основании предоставленных данных."
+
+def prompt_text(messages: list) -> tuple:
+    """
+    Returns (all text of the request, number of images).
+    """
+    texts = []
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    texts.append(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    images += 1
+    return "\n".join(texts), images
+
+def canned_response(text: str) -> str:
+    for marker, response in CANNED_RESPONSES:
+        if marker in text:
+            return response(text) if callable(response) else response
+    return "OK"
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Set by make_server()
+    latency_ms = 0.0
+    jitter_ms = 0.0
+    error_rate = 0.0
+    rng = random.Random(0)
+    stats = None
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass # Keep benchmark output clean
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock-vl", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            fail = self.rng.random() < self.error_rate
+            delay = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+        time.sleep(delay)
+
+        if fail:
+            with self.stats_lock:
+                self.stats["errors"] += 1
+            self._send_json(500, {"error": {"message": "Injected failure", "type": "server_error"}})
+            return
+
+        text, images = prompt_text(request.get("messages", []))
+        content = canned_response(text) + TRAILING_PROSE
+        usage = {
+            "prompt_tokens": len(text) // 3 + images * 1000,
+            "completion_tokens": len(content) // 3,
+            "total_tokens": len(text) // 3 + images * 1000 + len(content) // 3
+        }
+
+        if request.get("stream"):
+            self._stream(request, content, usage)
+            return
+
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock-vl"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        })
+
+    def _stream(self, request: dict, content: str, usage: dict):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def send_event(payload):
+            data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+            self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        base = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": request.get("model", "mock-vl")}
+        try:
+            step = 8 # Characters per streamed delta
+            for i in range(0, len(content), step):
+                send_event({**base, "choices": [{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}]})
+                time.sleep(0.002)
+            send_event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            if (request.get("stream_options") or {}).get("include_usage"):
+                send_event({**base, "choices": [], "usage": usage})
+            send_event("[DONE]")
+        except (BrokenPipeError, ConnectionResetError):
+            with self.stats_lock:
+                self.stats["early_closed"] += 1 # Client stopped reading (early stop)
+        self.close_connection = True
+
+def make_server(host: str = "127.0.0.1", port: int = 8880, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                error_rate: float = 0.0, seed: int = 0) -> ThreadingHTTPServer:
+    """
+    Creates (but does not start) a mock server. `server.stats` counts requests/errors.
+    """
+    handler = type("ConfiguredMockHandler", (MockHandler,), {
+        "latency_ms": latency_ms,
+        "jitter_ms": jitter_ms,
+        "error_rate": error_rate,
+        "rng": random.Random(seed),
+        "stats": {"requests": 0, "errors": 0, "early_closed": 0},
+        "stats_lock": threading.Lock()
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.stats = handler.stats
+    return server
+
+def start_in_background(**kwargs) -> ThreadingHTTPServer:
+    """
+    Starts a mock server in a daemon thread. Returns the server (call .shutdown() to stop).
+    """
+    server = make_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def base_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible VLM server for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8880)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Mean response latency.")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="Uniform latency jitter (+/-).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    print(f"Mock VLM server listening on {base_url(server)} "
+          f"(latency {args.latency_ms}±{args.jitter_ms} ms, error rate {args.error_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,185 @@
+"""
+End-to-end benchmark against the local mock VLM server.
+
+Measures pages/sec for steps 0-3, chunks/sec for steps 4-5 and rules/sec for
+the audit loop on synthetic PDFs, and saves / checks baseline numbers.
+
+Usage:
+    python -m benchmarks.run_benchmarks --pages 20 --latency-ms 100
+    python -m benchmarks.run_benchmarks --save-baseline
+    python -m benchmarks.run_benchmarks --check          # exit 1 on regression
+
+baseline.json is not shipped: throughput depends on the machine, so record it
+once on the machine that runs --check (full environment: poppler/pdf2image
+for step 0, chromadb + the embedding model for steps 4-5 and the audit) with
+--save-baseline at the default parameters, and commit it from there.
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+import config
+from benchmarks import mock_vlm_server
+from benchmarks.synthetic_pdf import make_synthetic_pdf
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+# Throughput metrics compared against the baseline (higher is better)
+THROUGHPUT_KEYS = ("ingest_pages_per_sec", "index_chunks_per_sec", "audit_rules_per_sec")
+
+def use_sandbox(work_dir: Path, server_url: str):
+    """
+    Points every output path (including the collection registry, so the
+    benchmark neither touches nor searches the real projects) and every model
+    endpoint at the benchmark sandbox.
+    """
+    config.QWEN_BASE_URL = server_url
+    config.QWEN_API_KEY = "mock"
+    for endpoint in config.MODEL_ENDPOINTS.values():
+        endpoint.update(base_url=server_url, api_key="mock")
+    config.INPUT_PATH = work_dir / "input"
+    config.OUTPUT_PATH = work_dir / "output"
+    config.CHROMA_DB_PATH = work_dir / "chroma_db"
+    config.DENSE_INDEX_PATH = work_dir / "dense_index"
+    config.METRICS_PATH = work_dir / "metrics"
+    config.COMPILED_RULES_PATH = work_dir / "compiled_rules.json"
+    config.COLLECTION_REGISTRY_PATH = work_dir / "collections.json"
+    for path in (config.INPUT_PATH, config.OUTPUT_PATH):
+        path.mkdir(parents=True, exist_ok=True)
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def run_ingest(pdf_path: Path) -> dict:
+    from pipeline.step_0_preprocess import convert_pdf_to_images
+    from pipeline.step_1_layout_analysis import analyze_layout
+    from pipeline.step_2_targeted_extraction import run_targeted_extraction
+    from pipeline.step_3_assembly import run_assembly
+
+    image_folder, t0 = timed(convert_pdf_to_images, pdf_path)
+    layout_folder, t1 = timed(analyze_layout, image_folder)
+    extracted_folder, t2 = timed(run_targeted_extraction, image_folder, layout_folder)
+    _, t3 = timed(run_assembly, image_folder, extracted_folder)
+
+    return {"image_folder": image_folder, "seconds": {"step_0": t0, "step_1": t1, "step_2": t2, "step_3": t3}}
+
+def run_index(image_folder: Path) -> dict:
+    from pipeline.step_4_chunking import run_chunking
+    from pipeline.step_5_indexing import run_indexing
+
+    from pipeline.artifact_store import load_chunks
+
+    chunk_file, t4 = timed(run_chunking, image_folder)
+    n_chunks = len(load_chunks(chunk_file))
+    _, t5 = timed(run_indexing, chunk_file)
+
+    return {"chunks": n_chunks, "seconds": {"step_4": t4, "step_5": t5}}
+
+def run_audit_bench(n_rules: int) -> dict:
+    from pipeline.step_6_compliance import check_rules_compliance
+    from run_audit import load_rules
+
+    rules = load_rules()
+    rule_texts = [(rules[i % len(rules)].get("text", "")) for i in range(n_rules)]
+    start = time.perf_counter()
+    results = list(check_rules_compliance(rule_texts))
+    return {"rules": len(results), "seconds": time.perf_counter() - start}
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """
+    Prints throughput vs. baseline. Returns False if any metric regressed more than `tolerance`.
+    """
+    ok = True
+    print("\n--- Baseline Comparison ---")
+    for key in THROUGHPUT_KEYS:
+        current = results.get(key)
+        reference = baseline.get(key)
+        if current is None or not reference:
+            continue
+        change = current / reference - 1
+        regressed = change < -tolerance
+        ok = ok and not regressed
+        print(f"{key:<24} {current:>10.2f} vs {reference:>10.2f} ({change:+.1%}){'  REGRESSION' if regressed else ''}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark with a mock VLM server.")
+    parser.add_argument("--pages", type=int, default=10, help="Pages in the synthetic PDF.")
+    parser.add_argument("--rules", type=int, default=10, help="Rules to audit (cycled from the rules file).")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mock server latency.")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Mock server latency jitter.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Mock server HTTP 500 rate.")
+    parser.add_argument("--skip-index", action="store_true", help="Skip steps 4-5 and the audit (no embedding model needed).")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Save the results to {BASELINE_PATH.name}.")
+    parser.add_argument("--check", action="store_true", help="Compare with the baseline; exit 1 on regression.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed throughput drop for --check.")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    server = mock_vlm_server.start_in_background(
+        port=0, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate
+    )
+    work_dir = Path(tempfile.mkdtemp(prefix="ocr_bench_"))
+    use_sandbox(work_dir, mock_vlm_server.base_url(server))
+    print(f"Benchmark sandbox: {work_dir} (mock server {config.QWEN_BASE_URL})")
+
+    pdf_path = make_synthetic_pdf(config.INPUT_PATH / "synthetic.pdf", pages=args.pages)
+
+    results = {
+        "params": {
+            "pages": args.pages,
+            "rules": args.rules,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "error_rate": args.error_rate
+        }
+    }
+
+    ingest = run_ingest(pdf_path)
+    ingest_seconds = sum(ingest["seconds"].values())
+    results["ingest_seconds"] = ingest["seconds"]
+    results["ingest_pages_per_sec"] = args.pages / ingest_seconds
+
+    if not args.skip_index:
+        index = run_index(ingest["image_folder"])
+        index_seconds = sum(index["seconds"].values())
+        results["index_seconds"] = index["seconds"]
+        results["index_chunks_per_sec"] = index["chunks"] / index_seconds if index["chunks"] else 0.0
+
+        audit = run_audit_bench(args.rules)
+        results["audit_seconds"] = audit["seconds"]
+        results["audit_rules_per_sec"] = audit["rules"] / audit["seconds"]
+
+    results["mock_server"] = dict(server.stats)
+    server.shutdown()
+
+    print("\n--- Benchmark Results ---")
+    for key in THROUGHPUT_KEYS:
+        if key in results:
+            print(f"{key:<24} {results[key]:>10.2f}")
+    print(f"Mock server: {results['mock_server']}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Baseline saved to: {args.baseline}")
+
+    if args.check:
+        if not args.baseline.exists():
+            print(f"No baseline at {args.baseline}. Record one on this machine with --save-baseline "
+                  f"(same parameters) and commit it, then re-run --check.")
+            return 1
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("params") != results["params"]:
+            print(f"Warning: baseline was recorded with different parameters: {baseline.get('params')}")
+        return 0 if compare(results, baseline, args.tolerance) else 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
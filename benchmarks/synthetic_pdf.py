@@ -0,0 +1,74 @@
+"""
+Synthetic multi-page PDFs for benchmarks: A4 sheets with a frame, title block,
+header, text lines and alternating table / drawing content (every third page is
+text only, like explanatory note sections).
+"""
+import random
+from pathlib import Path
+from PIL import Image, ImageDraw
+
+PAGE_SIZE = (1240, 1754) # A4 at 150 DPI
+
+def draw_page(page_number: int, rng: random.Random) -> Image.Image:
+    width, height = PAGE_SIZE
+    image = Image.new("RGB", PAGE_SIZE, "white")
+    draw = ImageDraw.Draw(image)
+
+    # Frame (GOST-style margins)
+    draw.rectangle([118, 30, width - 30, height - 30], outline="black", width=3)
+
+    # Header
+    draw.text((160, 70), f"SECTION {page_number}. EXPLANATORY NOTE", fill="black")
+
+    # Text lines
+    y = 130
+    for _ in range(rng.randint(8, 20)):
+        words = " ".join(rng.choice(["design", "concrete", "B25", "contract", "No.", "15/24", "building", "load"])
+                         for _ in range(rng.randint(6, 12)))
+        draw.text((160, y), words, fill="black")
+        y += 22
+
+    # Text only, table or drawing
+    top = 600
+    if page_number % 3 == 0:
+        for _ in range(rng.randint(20, 40)):
+            words = " ".join(rng.choice(["design", "concrete", "B25", "contract", "No.", "15/24", "building", "load"])
+                             for _ in range(rng.randint(6, 12)))
+            draw.text((160, y), words, fill="black")
+            y += 22
+    elif page_number % 2:
+        rows, cols = rng.randint(5, 15), 4
+        cell_w, cell_h = (width - 320) // cols, 30
+        for r in range(rows + 1):
+            draw.line([160, top + r * cell_h, 160 + cols * cell_w, top + r * cell_h], fill="black", width=2)
+        for c in range(cols + 1):
+            draw.line([160 + c * cell_w, top, 160 + c * cell_w, top + rows * cell_h], fill="black", width=2)
+        for r in range(rows):
+            for c in range(cols):
+                draw.text((170 + c * cell_w, top + 8 + r * cell_h), f"{r + 1}.{c + 1}", fill="black")
+    else:
+        for _ in range(rng.randint(20, 60)):
+            x1, y1 = rng.randint(160, width - 200), rng.randint(top, top + 700)
+            draw.line([x1, y1, x1 + rng.randint(-200, 200), y1 + rng.randint(-200, 200)], fill="black", width=2)
+        draw.text((200, top + 720), "3600", fill="black")
+
+    # Title block
+    tb = [width - 730, height - 230, width - 30, height - 30]
+    draw.rectangle(tb, outline="black", width=3)
+    for k in range(1, 5):
+        draw.line([tb[0], tb[1] + k * 40, tb[2], tb[1] + k * 40], fill="black", width=1)
+    draw.text((tb[0] + 20, tb[1] + 10), "123-2024-PZ", fill="black")
+    draw.text((tb[0] + 20, tb[1] + 130), f"Sheet {page_number}", fill="black")
+
+    return image
+
+def make_synthetic_pdf(path: Path, pages: int = 10, seed: int = 0) -> Path:
+    """
+    Writes a synthetic multi-page PDF and returns its path.
+    """
+    rng = random.Random(seed)
+    images = [draw_page(i + 1, rng) for i in range(pages)]
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    images[0].save(path, "PDF", resolution=150, save_all=True, append_images=images[1:])
+    return path
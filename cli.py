@@ -0,0 +1,188 @@
+"""
+Unified command line interface.
+
+    python cli.py ingest [PDF]          # Steps 0-3
+    python cli.py index [DOCUMENT]      # Steps 4-5
+    python cli.py run [PDF]             # Steps 0-5 (same as main.py)
+    python cli.py query "TEXT"          # Search the vector store
+    python cli.py query "ось Б"         # Drawing side index (ось / размер / отметка / разрез X)
+    python cli.py audit                 # Compliance audit (run_audit.py)
+    python cli.py compile-rules         # Precompile rule query plans
+    python cli.py export [DOCUMENT]     # artifacts.sqlite -> folder layout
+    python cli.py collections           # Indexed collections per project
+
+index / run / query / audit accept --project (default: config.DEFAULT_PROJECT).
+ingest / run / audit accept --plan: print the expected requests, cache hits and
+wall time without calling any model.
+
+Subcommand modules are imported inside the handlers, so `--help` and argument
+errors never load torch / chromadb / openai.
+"""
+import argparse
+import sys
+from pathlib import Path
+import config
+
+def resolve_pdf(pdf_arg: str):
+    if pdf_arg:
+        pdf_file = Path(pdf_arg)
+        if not pdf_file.exists():
+            pdf_file = config.INPUT_PATH / pdf_arg
+        return pdf_file
+
+    from main import find_input_pdf
+    return find_input_pdf()
+
+def resolve_document_folder(doc_arg: str) -> Path:
+    """
+    Accepts a document name (PDF stem), a PDF path or an image folder path.
+    """
+    if doc_arg:
+        path = Path(doc_arg)
+        if path.is_dir():
+            return path
+        return config.OUTPUT_PATH / path.stem
+
+    from main import find_input_pdf
+    pdf_file = find_input_pdf()
+    return config.OUTPUT_PATH / pdf_file.stem if pdf_file else None
+
+def cmd_ingest(args):
+    import metrics
+    from main import run_ingest, plan_run
+
+    pdf_file = resolve_pdf(args.pdf)
+    if pdf_file is None:
+        return 1
+    if args.plan:
+        plan_run(pdf_file, args.concurrency)
+        return 0
+    run_ingest(pdf_file)
+    metrics.write_run_summary()
+    return 0
+
+def cmd_index(args):
+    import metrics
+    from main import run_index
+
+    image_folder = resolve_document_folder(args.document)
+    if image_folder is None or not image_folder.exists():
+        print(f"Document folder not found: {image_folder}. Run 'ingest' first.")
+        return 1
+    run_index(image_folder, args.project)
+    metrics.write_run_summary()
+    return 0
+
+def cmd_run(args):
+    import metrics
+    from main import run_ingest, run_index, plan_run
+
+    pdf_file = resolve_pdf(args.pdf)
+    if pdf_file is None:
+        return 1
+    if args.plan:
+        plan_run(pdf_file, args.concurrency)
+        return 0
+    run_index(run_ingest(pdf_file), args.project)
+    metrics.write_run_summary()
+    print("\nPipeline finished.")
+    return 0
+
+def cmd_query(args):
+    from query_rag import query_database
+
+    query_database(args.text, n_results=args.n_results, project=args.project, collections=args.collection)
+    return 0
+
+def cmd_audit(args):
+    import run_audit
+
+    run_audit.main(project=args.project, plan=args.plan)
+    return 0
+
+def cmd_compile_rules(args):
+    from compile_rules import compile_rules
+
+    return 1 if compile_rules(force=args.force) else 0
+
+def cmd_export(args):
+    from pipeline.artifact_store import export_to_folder
+
+    image_folder = resolve_document_folder(args.document)
+    if image_folder is None:
+        return 1
+    try:
+        export_to_folder(image_folder)
+    except FileNotFoundError as e:
+        print(e)
+        return 1
+    return 0
+
+def cmd_collections(args):
+    from pipeline.collection_registry import list_collections
+
+    collections = list_collections(args.project)
+    if not collections:
+        print("No indexed collections.")
+        return 0
+    for name, entry in sorted(collections.items(), key=lambda item: (item[1].get("project", ""), item[1].get("document", ""))):
+        print(f"{entry.get('project'):<20} {entry.get('document'):<40} {entry.get('chunks', 0):>6} chunks  {name}")
+    return 0
+
+def add_plan_arguments(p: argparse.ArgumentParser):
+    p.add_argument("--plan", action="store_true", help="Only print the expected requests and wall time (no model calls).")
+    p.add_argument("--concurrency", type=int, help=f"Extraction concurrency for the plan (default: {config.EXTRACTION_CONCURRENCY}).")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="Construction documentation OCR / RAG / compliance pipeline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("ingest", help="Steps 0-3: PDF -> layout -> extraction -> assembled pages.")
+    p.add_argument("pdf", nargs="?", help="PDF path or file name in data/input (default: first PDF found).")
+    add_plan_arguments(p)
+    p.set_defaults(handler=cmd_ingest)
+
+    p = subparsers.add_parser("index", help="Steps 4-5: chunk and index an ingested document.")
+    p.add_argument("document", nargs="?", help="Document name, PDF path or output folder (default: first PDF's folder).")
+    p.add_argument("--project", help="Project the document belongs to.")
+    p.set_defaults(handler=cmd_index)
+
+    p = subparsers.add_parser("run", help="Steps 0-5 (full pipeline).")
+    p.add_argument("pdf", nargs="?", help="PDF path or file name in data/input (default: first PDF found).")
+    p.add_argument("--project", help="Project the document belongs to.")
+    add_plan_arguments(p)
+    p.set_defaults(handler=cmd_run)
+
+    p = subparsers.add_parser("query", help="Search the vector store.")
+    p.add_argument("text", help="The question to ask (\"ось Б\", \"размер 3600\", \"отметка +3.300\", \"разрез 1-1\": drawing lookup first).")
+    p.add_argument("-n", "--n-results", type=int, default=3, help="Number of results.")
+    p.add_argument("--project", help="Project to search.")
+    p.add_argument("--collection", action="append", help="Search only this collection (repeatable).")
+    p.set_defaults(handler=cmd_query)
+
+    p = subparsers.add_parser("audit", help="Check all rules from the rules file.")
+    p.add_argument("--project", help="Project to audit (only its collections are searched).")
+    p.add_argument("--plan", action="store_true", help="Only print the expected requests and wall time (no model calls).")
+    p.set_defaults(handler=cmd_audit)
+
+    p = subparsers.add_parser("compile-rules", help="Precompile search queries and embeddings for the rules.")
+    p.add_argument("--force", action="store_true", help="Regenerate queries even if a plan already exists.")
+    p.set_defaults(handler=cmd_compile_rules)
+
+    p = subparsers.add_parser("collections", help="List indexed collections.")
+    p.add_argument("--project", help="Only this project.")
+    p.set_defaults(handler=cmd_collections)
+
+    p = subparsers.add_parser("export", help="Export a document's artifacts.sqlite to the folder layout.")
+    p.add_argument("document", nargs="?", help="Document name, PDF path or output folder (default: first PDF's folder).")
+    p.set_defaults(handler=cmd_export)
+
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    config.ensure_dirs()
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
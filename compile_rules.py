@@ -0,0 +1,73 @@
+from pipeline.step_6_compliance import generate_queries
+from pipeline import rule_plans
+from run_audit import load_rules, RULES_PATH
+import config
+import metrics
+import argparse
+import sys
+
+def compile_rules(force: bool = False):
+    """
+    Generates search queries for every rule once and stores them together with
+    their embeddings, so audits can skip the GENERATOR_PROMPT call.
+    Rules whose query generation failed are not saved. Returns their number.
+    """
+    rules = load_rules()
+    if not rules:
+        return 0
+
+    from pipeline.embeddings import get_embedding_function
+
+    artifact = rule_plans.load_artifact()
+    plans = artifact["plans"]
+    embedding_fn = get_embedding_function()
+
+    compiled = 0
+    skipped = 0
+    failed = 0
+    print(f"Compiling query plans for {len(rules)} rules from {RULES_PATH}...")
+
+    for i, rule_obj in enumerate(rules):
+        rule_text = rule_obj.get("text", "")
+        rule_id = rule_obj.get("id", str(i+1))
+        if not rule_text:
+            continue
+
+        key = rule_plans.plan_key(rule_text, rule_plans.generator_model())
+        existing = plans.get(key)
+        if existing and not force and existing.get("embedding_model") == config.EMBEDDING_MODEL_NAME:
+            skipped += 1
+            continue
+
+        print(f"--- Rule {rule_id} ---")
+        if existing and not force:
+            # Only the embedding model changed - keep the generated queries
+            queries = existing["queries"]
+        else:
+            with metrics.tags(rule_id=rule_id):
+                queries, _, generated = generate_queries(rule_text)
+            if not generated:
+                # The rule-text fallback is not a plan: leave the rule for the next run
+                print(f"  Rule {rule_id} not compiled (query generation failed).")
+                failed += 1
+                continue
+        embeddings = embedding_fn(queries)
+
+        plans[key] = rule_plans.make_plan(rule_id, rule_text, queries, embeddings)
+        compiled += 1
+
+        # Save after every rule so an interrupted run keeps its progress
+        rule_plans.save_artifact(artifact)
+
+    print(f"\nCompiled {compiled} rules ({skipped} already up to date"
+          f"{f', {failed} failed - re-run to retry' if failed else ''}).")
+    print(f"Saved to: {config.COMPILED_RULES_PATH}")
+    metrics.write_run_summary()
+    return failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompile search queries and embeddings for the audit rules.")
+    parser.add_argument("--force", action="store_true", help="Regenerate queries even if a plan already exists.")
+    args = parser.parse_args()
+
+    sys.exit(1 if compile_rules(force=args.force) else 0)
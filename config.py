@@ -10,25 +10,158 @@ DATA_PATH = ROOT_PATH / "data"
 INPUT_PATH = DATA_PATH / "input"
 OUTPUT_PATH = DATA_PATH / "output"
 
-#  Create directories if they don't exist
-INPUT_PATH.mkdir(parents=True, exist_ok=True)
-OUTPUT_PATH.mkdir(parents=True, exist_ok=True)
+
+def ensure_dirs():
+    """
+    Creates the input/output directories if they don't exist.
+    Called by the entry points (not at import time, to keep startup cheap).
+    """
+    INPUT_PATH.mkdir(parents=True, exist_ok=True)
+    OUTPUT_PATH.mkdir(parents=True, exist_ok=True)
 
 
 # --- PDF Preprocessing Settings ---
 IMAGE_FORMAT = "png"  # Format for saved images (e.g., png, jpeg)
 IMAGE_DPI = 300       # Dots per inch for rendering PDF pages
 
+# Native text layer (CAD/Word exports): blocks well covered by the PDF's own
+# words (poppler pdftotext -bbox-layout) skip the VLM OCR call.
+TEXT_LAYER_ENABLED = True
+TEXT_LAYER_BLOCK_TYPES = ("text_block", "header")
+TEXT_LAYER_MIN_COVERAGE = 0.9  # Share of the block's ink that must lie inside native word boxes
+
+
+# --- Artifact Storage ---
+# Where per-page stage results (layout, extraction, assembled pages, chunks, crops) are kept:
+# "folder" - one JSON/PNG file per page and stage (layout/, extracted/, final_json/, chunks/)
+# "sqlite" - one artifacts.sqlite per document (export back with: python cli.py export DOCUMENT)
+ARTIFACT_BACKEND = "folder"
+
+
+# --- Page Routing (Steps 1-2) ---
+# Pages without ruling lines, dense ink or a native text layer (plain text sections)
+# get one combined "layout + content" call instead of a layout call plus one call
+# per block. Tables/drawings found on such pages still go through targeted extraction.
+SINGLE_PASS_ROUTING = True
+SINGLE_PASS_MAX_LINES = 2    # Max ruling lines (per direction) of a single-pass page
+SINGLE_PASS_MAX_INK = 0.12   # Max ink share of a single-pass page
+
+
+# --- Block Reuse Settings (Step 2) ---
+# Near-identical crops (perceptual hash) reuse an earlier extraction instead of a new VLM call.
+# Title blocks with small differences only re-extract the changed regions.
+PHASH_REUSE_ENABLED = True
+PHASH_REUSE_TYPES = ("title_block", "text_block", "header", "table")
+PHASH_EXACT_TYPES = ("table", "text_block") # Reused only if pixel-identical at native resolution
+PHASH_MAX_DISTANCE = 6      # Max Hamming distance of 64-bit dHashes
+PHASH_MAX_DIFF_AREA = 0.25  # Max changed area of a title block for partial re-extraction
+
+
+# --- Multi-Crop Batching (Step 2) ---
+# Small text_block/header crops of a page are sent together in one multi-image request.
+BATCH_SMALL_BLOCKS = True
+BATCH_SMALL_BLOCK_MAX_AREA = 0.05  # Max share of the page area for a "small" block
+BATCH_MAX_BLOCKS = 6               # Max crops per request
+
+
+# --- Image Preprocessing (Steps 1-2) ---
+# Per call class (block type, else stage): trim white margins, color mode
+# ("RGB", "L" grayscale, "auto" = binarized if clean, else grayscale), longest
+# side for normal / dense content and JPEG quality. Classes without a profile
+# (layout and single-pass pages) use the baseline: longest side 2000 px, RGB, q85.
+# Drawings are not trimmed: their OCR boxes are relative to the crop.
+IMAGE_PREP_ENABLED = True
+IMAGE_PROFILES = {
+    "title_block": {"trim": True, "mode": "auto", "max_side": 1024, "dense_max_side": 1400, "quality": 80},
+    "title_block_region": {"trim": True, "mode": "auto", "max_side": 768, "dense_max_side": 1024, "quality": 80},
+    "header": {"trim": True, "mode": "auto", "max_side": 1024, "dense_max_side": 1400, "quality": 80},
+    "text_block": {"trim": True, "mode": "auto", "max_side": 1400, "dense_max_side": 1800, "quality": 80},
+    "text_batch": {"trim": True, "mode": "auto", "max_side": 1400, "dense_max_side": 1800, "quality": 80},
+    "table": {"trim": True, "mode": "L", "max_side": 2000, "dense_max_side": 2800, "quality": 90},
+    "drawing": {"trim": False, "mode": "RGB", "max_side": 2000, "dense_max_side": 2000, "quality": 85}
+}
+IMAGE_DENSE_INK = 0.08          # Ink share above which content is "dense" (dense_max_side)
+IMAGE_BINARIZE_MAX_GRAY = 0.03  # Max share of mid-gray pixels for binarization (clean vector exports)
+
+
+# --- Tail Latency Control (Steps 1-2) ---
+# Pages are extracted concurrently, the most expensive (drawings, big tables) first.
+EXTRACTION_CONCURRENCY = 4
+
+# Per-call timeout ceilings (seconds) by block type / stage. With ADAPTIVE_TIMEOUTS the
+# timeout is tightened to TIMEOUT_P99_FACTOR x the observed p99 latency of that class.
+VLM_TIMEOUTS = {
+    "layout": 120.0,
+    "single_pass": 180.0,
+    "title_block": 60.0,
+    "title_block_region": 30.0,
+    "header": 30.0,
+    "text_block": 60.0,
+    "text_batch": 90.0,
+    "table": 180.0,
+    "drawing": 180.0
+}
+VLM_DEFAULT_TIMEOUT = 180.0
+ADAPTIVE_TIMEOUTS = True
+TIMEOUT_P99_FACTOR = 3.0
+VLM_MIN_TIMEOUT = 15.0
+LATENCY_MIN_SAMPLES = 20  # Calls of a class needed before its latency percentiles are used
+
+# Hedged requests: a call slower than the observed p95 of its class gets a duplicate,
+# the first answer wins (costs a few percent extra calls, cuts the latency tail).
+HEDGE_REQUESTS = False
+HEDGE_PERCENTILE = 95
+HEDGE_POOL_WORKERS = 32  # Shared pool running hedged calls (2 threads per call in flight)
+
 
 # --- Chunking Settings ---
 TARGET_CHUNK_SIZE = 1000  # Target characters per text chunk
 MIN_CHUNK_SIZE = 50       # Minimum characters to be considered a valid chunk
+TABLE_CHUNK_TOKENS = 400  # Token budget of a table row group (large tables are split, header repeated)
 
 
 # --- Vector Store Settings ---
 EMBEDDING_MODEL_NAME = "deepvk/USER-bge-m3"
 CHROMA_DB_PATH = DATA_PATH / "chroma_db"
-COLLECTION_NAME = "project_docs"
+# One collection per indexed document, grouped by project (registry: name -> project/document).
+# Audits and queries search the collections of one project, fanned out in parallel.
+COLLECTION_REGISTRY_PATH = DATA_PATH / "collections.json"
+DEFAULT_PROJECT = "default"     # Project used when none is given (--project)
+RETRIEVAL_FANOUT_WORKERS = 8  # Collections searched in parallel
+
+# Dense embedding matrix exported next to the Chroma index (memory-mapped .npy + chunk-ID sidecar)
+DENSE_INDEX_PATH = DATA_PATH / "dense_index"
+DENSE_INDEX_DTYPE = "float32"  # "float32" or "float16" (half the size, slightly lower precision)
+RETRIEVAL_BACKEND = "chroma"   # "chroma" (per-query collection.query) or "numpy" (one batched matmul per audit)
+
+# P87 section index (built in step 3 from title block codes / sheet names / headers).
+# Rules of sections missing from the project are resolved as "НЕ НАЙДЕНО" without
+# LLM calls; retrieval for present sections is limited to the section's pages.
+SECTION_INDEX_ENABLED = True
+
+
+# --- Compliance Reranking Settings ---
+# Optional cross-encoder stage: retrieve a wide candidate pool and keep only
+# the best matches for the validator prompt.
+RERANK_ENABLED = False
+RERANK_MODEL_NAME = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # Small multilingual cross-encoder
+RERANK_DEVICE = "cpu"
+RERANK_BATCH_SIZE = 16
+RERANK_CANDIDATES_PER_QUERY = 10  # Hits per generated query before reranking (3 queries -> ~30 candidates)
+RERANK_TOP_K = 6                  # Candidates passed to the validator after reranking
+
+
+# --- LLM Streaming Settings ---
+# Stream compliance-agent completions and close the stream as soon as the
+# expected JSON value is complete (skips the prose models add afterwards).
+LLM_STREAM_JSON = True
+
+
+# --- Compiled Rule Plans ---
+# Output of the compile rules command: generated queries + their embeddings per rule.
+RULES_PATH = DATA_PATH / "rules_p87.json"
+COMPILED_RULES_PATH = DATA_PATH / "compiled_rules.json"
+USE_COMPILED_RULES = True
 
 # --- API Settings ---
 load_dotenv()  # Load environment variables from .env file
@@ -51,3 +184,56 @@ _model_name = os.getenv("QWEN_MODEL_NAME", "qwen-vl-max").strip()
 if _model_name.startswith('"') and _model_name.endswith('"'):
     _model_name = _model_name[1:-1]
 QWEN_MODEL_NAME = _model_name
+
+# Retries for model calls (counted in the metrics; the OpenAI client's own retries are disabled)
+LLM_MAX_RETRIES = 2
+LLM_RETRY_BACKOFF = 1.0  # Seconds, doubled after every retry
+
+
+# --- Model Routing ---
+# Endpoints: name -> base URL, API key and the max number of requests in flight.
+# Every endpoint has its own client (connection pool) and concurrency limit, so
+# cheap blocks on a small model don't queue behind tables and drawings.
+MODEL_ENDPOINTS = {
+    "main": {"base_url": QWEN_BASE_URL, "api_key": QWEN_API_KEY, "max_concurrency": 8},
+}
+# Call class -> endpoint + model. A call is routed by its block type first
+# (title_block, title_block_region, text_block, header, text_batch, table, drawing),
+# then by its stage (layout, single_pass, extraction, query_generation, validation),
+# then "default".
+MODEL_ROUTES = {
+    "default": {"endpoint": "main", "model": QWEN_MODEL_NAME},
+}
+
+# Optional small/fast VL model for plain text OCR and stamp reading
+# (QWEN_SMALL_BASE_URL / QWEN_SMALL_API_KEY default to the main endpoint)
+QWEN_SMALL_MODEL_NAME = os.getenv("QWEN_SMALL_MODEL_NAME", "").strip().strip("\"'")
+if QWEN_SMALL_MODEL_NAME:
+    MODEL_ENDPOINTS["small"] = {
+        "base_url": os.getenv("QWEN_SMALL_BASE_URL", QWEN_BASE_URL).strip().strip("\"'"),
+        "api_key": os.getenv("QWEN_SMALL_API_KEY", QWEN_API_KEY).strip(),
+        "max_concurrency": 16
+    }
+    for _block_type in ("text_block", "header", "text_batch", "title_block", "title_block_region"):
+        MODEL_ROUTES[_block_type] = {"endpoint": "small", "model": QWEN_SMALL_MODEL_NAME}
+
+
+# --- Structured Output ---
+# Constrained decoding of the JSON answers (layout, title block, drawing, search
+# queries, verdict): "json_schema" (response_format), "guided_json" (vLLM
+# extra_body) or None (prompt only). Off by default: not every OpenAI-compatible
+# server accepts these fields, so opt in per deployment (STRUCTURED_OUTPUT in .env).
+# Answers are always validated against schemas.py; an invalid answer re-asks
+# only that block / page / rule call.
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "").strip().strip("\"'") or None
+STRUCTURED_MAX_REASKS = 1
+
+
+# --- Metrics Settings ---
+# Every model call is recorded (tokens, image pixels, latency, retries) tagged by
+# stage / block type / page / rule ID. Per run: calls_<run>.jsonl, summary_<run>.json
+# and a Prometheus textfile (model_calls.prom).
+METRICS_PATH = OUTPUT_PATH / "metrics"
+LOG_MODEL_RESPONSES = os.getenv("LOG_MODEL_RESPONSES", "0") == "1" # Raw VL answers in calls_<run>.jsonl (debugging)
+COST_PER_1K_PROMPT_TOKENS = float(os.getenv("COST_PER_1K_PROMPT_TOKENS", "0"))
+COST_PER_1K_COMPLETION_TOKENS = float(os.getenv("COST_PER_1K_COMPLETION_TOKENS", "0"))
@@ -0,0 +1,115 @@
+import math
+from PIL import Image
+import config
+
+# Adaptive preprocessing of the images sent to the VLM. Qwen-VL bills an image
+# by its 28x28 pixel patches, so trimming white margins and sending every block
+# type only at the resolution its content needs cuts image tokens directly.
+# Profiles per call class are in config.IMAGE_PROFILES; classes without one
+# (layout / single-pass pages, whose boxes are page-relative) keep the baseline.
+
+PATCH_SIZE = 28         # Qwen-VL: one image token per 28x28 patch
+BASELINE_MAX_SIDE = 2000
+BASELINE_QUALITY = 85
+INK_LEVEL = 160         # Grayscale below this counts as ink (shared by every ink analysis)
+TRIM_PADDING = 8        # Pixels of white kept around the ink
+MID_GRAY = (64, 192)    # Gray levels of anti-aliased / scanned edges
+
+def image_tokens(width: int, height: int) -> int:
+    """
+    Image tokens of a width x height image (one per started 28x28 patch).
+    """
+    return math.ceil(width / PATCH_SIZE) * math.ceil(height / PATCH_SIZE)
+
+def profile_for(tags: dict):
+    """
+    Preprocessing profile of a call (block type, else stage), or None for the baseline.
+    """
+    if not config.IMAGE_PREP_ENABLED:
+        return None
+    for key in (tags.get("block_type"), tags.get("stage")):
+        if key in config.IMAGE_PROFILES:
+            return config.IMAGE_PROFILES[key]
+    return None
+
+def baseline_size(size: tuple) -> tuple:
+    """
+    Size the baseline encoding sends (longest side capped at 2000 px).
+    """
+    width, height = size
+    scale = min(1.0, BASELINE_MAX_SIDE / max(width, height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def planned_size(size: tuple, profile: dict = None) -> tuple:
+    """
+    Size a width x height image is sent at, without looking at its pixels
+    (no margin trim, normal density): an upper bound for the run planner.
+    """
+    if profile is None:
+        return baseline_size(size)
+    width, height = size
+    scale = min(1.0, profile["max_side"] / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def ink_mask(image: Image.Image) -> Image.Image:
+    """
+    Ink pixels of an image (255 = ink, grayscale below INK_LEVEL).
+    Also used by page routing, the text layer check and block reuse.
+    """
+    return image.convert("L").point(lambda p: 255 if p < INK_LEVEL else 0)
+
+def trim_margins(image: Image.Image, padding: int = TRIM_PADDING) -> Image.Image:
+    """
+    Crops white margins around the ink (keeps `padding` pixels).
+    """
+    bbox = ink_mask(image).getbbox()
+    if bbox is None:
+        return image
+    left, top, right, bottom = bbox
+    return image.crop((
+        max(0, left - padding), max(0, top - padding),
+        min(image.width, right + padding), min(image.height, bottom + padding)
+    ))
+
+def gray_stats(gray: Image.Image) -> tuple:
+    """
+    (ink share, mid-gray share) of a grayscale image.
+    """
+    histogram = gray.histogram()
+    total = max(1, gray.width * gray.height)
+    ink = sum(histogram[:INK_LEVEL]) / total
+    mid = sum(histogram[MID_GRAY[0]:MID_GRAY[1]]) / total
+    return ink, mid
+
+def prepare_image(image: Image.Image, profile: dict = None) -> tuple:
+    """
+    Applies a preprocessing profile: margin trim, color mode, resolution from
+    the content density, encoding.
+
+    Returns:
+        tuple: (image, format, quality) - format "JPEG" or "PNG" (binarized images).
+    """
+    if profile is None:
+        image = image.copy()
+        image.thumbnail((BASELINE_MAX_SIDE, BASELINE_MAX_SIDE))
+        return image.convert("RGB"), "JPEG", BASELINE_QUALITY
+
+    if profile.get("trim"):
+        image = trim_margins(image)
+
+    gray = image.convert("L")
+    ink, mid = gray_stats(gray)
+    max_side = profile["dense_max_side"] if ink > config.IMAGE_DENSE_INK else profile["max_side"]
+    scale = min(1.0, max_side / max(image.size))
+
+    mode = profile.get("mode", "RGB")
+    if mode == "auto":
+        # Binarize only clean, unscaled content: downscaled thin strokes turn gray and would vanish
+        mode = "1" if scale == 1.0 and mid <= config.IMAGE_BINARIZE_MAX_GRAY else "L"
+    if mode == "1":
+        return gray.point(lambda p: 255 if p >= INK_LEVEL else 0).convert("1"), "PNG", None
+
+    image = gray if mode == "L" else image.convert("RGB")
+    if scale < 1.0:
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS)
+    return image, "JPEG", profile.get("quality", BASELINE_QUALITY)
@@ -1,28 +1,32 @@
+import argparse
 import config
-from pipeline.step_0_preprocess import convert_pdf_to_images
-from pipeline.step_1_layout_analysis import analyze_layout
-from pipeline.step_2_targeted_extraction import run_targeted_extraction
-from pipeline.step_3_assembly import run_assembly
-from pipeline.step_4_chunking import run_chunking
-from pipeline.step_5_indexing import run_indexing
+import metrics
 
-def main():
+def find_input_pdf():
     """
-    Main function to run the entire OCR pipeline.
+    Returns the first PDF file in the input directory (or None).
     """
-    print("Starting OCR pipeline...")
-
-    # --- Step 0: Pre-processing (PDF -> Images) ---
-    # Find the first PDF file in the input directory
     try:
         pdf_file = next(config.INPUT_PATH.glob("*.pdf"))
         print(f"Found PDF file: {pdf_file.name}")
+        return pdf_file
     except StopIteration:
         print(f"No PDF files found in {config.INPUT_PATH}")
         print("Please add a PDF file to the input directory and run again.")
-        return
+        return None
 
-    # Convert the PDF to images
+def run_ingest(pdf_file):
+    """
+    Steps 0-3: PDF -> page images -> layout -> targeted extraction -> assembled page JSONs.
+    Returns the document's image folder.
+    """
+    # Imported here so that index/query/audit commands don't load the ingest stack
+    from pipeline.step_0_preprocess import convert_pdf_to_images
+    from pipeline.step_1_layout_analysis import analyze_layout
+    from pipeline.step_2_targeted_extraction import run_targeted_extraction
+    from pipeline.step_3_assembly import run_assembly
+
+    # --- Step 0: Pre-processing (PDF -> Images) ---
     image_folder = convert_pdf_to_images(pdf_file)
     
     # --- Step 1: Layout Analysis ---
@@ -32,19 +36,59 @@ def main():
     extracted_folder = run_targeted_extraction(image_folder, layout_folder)
 
     # --- Step 3: Assembly ---
-    final_json_folder = run_assembly(image_folder, extracted_folder)
+    run_assembly(image_folder, extracted_folder)
+
+    return image_folder
+
+def run_index(image_folder, project=None):
+    """
+    Steps 4-5: chunking and vector indexing of an ingested document
+    (into its own collection of `project`, default config.DEFAULT_PROJECT).
+    """
+    from pipeline.step_4_chunking import run_chunking
+    from pipeline.step_5_indexing import run_indexing
 
     # --- Step 4: Chunking ---
     chunk_file = run_chunking(image_folder)
+    if chunk_file is None:
+        return
 
     # --- Step 5: Indexing ---
-    run_indexing(chunk_file)
+    run_indexing(chunk_file, project)
 
-    print("\nPipeline finished.")
+def plan_run(pdf_file, concurrency=None):
+    """
+    --plan: expected requests, cache hits and wall time of steps 0-5, without model calls.
+    """
+    import planner
+    planner.print_plan(planner.plan_ingest([pdf_file]), concurrency)
 
+def main(plan: bool = False, concurrency: int = None):
+    """
+    Main function to run the entire OCR pipeline.
+    """
+    print("Starting OCR pipeline...")
+    config.ensure_dirs()
 
-if __name__ == "__main__":
-    main()
+    # Find the first PDF file in the input directory
+    pdf_file = find_input_pdf()
+    if pdf_file is None:
+        return
 
+    if plan:
+        plan_run(pdf_file, concurrency)
+        return
 
+    image_folder = run_ingest(pdf_file)
+    run_index(image_folder)
 
+    metrics.write_run_summary()
+    print("\nPipeline finished.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the OCR pipeline (steps 0-5) on the first PDF in the input folder.")
+    parser.add_argument("--plan", action="store_true", help="Only print the expected requests and wall time (no model calls).")
+    parser.add_argument("--concurrency", type=int, help=f"Extraction concurrency for the plan (default: {config.EXTRACTION_CONCURRENCY}).")
+    args = parser.parse_args()
+    main(plan=args.plan, concurrency=args.concurrency)
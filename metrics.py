@@ -0,0 +1,272 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+import config
+
+# Tags (stage, block_type, page, rule_id) attached to every model call recorded
+# inside a `with metrics.tags(...)` block.
+_tags = ContextVar("metrics_tags", default={})
+
+RUN_ID = datetime.now().strftime("%Y%m%d_%H%M%S") + f"_{os.getpid()}"
+
+_records = []
+_lock = threading.Lock()
+
+# Recent successful latencies per call class (block type, else stage), used for
+# adaptive timeouts and request hedging
+LATENCY_WINDOW = 200
+_latencies = {}
+
+@contextmanager
+def tags(**kwargs):
+    """
+    Adds tags to all model calls made inside the block. Nested blocks merge tags.
+    """
+    token = _tags.set({**_tags.get(), **kwargs})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+def current_tags() -> dict:
+    return dict(_tags.get())
+
+def calls_file() -> Path:
+    return Path(config.METRICS_PATH) / f"calls_{RUN_ID}.jsonl"
+
+def record_call(kind: str, model: str, latency_s: float, prompt_tokens: int = None,
+                completion_tokens: int = None, image_pixels: int = 0, retries: int = 0,
+                status: str = "ok", **extra):
+    """
+    Records one model call and appends it to the run's JSONL metrics file.
+    """
+    record = {
+        "ts": round(time.time(), 3),
+        "run_id": RUN_ID,
+        "kind": kind, # "vl", "text", "text_stream"
+        "model": model,
+        "stage": None,
+        "block_type": None,
+        "page": None,
+        "rule_id": None,
+        **current_tags(),
+        "latency_s": round(latency_s, 4),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "image_pixels": image_pixels,
+        "retries": retries,
+        "status": status,
+        **extra
+    }
+
+    with _lock:
+        _records.append(record)
+        if status == "ok" and not extra.get("hedge_lost"):
+            _latencies.setdefault(latency_key(record), deque(maxlen=LATENCY_WINDOW)).append(latency_s)
+        path = calls_file()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    return record
+
+def latency_key(record: dict) -> str:
+    return record.get("block_type") or record.get("stage") or record.get("kind")
+
+def recorded_latencies(path: Path = None) -> dict:
+    """
+    Latencies of the successful calls recorded by earlier runs (all calls_*.jsonl
+    files), per call class (latency_key). Used by the run planner.
+    """
+    latencies = {}
+    for calls_path in sorted(Path(path or config.METRICS_PATH).glob("calls_*.jsonl")):
+        with open(calls_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("status") == "ok" and not record.get("hedge_lost"):
+                    latencies.setdefault(latency_key(record), []).append(record["latency_s"])
+    return latencies
+
+def observed_latency(key: str, q: float, min_samples: int = 20):
+    """
+    Percentile of the recent latencies of a call class, or None while there are fewer than `min_samples`.
+    """
+    with _lock:
+        values = list(_latencies.get(key, ()))
+    if len(values) < min_samples:
+        return None
+    return percentile(values, q)
+
+def get_records() -> list:
+    with _lock:
+        return list(_records)
+
+def load_records(path: Path) -> list:
+    """
+    Reads call records from a JSONL metrics file (e.g. from an earlier run).
+    """
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    return records
+
+def percentile(values: list, q: float) -> float:
+    """
+    Nearest-rank percentile (q in 0..100).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def _aggregate(records: list) -> dict:
+    latencies = [r["latency_s"] for r in records]
+    prompt_tokens = sum(r.get("prompt_tokens") or 0 for r in records)
+    completion_tokens = sum(r.get("completion_tokens") or 0 for r in records)
+    cost = (prompt_tokens / 1000 * config.COST_PER_1K_PROMPT_TOKENS
+            + completion_tokens / 1000 * config.COST_PER_1K_COMPLETION_TOKENS)
+    return {
+        "calls": len(records),
+        "errors": sum(1 for r in records if r.get("status") != "ok"),
+        "retries": sum(r.get("retries") or 0 for r in records),
+        "hedged": sum(1 for r in records if r.get("hedged")),
+        "reasks": sum(1 for r in records if r.get("reask")),
+        "latency_p50_s": round(percentile(latencies, 50), 3),
+        "latency_p95_s": round(percentile(latencies, 95), 3),
+        "latency_total_s": round(sum(latencies), 3),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "image_pixels": sum(r.get("image_pixels") or 0 for r in records),
+        "image_tokens": sum(r.get("image_tokens") or 0 for r in records),
+        "image_tokens_saved": sum(r.get("image_tokens_saved") or 0 for r in records),
+        "cost": round(cost, 4)
+    }
+
+def summarize(records: list = None) -> dict:
+    """
+    Per-run summary: totals, per stage and per (stage, block_type).
+    """
+    records = get_records() if records is None else records
+
+    by_stage = {}
+    by_block = {}
+    for r in records:
+        stage = r.get("stage") or "unknown"
+        by_stage.setdefault(stage, []).append(r)
+        if r.get("block_type"):
+            by_block.setdefault(f"{stage}/{r['block_type']}", []).append(r)
+
+    return {
+        "run_id": RUN_ID,
+        "total": _aggregate(records),
+        "stages": {k: _aggregate(v) for k, v in sorted(by_stage.items())},
+        "block_types": {k: _aggregate(v) for k, v in sorted(by_block.items())}
+    }
+
+def _prom_escape(value: str) -> str:
+    """
+    Escapes a label value for the Prometheus text format (backslash, quote, newline).
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _prom_labels(key: str) -> str:
+    if "/" in key:
+        stage, block_type = key.split("/", 1)
+    else:
+        stage, block_type = key, ""
+    return f'stage="{_prom_escape(stage)}",block_type="{_prom_escape(block_type)}"'
+
+def write_prometheus(summary: dict, path: Path = None) -> Path:
+    """
+    Writes the summary in Prometheus textfile-collector format.
+    """
+    path = Path(path or Path(config.METRICS_PATH) / "model_calls.prom")
+    groups = {**summary["stages"], **summary["block_types"]}
+
+    lines = [
+        "# HELP ocr_model_calls_total Model calls in the last run.",
+        "# TYPE ocr_model_calls_total gauge",
+    ]
+    lines += [f"ocr_model_calls_total{{{_prom_labels(k)}}} {v['calls']}" for k, v in groups.items()]
+    lines += ["# HELP ocr_model_errors_total Failed model calls in the last run.",
+              "# TYPE ocr_model_errors_total gauge"]
+    lines += [f"ocr_model_errors_total{{{_prom_labels(k)}}} {v['errors']}" for k, v in groups.items()]
+    lines += ["# HELP ocr_model_retries_total Retried model calls in the last run.",
+              "# TYPE ocr_model_retries_total gauge"]
+    lines += [f"ocr_model_retries_total{{{_prom_labels(k)}}} {v['retries']}" for k, v in groups.items()]
+    lines += ["# HELP ocr_model_latency_seconds Model call latency in the last run.",
+              "# TYPE ocr_model_latency_seconds summary"]
+    for k, v in groups.items():
+        labels = _prom_labels(k)
+        lines.append(f'ocr_model_latency_seconds{{{labels},quantile="0.5"}} {v["latency_p50_s"]}')
+        lines.append(f'ocr_model_latency_seconds{{{labels},quantile="0.95"}} {v["latency_p95_s"]}')
+        lines.append(f"ocr_model_latency_seconds_sum{{{labels}}} {v['latency_total_s']}")
+        lines.append(f"ocr_model_latency_seconds_count{{{labels}}} {v['calls']}")
+    lines += ["# HELP ocr_model_tokens_total Tokens used in the last run.",
+              "# TYPE ocr_model_tokens_total gauge"]
+    for k, v in groups.items():
+        labels = _prom_labels(k)
+        lines.append(f'ocr_model_tokens_total{{{labels},kind="prompt"}} {v["prompt_tokens"]}')
+        lines.append(f'ocr_model_tokens_total{{{labels},kind="completion"}} {v["completion_tokens"]}')
+    lines += ["# HELP ocr_model_image_pixels_total Image pixels sent in the last run.",
+              "# TYPE ocr_model_image_pixels_total gauge"]
+    lines += [f"ocr_model_image_pixels_total{{{_prom_labels(k)}}} {v['image_pixels']}" for k, v in groups.items()]
+    lines += ["# HELP ocr_model_image_tokens_saved_total Image tokens saved by preprocessing in the last run.",
+              "# TYPE ocr_model_image_tokens_saved_total gauge"]
+    lines += [f"ocr_model_image_tokens_saved_total{{{_prom_labels(k)}}} {v['image_tokens_saved']}" for k, v in groups.items()]
+    lines += ["# HELP ocr_model_cost_total Estimated cost of the last run.",
+              "# TYPE ocr_model_cost_total gauge"]
+    lines += [f"ocr_model_cost_total{{{_prom_labels(k)}}} {v['cost']}" for k, v in groups.items()]
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".prom.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    tmp_path.replace(path) # Atomic, so the node exporter never reads a partial file
+    return path
+
+def print_summary(summary: dict):
+    print("\n--- Model Call Summary ---")
+    print(f"{'stage':<28}{'calls':>7}{'err':>5}{'p50 s':>9}{'p95 s':>9}{'prompt tok':>12}{'compl tok':>11}{'Mpx':>8}")
+    rows = list(summary["stages"].items()) + list(summary["block_types"].items()) + [("TOTAL", summary["total"])]
+    for name, v in rows:
+        print(f"{name:<28}{v['calls']:>7}{v['errors']:>5}{v['latency_p50_s']:>9.2f}{v['latency_p95_s']:>9.2f}"
+              f"{v['prompt_tokens']:>12}{v['completion_tokens']:>11}{v['image_pixels'] / 1e6:>8.1f}")
+    if summary["total"]["image_tokens"]:
+        print(f"Image tokens: {summary['total']['image_tokens']} sent, "
+              f"{summary['total']['image_tokens_saved']} saved by preprocessing")
+    if summary["total"]["cost"]:
+        print(f"Estimated cost: {summary['total']['cost']}")
+
+def write_run_summary() -> dict:
+    """
+    Prints the per-run summary and writes it as JSON + Prometheus textfile.
+    """
+    summary = summarize()
+    if not summary["total"]["calls"]:
+        return summary
+
+    print_summary(summary)
+
+    summary_path = Path(config.METRICS_PATH) / f"summary_{RUN_ID}.json"
+    summary_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    prom_path = write_prometheus(summary)
+
+    print(f"Metrics saved to: {calls_file()}, {summary_path}, {prom_path}")
+    return summary
@@ -0,0 +1,292 @@
+import io
+import json
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from PIL import Image
+import config
+import utils
+
+# Per-document storage of the stage artifacts: layout (step 1), extraction
+# (step 2), assembled page (step 3), chunks (step 4) and block crops.
+# "folder" keeps the original one-file-per-page layout, "sqlite" keeps all of
+# them as rows of a single artifacts.sqlite next to the page images.
+
+STAGES = ("layout", "extraction", "page")
+SQLITE_FILENAME = "artifacts.sqlite"
+
+class FolderStore:
+    """
+    One pretty-printed JSON file per page and stage, crops as PNG files.
+    """
+    backend = "folder"
+
+    # stage -> (subfolder, file name pattern)
+    STAGE_FILES = {
+        "layout": ("layout", "page_{}.json"),
+        "extraction": ("extracted", "page_{}_data.json"),
+        "page": ("final_json", "page_{}.json")
+    }
+
+    def __init__(self, doc_dir: Path):
+        self.doc_dir = Path(doc_dir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def location(self, stage: str) -> Path:
+        return self.doc_dir / self.STAGE_FILES[stage][0]
+
+    def _path(self, stage: str, page: int) -> Path:
+        folder, pattern = self.STAGE_FILES[stage]
+        return self.doc_dir / folder / pattern.format(page)
+
+    def has(self, stage: str, page: int) -> bool:
+        return self._path(stage, page).exists()
+
+    def get(self, stage: str, page: int):
+        path = self._path(stage, page)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def put(self, stage: str, page: int, data):
+        path = self._path(stage, page)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def pages(self, stage: str) -> list:
+        folder, pattern = self.STAGE_FILES[stage]
+        return sorted(utils.page_number_from_path(p) for p in (self.doc_dir / folder).glob(pattern.format("*")))
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+    def crops_dir(self, page: int) -> Path:
+        path = self.doc_dir / "extracted" / "crops" / f"page_{page}"
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def save_crops(self, page: int):
+        pass # Crops already are files in crops_dir()
+
+    def open_crop(self, crop_path) -> Image.Image:
+        crop_path = Path(crop_path)
+        if not crop_path.exists():
+            return None
+        with Image.open(crop_path) as img:
+            return img.convert("RGB")
+
+    def meta_path(self, name: str) -> Path:
+        path = self.doc_dir / "extracted" / f"{name}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def put_chunks(self, chunks: list) -> Path:
+        output_file = self.doc_dir / "chunks" / "all_chunks.json"
+        output_file.parent.mkdir(exist_ok=True)
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False, indent=2)
+        return output_file
+
+    def get_chunks(self) -> list:
+        return load_chunks(self.doc_dir / "chunks" / "all_chunks.json")
+
+class SQLiteStore:
+    """
+    All artifacts of a document in one SQLite file. Pages are looked up by
+    (stage, page) primary key; writes inside transaction() are atomic.
+    Crops are written to a scratch folder while a page is processed (the VLM
+    client sends files) and moved into the database by save_crops().
+    """
+    backend = "sqlite"
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS artifacts (stage TEXT NOT NULL, page INTEGER NOT NULL, data TEXT NOT NULL,
+                                          PRIMARY KEY (stage, page));
+    CREATE TABLE IF NOT EXISTS crops (page INTEGER NOT NULL, name TEXT NOT NULL, png BLOB NOT NULL,
+                                      PRIMARY KEY (page, name));
+    CREATE TABLE IF NOT EXISTS chunks (idx INTEGER PRIMARY KEY, page INTEGER, data TEXT NOT NULL);
+    """
+
+    def __init__(self, doc_dir: Path):
+        self.doc_dir = Path(doc_dir)
+        self.doc_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.doc_dir / SQLITE_FILENAME
+        self.scratch_dir = self.doc_dir / ".scratch"
+        # Autocommit mode, transactions are opened explicitly in transaction()
+        self.conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self._lock = threading.RLock()
+        self._depth = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+        if self.scratch_dir.exists() and not any(self.scratch_dir.iterdir()):
+            self.scratch_dir.rmdir()
+
+    def location(self, stage: str) -> Path:
+        return self.path
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            self._depth += 1
+            if self._depth == 1:
+                self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self.conn.execute("COMMIT")
+
+    def has(self, stage: str, page: int) -> bool:
+        with self._lock:
+            row = self.conn.execute("SELECT 1 FROM artifacts WHERE stage = ? AND page = ?", (stage, page)).fetchone()
+        return row is not None
+
+    def get(self, stage: str, page: int):
+        with self._lock:
+            row = self.conn.execute("SELECT data FROM artifacts WHERE stage = ? AND page = ?", (stage, page)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, stage: str, page: int, data):
+        with self.transaction():
+            self.conn.execute(
+                "INSERT OR REPLACE INTO artifacts (stage, page, data) VALUES (?, ?, ?)",
+                (stage, page, json.dumps(data, ensure_ascii=False))
+            )
+
+    def pages(self, stage: str) -> list:
+        with self._lock:
+            rows = self.conn.execute("SELECT page FROM artifacts WHERE stage = ? ORDER BY page", (stage,)).fetchall()
+        return [row[0] for row in rows]
+
+    def crops_dir(self, page: int) -> Path:
+        path = self.scratch_dir / f"page_{page}"
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def save_crops(self, page: int):
+        """
+        Moves the page's scratch crops into the database.
+        """
+        folder = self.scratch_dir / f"page_{page}"
+        if not folder.exists():
+            return
+        with self.transaction():
+            for crop_path in sorted(folder.glob("*.png")):
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO crops (page, name, png) VALUES (?, ?, ?)",
+                    (page, crop_path.name, crop_path.read_bytes())
+                )
+        shutil.rmtree(folder, ignore_errors=True)
+
+    def open_crop(self, crop_path) -> Image.Image:
+        crop_path = Path(crop_path)
+        if crop_path.exists():
+            with Image.open(crop_path) as img:
+                return img.convert("RGB")
+        page = utils.page_number_from_path(crop_path.parent)
+        with self._lock:
+            row = self.conn.execute("SELECT png FROM crops WHERE page = ? AND name = ?", (page, crop_path.name)).fetchone()
+        if row is None:
+            return None
+        with Image.open(io.BytesIO(row[0])) as img:
+            return img.convert("RGB")
+
+    def meta_path(self, name: str) -> Path:
+        return self.doc_dir / f"{name}.json"
+
+    def put_chunks(self, chunks: list) -> Path:
+        with self.transaction():
+            self.conn.execute("DELETE FROM chunks")
+            self.conn.executemany(
+                "INSERT INTO chunks (idx, page, data) VALUES (?, ?, ?)",
+                [(i, chunk.get("metadata", {}).get("page_number"), json.dumps(chunk, ensure_ascii=False))
+                 for i, chunk in enumerate(chunks)]
+            )
+        return self.path
+
+    def get_chunks(self) -> list:
+        with self._lock:
+            rows = self.conn.execute("SELECT data FROM chunks ORDER BY idx").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+def open_store(doc_dir: Path, backend: str = None):
+    """
+    Opens the artifact store of a document folder (backend from config.ARTIFACT_BACKEND).
+    """
+    backend = backend or config.ARTIFACT_BACKEND
+    if backend == "sqlite":
+        return SQLiteStore(doc_dir)
+    if backend == "folder":
+        return FolderStore(doc_dir)
+    raise ValueError(f"Unknown artifact backend: {backend}")
+
+def load_chunks(chunks_file: Path) -> list:
+    """
+    Loads the chunk list returned by step 4 (all_chunks.json or an artifacts.sqlite).
+    """
+    chunks_file = Path(chunks_file)
+    if chunks_file.suffix == ".sqlite":
+        with SQLiteStore(chunks_file.parent) as store:
+            return store.get_chunks()
+    with open(chunks_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def document_dir(chunks_file: Path) -> Path:
+    """
+    Document folder a chunk file returned by step 4 belongs to.
+    """
+    chunks_file = Path(chunks_file)
+    return chunks_file.parent if chunks_file.suffix == ".sqlite" else chunks_file.parent.parent
+
+def export_to_folder(doc_dir: Path) -> Path:
+    """
+    Writes the contents of a document's artifacts.sqlite back to the folder
+    layout (layout/, extracted/, final_json/, chunks/, crops as PNG files).
+    """
+    doc_dir = Path(doc_dir)
+    if not (doc_dir / SQLITE_FILENAME).exists():
+        raise FileNotFoundError(f"No {SQLITE_FILENAME} in {doc_dir}")
+
+    folder = FolderStore(doc_dir)
+    with SQLiteStore(doc_dir) as store:
+        for stage in STAGES:
+            for page in store.pages(stage):
+                folder.put(stage, page, store.get(stage, page))
+
+        for page, name, png in store.conn.execute("SELECT page, name, png FROM crops"):
+            (folder.crops_dir(page) / name).write_bytes(png)
+
+        chunks = store.get_chunks()
+        if chunks:
+            folder.put_chunks(chunks)
+
+    print(f"Exported artifacts of {doc_dir.name} to the folder layout.")
+    return doc_dir
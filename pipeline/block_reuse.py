@@ -0,0 +1,226 @@
+import json
+import threading
+from pathlib import Path
+from PIL import Image, ImageChops
+import config
+import image_prep
+
+# Near-duplicate reuse of block extractions. Drawing sets repeat the same title
+# block and general notes on almost every sheet: a perceptual hash per block
+# type finds earlier crops that look the same, and a pixel diff tells whether
+# the earlier result can be reused as is or only a few regions changed.
+# Tables and text blocks are only reused on an exact pixel match.
+
+DIFF_GRID = (24, 12)    # Grid cells (columns, rows) used to locate changed regions
+DIFF_SHIFT = 2          # Max offset (px) between two renderings of the same block
+DIFF_PIXEL_LEVEL = 160  # Grayscale difference that counts as a changed pixel
+DIFF_MIN_PIXELS = 4     # Changed pixels that mark a grid cell as changed
+
+def trim_whitespace(image: Image.Image) -> Image.Image:
+    """
+    Crops white margins, so that crops with slightly different layout boxes align.
+    """
+    return image_prep.trim_margins(image, padding=0)
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """
+    Difference hash: compares adjacent pixels of a (hash_size+1) x hash_size thumbnail.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.tobytes()) # One byte per "L" pixel
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def identical(reference: Image.Image, image: Image.Image) -> bool:
+    """
+    Exact match of two (trimmed) crops at native resolution.
+    """
+    if reference.size != image.size:
+        return False
+    return ImageChops.difference(reference.convert("L"), image.convert("L")).getbbox() is None
+
+def _changed_pixels(a: Image.Image, b: Image.Image) -> Image.Image:
+    return ImageChops.difference(a, b).point(lambda p: 255 if p > DIFF_PIXEL_LEVEL else 0)
+
+def aligned_difference(reference: Image.Image, image: Image.Image) -> Image.Image:
+    """
+    Changed-pixel mask (image size) of two grayscale crops at native resolution,
+    at the offset (up to DIFF_SHIFT px) where they differ least. Only the crop
+    offset is tolerated, the pixels themselves are compared without blurring.
+    """
+    width, height = image.size
+    canvas = Image.new("L", (width + 2 * DIFF_SHIFT, height + 2 * DIFF_SHIFT), 255)
+    best, best_count = None, None
+    for dy in range(-DIFF_SHIFT, DIFF_SHIFT + 1):
+        for dx in range(-DIFF_SHIFT, DIFF_SHIFT + 1):
+            shifted = canvas.copy()
+            shifted.paste(reference, (DIFF_SHIFT + dx, DIFF_SHIFT + dy))
+            shifted = shifted.crop((DIFF_SHIFT, DIFF_SHIFT, DIFF_SHIFT + width, DIFF_SHIFT + height))
+            changed = _changed_pixels(shifted, image)
+            count = changed.histogram()[255]
+            if best_count is None or count < best_count:
+                best, best_count = changed, count
+            if count == 0:
+                return best
+    return best
+
+def diff_regions(reference: Image.Image, image: Image.Image) -> list:
+    """
+    Compares two (trimmed) crops at native resolution and returns the changed
+    regions as (left, top, right, bottom) boxes in `image` pixel coordinates.
+    No downscaling or blur: a single changed digit must show up.
+    """
+    if abs(reference.width - image.width) > 2 * DIFF_SHIFT or abs(reference.height - image.height) > 2 * DIFF_SHIFT:
+        return [(0, 0, image.width, image.height)]
+    width, height = image.size
+    changed = aligned_difference(reference.convert("L"), image.convert("L"))
+
+    cols, rows = DIFF_GRID
+    cell_w, cell_h = width / cols, height / rows
+    grid = [[False] * cols for _ in range(rows)]
+    for r in range(rows):
+        for c in range(cols):
+            cell = changed.crop((round(c * cell_w), round(r * cell_h), round((c + 1) * cell_w), round((r + 1) * cell_h)))
+            if cell.histogram()[255] >= DIFF_MIN_PIXELS:
+                grid[r][c] = True
+
+    # Group changed cells into connected components (8-neighbourhood)
+    seen = set()
+    boxes = []
+    for r in range(rows):
+        for c in range(cols):
+            if not grid[r][c] or (r, c) in seen:
+                continue
+            stack = [(r, c)]
+            seen.add((r, c))
+            r0, c0, r1, c1 = r, c, r, c
+            while stack:
+                cr, cc = stack.pop()
+                r0, c0, r1, c1 = min(r0, cr), min(c0, cc), max(r1, cr), max(c1, cc)
+                for dr in (-1, 0, 1):
+                    for dc in (-1, 0, 1):
+                        nr, nc = cr + dr, cc + dc
+                        if 0 <= nr < rows and 0 <= nc < cols and grid[nr][nc] and (nr, nc) not in seen:
+                            seen.add((nr, nc))
+                            stack.append((nr, nc))
+            # One cell of padding
+            boxes.append((
+                max(0, round((c0 - 1) * cell_w)),
+                max(0, round((r0 - 1) * cell_h)),
+                min(width, round((c1 + 2) * cell_w)),
+                min(height, round((r1 + 2) * cell_h))
+            ))
+    return boxes
+
+def changed_area(boxes: list, image: Image.Image) -> float:
+    """
+    Fraction of the crop covered by changed regions.
+    """
+    total = sum((r - l) * (b - t) for l, t, r, b in boxes)
+    return min(1.0, total / max(1, image.width * image.height))
+
+class BlockReuseIndex:
+    """
+    Per block type index of earlier extractions, keyed by perceptual hash.
+    Persisted as JSON next to the extraction results so resumed runs keep it.
+    `open_crop` loads a stored crop by its path (crops may live in the artifact store).
+    Safe to share between the concurrent page workers of step 2.
+    """
+    def __init__(self, path: Path, open_crop=None):
+        self.path = Path(path)
+        self.open_crop = open_crop
+        self.entries = {} # block_type -> list of {"hash", "crop_path", "content", "source"}
+        self._images = {} # crop_path -> trimmed reference image
+        self.stats = {"eligible": 0, "reused": 0, "partial": 0, "region_calls": 0}
+        self.lock = threading.RLock()
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except Exception as e:
+                print(f"Error loading reuse index {self.path}: {e}")
+
+    def save(self):
+        with self.lock:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+
+    def count(self, stat: str):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def _reference_image(self, entry: dict):
+        crop_path = entry["crop_path"]
+        if crop_path not in self._images:
+            if self.open_crop is not None:
+                img = self.open_crop(crop_path)
+            elif Path(crop_path).exists():
+                with Image.open(crop_path) as f:
+                    img = f.convert("RGB")
+            else:
+                img = None
+            if img is None:
+                return None
+            self._images[crop_path] = trim_whitespace(img)
+        return self._images[crop_path]
+
+    def lookup(self, block_type: str, image: Image.Image):
+        """
+        Finds the closest earlier crop of the same block type.
+
+        Returns:
+            tuple: (entry, changed_boxes, trimmed_image) or None if there is no near duplicate.
+            changed_boxes is empty when the crops are practically identical.
+        """
+        if block_type not in config.PHASH_REUSE_TYPES:
+            return None
+        self.count("eligible")
+
+        trimmed = trim_whitespace(image)
+        crop_hash = dhash(trimmed)
+
+        best = None
+        best_distance = config.PHASH_MAX_DISTANCE + 1
+        with self.lock:
+            for entry in self.entries.get(block_type, []):
+                distance = hamming(crop_hash, int(entry["hash"], 16))
+                if distance < best_distance:
+                    best, best_distance = entry, distance
+            if best is None:
+                return None
+            reference = self._reference_image(best)
+
+        if reference is None:
+            return None
+        # Different aspect ratio -> different block, even if the hash is close
+        if abs(reference.width / reference.height - trimmed.width / trimmed.height) > 0.1 * (trimmed.width / trimmed.height):
+            return None
+
+        # Tables / text: a changed digit must never reuse the old values, so
+        # anything but a pixel-identical crop is extracted again
+        if block_type in config.PHASH_EXACT_TYPES:
+            boxes = [] if identical(reference, trimmed) else [(0, 0, trimmed.width, trimmed.height)]
+            return best, boxes, trimmed
+        return best, diff_regions(reference, trimmed), trimmed
+
+    def add(self, block_type: str, image: Image.Image, crop_path: Path, content, source: str):
+        if block_type not in config.PHASH_REUSE_TYPES:
+            return
+        trimmed = trim_whitespace(image)
+        entry = {
+            "hash": f"{dhash(trimmed):016x}",
+            "crop_path": str(crop_path),
+            "content": content,
+            "source": source
+        }
+        with self.lock:
+            self.entries.setdefault(block_type, []).append(entry)
+            self._images[str(crop_path)] = trimmed
@@ -0,0 +1,104 @@
+import json
+import hashlib
+import re
+from datetime import datetime, timezone
+from pathlib import Path
+import config
+
+# One vector collection (and dense matrix) per indexed document, grouped by
+# project. The registry maps collection names to their project/document, so
+# several projects and revisions can stay indexed side by side and an audit
+# only searches its own project's collections.
+
+def collection_name(project: str, document: str) -> str:
+    """
+    Chroma-safe collection name ([A-Za-z0-9_], 3-63 chars) for a project document.
+    The hash keeps Cyrillic / long names unique.
+    """
+    raw = f"{project}/{document}"
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", f"{project}_{document}").strip("_")[:40] or "doc"
+    return f"{slug}_{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:8]}"
+
+def load_registry(path: Path = None) -> dict:
+    path = Path(path or config.COLLECTION_REGISTRY_PATH)
+    if not path.exists():
+        return {"collections": {}}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading collection registry {path}: {e}")
+        return {"collections": {}}
+
+def save_registry(registry: dict, path: Path = None):
+    """
+    Writes the registry atomically (temp file + rename).
+    """
+    path = Path(path or config.COLLECTION_REGISTRY_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(registry, f, ensure_ascii=False, indent=2)
+    tmp_path.replace(path)
+
+def register_collection(name: str, project: str, document: str, chunks: int, sections: dict = None,
+                        drawing_index: str = None):
+    """
+    Adds / replaces a collection entry. `sections` is the document's P87
+    section index (section id -> pages), None if it wasn't built;
+    `drawing_index` the path of its drawing marks (step 3).
+    """
+    registry = load_registry()
+    registry["collections"][name] = {
+        "project": project,
+        "document": document,
+        "chunks": chunks,
+        "sections": sections,
+        "drawing_index": drawing_index,
+        "embedding_model": config.EMBEDDING_MODEL_NAME,
+        "indexed_at": datetime.now(timezone.utc).isoformat(timespec="seconds")
+    }
+    save_registry(registry)
+
+def list_collections(project: str = None) -> dict:
+    """
+    Registered collections (name -> entry), optionally of one project only.
+    """
+    collections = load_registry()["collections"]
+    if project is None:
+        return collections
+    return {name: entry for name, entry in collections.items() if entry.get("project") == project}
+
+def resolve_collections(project: str = None, names: list = None) -> list:
+    """
+    Collections to search: the given names, or all collections of a project
+    (config.DEFAULT_PROJECT if none is given).
+    """
+    if names:
+        return list(names)
+    return sorted(list_collections(project or config.DEFAULT_PROJECT))
+
+def section_pages(section_id: str, names: list) -> dict:
+    """
+    Where a P87 section is in the given collections: name -> page list for the
+    collections that contain it, name -> None for collections without a section
+    index or with an empty one (unknown: searched unfiltered). An empty dict
+    means the section is absent from every collection.
+    """
+    collections = load_registry()["collections"]
+    scope = {}
+    for name in names:
+        sections = collections.get(name, {}).get("sections")
+        if not sections:
+            scope[name] = None
+        elif section_id in sections:
+            scope[name] = sections[section_id]
+    return scope
+
+def drawing_indexes(names: list) -> dict:
+    """
+    Collection name -> drawing marks path, for the collections that have one.
+    """
+    collections = load_registry()["collections"]
+    return {name: collections[name]["drawing_index"] for name in names
+            if collections.get(name, {}).get("drawing_index")}
@@ -0,0 +1,134 @@
+import json
+from pathlib import Path
+import numpy as np
+import config
+
+SEARCH_BLOCK_ROWS = 65536 # Matrix rows converted to float32 at a time (float16 mmaps stay on disk)
+
+def matrix_paths(collection_name: str) -> tuple:
+    """
+    Returns (matrix_path, sidecar_path) for a collection's exported embeddings.
+    """
+    base = Path(config.DENSE_INDEX_PATH)
+    return base / f"{collection_name}.npy", base / f"{collection_name}.ids.json"
+
+def export_embedding_matrix(collection_name: str, ids: list, documents: list, metadatas: list, embeddings: list) -> Path:
+    """
+    Writes the chunk embeddings as a memory-mappable .npy matrix plus a JSON sidecar
+    holding chunk IDs, documents and metadata in row order.
+    """
+    matrix_path, sidecar_path = matrix_paths(collection_name)
+    matrix_path.parent.mkdir(parents=True, exist_ok=True)
+
+    dim = len(embeddings[0]) if embeddings else 0
+    matrix = np.lib.format.open_memmap(
+        matrix_path, mode="w+", dtype=np.dtype(config.DENSE_INDEX_DTYPE), shape=(len(embeddings), dim)
+    )
+    for row, emb in enumerate(embeddings):
+        matrix[row] = emb
+    matrix.flush()
+    del matrix
+
+    sidecar = {
+        "embedding_model": config.EMBEDDING_MODEL_NAME,
+        "dtype": config.DENSE_INDEX_DTYPE,
+        "dim": dim,
+        "ids": ids,
+        "documents": documents,
+        "metadatas": metadatas
+    }
+    with open(sidecar_path, "w", encoding="utf-8") as f:
+        json.dump(sidecar, f, ensure_ascii=False)
+
+    print(f"Exported {len(ids)}x{dim} {config.DENSE_INDEX_DTYPE} embedding matrix to {matrix_path}")
+    return matrix_path
+
+class DenseIndex:
+    """
+    Exact nearest-neighbour search over the exported embedding matrix.
+    Uses squared L2 distance, the same metric as the Chroma collection.
+    """
+    def __init__(self, matrix: np.ndarray, ids: list, documents: list, metadatas: list):
+        self.matrix = matrix
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self._doc_norms = None
+
+    @classmethod
+    def load(cls, collection_name: str):
+        matrix_path, sidecar_path = matrix_paths(collection_name)
+        if not matrix_path.exists() or not sidecar_path.exists():
+            raise FileNotFoundError(f"Dense index for '{collection_name}' not found in {config.DENSE_INDEX_PATH}. Run Step 5 first.")
+
+        with open(sidecar_path, "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+        if sidecar.get("embedding_model") != config.EMBEDDING_MODEL_NAME:
+            print(f"Warning: dense index was built with {sidecar.get('embedding_model')}, "
+                  f"current model is {config.EMBEDDING_MODEL_NAME}")
+
+        matrix = np.load(matrix_path, mmap_mode="r")
+        return cls(matrix, sidecar["ids"], sidecar["documents"], sidecar["metadatas"])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows_on_pages(self, pages: list) -> np.ndarray:
+        """
+        Row numbers of the chunks from the given pages (metadata page_number).
+        """
+        pages = set(pages)
+        return np.array([row for row, meta in enumerate(self.metadatas) if meta.get("page_number") in pages], dtype=np.int64)
+
+    def doc_norms(self) -> np.ndarray:
+        """
+        Squared norms of all chunk embeddings (computed once, block by block).
+        """
+        if self._doc_norms is None:
+            norms = np.empty(len(self.ids), dtype=np.float32)
+            for start in range(0, len(self.ids), SEARCH_BLOCK_ROWS):
+                docs = np.asarray(self.matrix[start : start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+                norms[start : start + len(docs)] = np.einsum("ij,ij->i", docs, docs)
+            self._doc_norms = norms
+        return self._doc_norms
+
+    def search(self, query_embeddings, k: int, rows: np.ndarray = None) -> tuple:
+        """
+        Scores all queries against all chunks (one matmul per SEARCH_BLOCK_ROWS
+        block of the matrix) and takes the top-k per query with argpartition. `rows` restricts the search to a subset of
+        chunks (returned indices still refer to the full index).
+
+        Returns:
+            tuple: (indices, distances), both shaped (n_queries, k), sorted by distance.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+
+        n = len(self.ids) if rows is None else len(rows)
+        k = min(k, n)
+        if n == 0 or k == 0:
+            empty = np.zeros((len(queries), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+
+        # ||q - d||^2 = ||q||^2 + ||d||^2 - 2 q.d, scored block by block over the mmap
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+        doc_norms = self.doc_norms()
+        distances = np.empty((len(queries), n), dtype=np.float32)
+        for start in range(0, n, SEARCH_BLOCK_ROWS):
+            block_rows = slice(start, start + SEARCH_BLOCK_ROWS) if rows is None else rows[start : start + SEARCH_BLOCK_ROWS]
+            docs = np.asarray(self.matrix[block_rows], dtype=np.float32)
+            distances[:, start : start + len(docs)] = (query_norms[:, None] + doc_norms[block_rows][None, :]
+                                                       - 2.0 * (queries @ docs.T))
+
+        if k < n:
+            top = np.argpartition(distances, kth=k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(n), (len(queries), 1))
+        top_dist = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(top_dist, axis=1, kind="stable")
+
+        indices = np.take_along_axis(top, order, axis=1)
+        if rows is not None:
+            indices = rows[indices]
+        return indices, np.take_along_axis(top_dist, order, axis=1)
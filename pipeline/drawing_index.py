@@ -0,0 +1,212 @@
+import json
+import re
+from pathlib import Path
+
+# Drawing OCR post-processing. A drawing's OCR list is mostly dimension strings
+# ("3600", "6х600=3600"), level marks ("+3.300"), axis tags ("А", "12") and
+# section cut marks ("1-1"): useless for semantic search, but exact lookups
+# ("ось Б", "размер 3600", "разрез 1-1"). They go to a per-document side index
+# (kind, value, text, box, page); only the description and the meaningful
+# labels are embedded (steps 3-4).
+
+# Latin letters OCR'd in place of Cyrillic axis letters
+_LATIN_TO_CYRILLIC = str.maketrans("ABCEHKMOPTX", "АВСЕНКМОРТХ")
+# Letters not used for axes (ГОСТ 21.101)
+_NON_AXIS_LETTERS = set("ЁЗЙОХЦЧЩЪЫЬ")
+
+_DIMENSION_RE = re.compile(
+    r"^(?:[RrØø⌀∅]\s?)?\d{1,3}(?:[\s ]?\d{3})*(?:[.,]\d+)?(?:\s?(?:мм|см|м))?$"
+)
+_CHAIN_RE = re.compile(r"^\d+\s?[xх×*]\s?\d+(?:[.,]\d+)?(?:\s?=\s?\d+(?:[.,]\d+)?)?$")
+_LEVEL_RE = re.compile(r"^[+\-±]\s?\d+[.,]\d{3}$")
+_AXIS_RE = re.compile(r"^(?:[A-ZА-ЯЁ]|\d{1,2})(?:['’]|/\d{1,2})?$")
+_CUT_RE = re.compile(r"^(\d{1,2}|[A-ZА-ЯЁ])\s?[-–—]\s?(\d{1,2}|[A-ZА-ЯЁ])$")
+
+# "ось Б", "оси 3", "axis A", "размер 3600", "отметка +3.300", "разрез 1-1"
+_QUERY_RE = re.compile(
+    r"^\s*(?:найти\s+|find\s+)?(оси|ось|axis|размеры|размер|dimension|отметка|отметку|level|разрез|сечение|section)\s+(.+?)\s*$",
+    re.IGNORECASE
+)
+_QUERY_KINDS = {
+    "ось": "axis", "оси": "axis", "axis": "axis",
+    "размер": "dimension", "размеры": "dimension", "dimension": "dimension",
+    "отметка": "level", "отметку": "level", "level": "level",
+    "разрез": "cut", "сечение": "cut", "section": "cut"
+}
+
+def is_axis_tag(text: str) -> bool:
+    """
+    Axis tag as drawn: an uppercase letter used for axes or a 1-2 digit number,
+    optionally with ' or /N ("Б", "12", "1/2", "А'").
+    """
+    if not _AXIS_RE.match(text):
+        return False
+    letter = text[0].translate(_LATIN_TO_CYRILLIC)
+    return not letter.isalpha() or letter not in _NON_AXIS_LETTERS
+
+def classify_text(text: str):
+    """
+    Kind of an OCR'd drawing item: "axis", "dimension", "level", "cut", "label",
+    or None for noise (no letters, nothing to look up). Axis tags are only
+    candidates here, see split_drawing.
+    """
+    text = text.strip()
+    if not text:
+        return None
+    # 1-2 digit integers are axis numbers; dimensions are in mm
+    if is_axis_tag(text):
+        return "axis"
+    if _LEVEL_RE.match(text):
+        return "level"
+    if _DIMENSION_RE.match(text) or _CHAIN_RE.match(text):
+        return "dimension"
+    if _CUT_RE.match(text.upper()):
+        return "cut"
+    if len(text) >= 2 and any(ch.isalpha() for ch in text):
+        return "label"
+    return None
+
+def normalize_value(text: str, kind: str) -> str:
+    """
+    Lookup key of a mark: "3 600" -> "3600", "+3,300" -> "+3.300", "a" -> "А", "а–а" -> "А-А".
+    """
+    value = re.sub(r"[\s ]+", "", text).replace(",", ".")
+    if kind == "cut":
+        return re.sub(r"[–—]", "-", value.upper()).translate(_LATIN_TO_CYRILLIC)
+    if kind == "axis":
+        return value.upper().replace("’", "'").translate(_LATIN_TO_CYRILLIC)
+    if kind == "dimension":
+        return re.sub(r"(мм|см|м)$", "", value).replace("х", "x").replace("×", "x").replace("*", "x")
+    return value
+
+def drawing_items(drawing) -> tuple:
+    """
+    (description, OCR items) of an assembled drawing entry: {"description", "content"},
+    a bare OCR item {"text", "box"} (older assembled pages), or plain text.
+    """
+    if isinstance(drawing, str):
+        return "", [{"text": drawing}]
+    if not isinstance(drawing, dict):
+        return "", []
+    description = str(drawing.get("description") or "")
+    content = drawing.get("content")
+    if isinstance(content, list):
+        return description, [item for item in content if isinstance(item, dict)]
+    if isinstance(content, str):
+        return description, [{"text": content}]
+    if "text" in drawing:
+        return description, [drawing]
+    return description, []
+
+def _axis_family(value: str) -> str:
+    return "letter" if value[0].isalpha() else "number"
+
+def split_drawing(drawing) -> tuple:
+    """
+    Splits a drawing into what gets embedded and what goes to the side index.
+    Axes come in series (А, Б, В / 1, 2, 3): a tag whose family has no second
+    distinct value on the drawing is a stray letter (dropped) or a short
+    dimension (number).
+
+    Returns:
+        tuple: (description, labels, marks) - labels are unique meaningful texts
+        in OCR order, marks are {"kind", "value", "text", "box"} dicts.
+    """
+    description, items = drawing_items(drawing)
+    labels, marks = [], []
+    for item in items:
+        text = str(item.get("text", "")).strip()
+        kind = classify_text(text)
+        if kind == "label":
+            if text not in labels:
+                labels.append(text)
+        elif kind is not None:
+            marks.append({"kind": kind, "value": normalize_value(text, kind), "text": text, "box": item.get("box")})
+
+    families = {}
+    for mark in marks:
+        if mark["kind"] == "axis":
+            families.setdefault(_axis_family(mark["value"]), set()).add(mark["value"].split("/")[0].rstrip("'"))
+    kept = []
+    for mark in marks:
+        if mark["kind"] == "axis" and len(families[_axis_family(mark["value"])]) < 2:
+            if _axis_family(mark["value"]) == "letter" or not mark["value"].isdigit():
+                continue
+            mark["kind"] = "dimension"
+        kept.append(mark)
+    return description, labels, kept
+
+def drawing_text(drawing) -> str:
+    """
+    Compact text of a drawing for embedding: description + meaningful labels.
+    """
+    description, labels, _ = split_drawing(drawing)
+    parts = []
+    if description:
+        parts.append(f"Описание чертежа: {description}")
+    if labels:
+        parts.append(f"Текст на чертеже: {', '.join(labels)}")
+    return "\n".join(parts)
+
+def page_marks(drawings: list, page_number: int) -> list:
+    """
+    Side index entries of one page's drawings.
+    """
+    entries = []
+    for d, drawing in enumerate(drawings):
+        for mark in split_drawing(drawing)[2]:
+            entries.append({**mark, "page": page_number, "drawing": d})
+    return entries
+
+def save_drawing_index(marks: list, path: Path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(marks, f, ensure_ascii=False)
+
+def load_drawing_index(path: Path):
+    """
+    Returns the saved drawing marks of a document, or None if they weren't built.
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def parse_mark_query(text: str):
+    """
+    (kind, value) of a "find axis / dimension / level / section cut X" query,
+    else None. The value must look like a mark of that kind, so questions
+    like "размер санитарно-защитной зоны" stay semantic searches.
+    """
+    match = _QUERY_RE.match(text)
+    if not match:
+        return None
+    kind = _QUERY_KINDS[match.group(1).lower()]
+    value = match.group(2).strip().strip("\"«»")
+    checks = {
+        "axis": lambda v: is_axis_tag(v.upper()),
+        "dimension": lambda v: _DIMENSION_RE.match(v) or _CHAIN_RE.match(v),
+        # Levels are also asked for without the sign ("отметка 3.300")
+        "level": lambda v: _LEVEL_RE.match(v) or _LEVEL_RE.match("+" + v),
+        "cut": lambda v: _CUT_RE.match(v.upper())
+    }
+    if not checks[kind](value):
+        return None
+    return kind, normalize_value(value, kind)
+
+def find_marks(marks: list, value: str, kind: str = None) -> list:
+    """
+    Marks with the given normalized value (any kind if `kind` is None). Level
+    marks also match without the sign ("3.300" finds "+3.300"); 1-2 digit
+    integers are indexed as axes but may be short dimensions, so they match both.
+    """
+    kinds = {kind} if kind is not None else None
+    if kind in ("axis", "dimension") and value.isdigit() and len(value) <= 2:
+        kinds = {"axis", "dimension"}
+    found = []
+    for mark in marks:
+        if kinds is not None and mark["kind"] not in kinds:
+            continue
+        if mark["value"] == value or (mark["kind"] == "level" and mark["value"].lstrip("+-±") == value.lstrip("+-±")):
+            found.append(mark)
+    return found
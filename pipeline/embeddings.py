@@ -0,0 +1,37 @@
+import chromadb
+import chromadb.errors
+import config
+
+# Heavy module (chromadb, sentence_transformers/torch): import it only on code
+# paths that actually embed or search.
+
+# Custom Embedding Function class to wrap SentenceTransformer for Chroma
+class LocalEmbeddingFunction(chromadb.EmbeddingFunction):
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        print(f"Loading embedding model: {model_name}...")
+        self.model = SentenceTransformer(model_name)
+
+    def __call__(self, input):
+        return self.model.encode(input, batch_size=4, convert_to_tensor=False).tolist()
+
+# get_collection of a missing collection raises ValueError in older chromadb,
+# InvalidCollectionException / NotFoundError in newer releases
+COLLECTION_NOT_FOUND = (ValueError,) + tuple(
+    getattr(chromadb.errors, name) for name in ("InvalidCollectionException", "NotFoundError")
+    if hasattr(chromadb.errors, name)
+)
+
+_embedding_fn = None
+
+def get_embedding_function() -> LocalEmbeddingFunction:
+    """
+    Returns the shared embedding function (loaded once per process).
+    """
+    global _embedding_fn
+    if _embedding_fn is None:
+        _embedding_fn = LocalEmbeddingFunction(config.EMBEDDING_MODEL_NAME)
+    return _embedding_fn
+
+def get_client():
+    return chromadb.PersistentClient(path=str(config.CHROMA_DB_PATH))
@@ -0,0 +1,78 @@
+from PIL import Image
+import config
+import image_prep
+
+# Cheap per-page routing before the layout call. Text-only pages (explanatory
+# note sections) get one combined "layout + content" request; pages with
+# ruling lines (tables, drawing frames), dense ink or a native text layer go
+# through the layout call and targeted per-block extraction.
+# numpy is imported inside the functions: step 1 imports this module, light
+# commands must not load numpy (benchmarks/check_startup.py).
+
+ANALYSIS_WIDTH = 600      # Pages are analyzed at this width
+CELL_INK_LEVEL = 40       # Downscaled cell counts as ink above this (thin lines survive the downscale)
+LINE_MIN_FRACTION = 0.35  # A straight ink run this long (share of the page side) is a ruling line
+EDGE_MARGIN = 0.1         # Ignored border band (sheet frame, 20 mm binding margin)
+STAMP_ZONE = 0.25         # Ignored bottom band for line counting (title block grid)
+
+def _ink_mask(image: Image.Image) -> "np.ndarray":
+    import numpy as np
+    ink = image_prep.ink_mask(image)
+    height = max(1, round(image.height * ANALYSIS_WIDTH / image.width))
+    small = ink.resize((ANALYSIS_WIDTH, height), Image.BOX)
+    return np.asarray(small) > CELL_INK_LEVEL
+
+def _longest_runs(mask: "np.ndarray") -> "np.ndarray":
+    """
+    Longest run of consecutive True values in every row.
+    """
+    import numpy as np
+    longest = np.zeros(mask.shape[0], dtype=np.int32)
+    current = np.zeros(mask.shape[0], dtype=np.int32)
+    for column in mask.T:
+        current = (current + 1) * column
+        np.maximum(longest, current, out=longest)
+    return longest
+
+def _count_lines(mask: "np.ndarray") -> int:
+    """
+    Number of distinct ruling lines (adjacent line rows count once).
+    """
+    import numpy as np
+    is_line = _longest_runs(mask) >= LINE_MIN_FRACTION * mask.shape[1]
+    return int(np.count_nonzero(is_line[1:] & ~is_line[:-1]) + (1 if is_line.size and is_line[0] else 0))
+
+def page_features(image: Image.Image) -> dict:
+    """
+    Ink ratio and ruling line counts of the page body (frame and title block zone excluded).
+    """
+    mask = _ink_mask(image)
+    h, w = mask.shape
+    top, left = round(h * EDGE_MARGIN), round(w * EDGE_MARGIN)
+    body = mask[top : h - top, left : w - left]
+    lines_area = mask[top : round(h * (1 - STAMP_ZONE)), left : w - left]
+
+    return {
+        "ink_ratio": round(float(body.mean()), 4) if body.size else 0.0,
+        "h_lines": _count_lines(lines_area),
+        "v_lines": _count_lines(lines_area.T)
+    }
+
+def route_page(image_path, text_layer: dict = None) -> tuple:
+    """
+    Decides how a page is extracted.
+
+    Returns:
+        tuple: ("single_pass" | "targeted", features dict)
+    """
+    with Image.open(image_path) as image:
+        features = page_features(image)
+
+    # Native words make text blocks free in step 2, a combined call would only add output tokens
+    if text_layer and text_layer.get("words"):
+        return "targeted", features
+    if features["h_lines"] > config.SINGLE_PASS_MAX_LINES or features["v_lines"] > config.SINGLE_PASS_MAX_LINES:
+        return "targeted", features
+    if features["ink_ratio"] > config.SINGLE_PASS_MAX_INK:
+        return "targeted", features
+    return "single_pass", features
@@ -0,0 +1,105 @@
+import json
+import hashlib
+import re
+from datetime import datetime, timezone
+from pathlib import Path
+import config
+
+# Bump when the artifact layout changes; older artifacts are ignored.
+PLAN_FORMAT_VERSION = 1
+
+_plans_cache = None
+
+def rule_hash(rule_text: str) -> str:
+    """
+    Stable hash of a rule text (whitespace-normalized).
+    """
+    normalized = re.sub(r"\s+", " ", rule_text).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+
+def plan_key(rule_text: str, generator_model: str) -> str:
+    """
+    Key of a compiled plan: rule text hash + the LLM that generated the queries.
+    """
+    return f"{rule_hash(rule_text)}@{generator_model}"
+
+def generator_model() -> str:
+    """
+    Model the query generation calls are routed to (utils.model_route).
+    """
+    from utils import model_route
+
+    return model_route({"stage": "query_generation"})["model"]
+
+def empty_artifact() -> dict:
+    return {
+        "format_version": PLAN_FORMAT_VERSION,
+        "created_at": None,
+        "plans": {}
+    }
+
+def load_artifact(path: Path = None) -> dict:
+    """
+    Loads the compiled rules artifact. Returns an empty artifact if the file
+    is missing or was written by an incompatible version.
+    """
+    path = Path(path or config.COMPILED_RULES_PATH)
+    if not path.exists():
+        return empty_artifact()
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            artifact = json.load(f)
+    except Exception as e:
+        print(f"Error loading compiled rules {path}: {e}")
+        return empty_artifact()
+
+    if artifact.get("format_version") != PLAN_FORMAT_VERSION:
+        print(f"Ignoring compiled rules {path}: format version {artifact.get('format_version')} "
+              f"!= {PLAN_FORMAT_VERSION}. Re-run the compile rules command.")
+        return empty_artifact()
+
+    return artifact
+
+def save_artifact(artifact: dict, path: Path = None):
+    """
+    Writes the artifact atomically (temp file + rename).
+    """
+    path = Path(path or config.COMPILED_RULES_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    artifact["format_version"] = PLAN_FORMAT_VERSION
+    artifact["created_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, ensure_ascii=False)
+    tmp_path.replace(path)
+
+def make_plan(rule_id: str, rule_text: str, queries: list, embeddings: list) -> dict:
+    return {
+        "rule_id": rule_id,
+        "rule_hash": rule_hash(rule_text),
+        "generator_model": generator_model(),
+        "embedding_model": config.EMBEDDING_MODEL_NAME,
+        "queries": queries,
+        "embeddings": embeddings
+    }
+
+def find_plan(rule_text: str) -> dict:
+    """
+    Returns the compiled plan for a rule under the current generator model, or None.
+    Embeddings are dropped if they were computed with a different embedding model.
+    """
+    global _plans_cache
+    if not config.USE_COMPILED_RULES:
+        return None
+    if _plans_cache is None:
+        _plans_cache = load_artifact().get("plans", {})
+
+    plan = _plans_cache.get(plan_key(rule_text, generator_model()))
+    if plan is None:
+        return None
+
+    if plan.get("embedding_model") != config.EMBEDDING_MODEL_NAME:
+        plan = {**plan, "embeddings": None}
+    return plan
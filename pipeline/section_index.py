@@ -0,0 +1,120 @@
+import json
+import re
+from pathlib import Path
+
+# Which sections of the Regulation No. 87 (П87) composition a document covers.
+# Built at assembly time from title blocks (document code, Название_листа) and
+# headers, so that audits can resolve the rules of missing sections without
+# any LLM call and restrict retrieval to the pages of present sections.
+
+# (section id, name, document codes, lowercase name fragments)
+P87_SECTIONS = [
+    ("1", "Пояснительная записка", ("ПЗ",), ("пояснительная записка",)),
+    ("2", "Схема планировочной организации земельного участка", ("ПЗУ",), ("планировочной организации земельного участка",)),
+    ("3", "Объемно-планировочные и архитектурные решения", ("АР",), ("архитектурные решения",)),
+    ("4", "Конструктивные решения", ("КР",), ("конструктивные решения", "конструктивные и объемно-планировочные")),
+    ("5", "Сведения об инженерном оборудовании, сетях и системах инженерно-технического обеспечения", ("ИОС",),
+     ("инженерном оборудовании", "инженерно-технического обеспечения", "система электроснабжения",
+      "система водоснабжения", "система водоотведения", "отопление, вентиляция", "сети связи",
+      "система газоснабжения", "технологические решения")),
+    ("6", "Проект организации строительства", ("ПОС",), ("проект организации строительства",)),
+    ("7", "Проект организации работ по сносу или демонтажу объектов капитального строительства", ("ПОД",),
+     ("по сносу или демонтажу",)),
+    ("8", "Перечень мероприятий по охране окружающей среды", ("ООС",), ("охране окружающей среды",)),
+    ("9", "Мероприятия по обеспечению пожарной безопасности", ("ПБ", "МПБ"), ("пожарной безопасности",)),
+    ("10", "Мероприятия по обеспечению доступа инвалидов", ("ОДИ",), ("доступа инвалидов",)),
+    ("10.1", "Мероприятия по обеспечению соблюдения требований энергетической эффективности", ("ЭЭ",),
+     ("энергетической эффективности",)),
+    ("11", "Смета на строительство", ("СМ",), ("смета на строительство", "сметная документация")),
+]
+
+_CODE_TO_SECTION = {code: section_id for section_id, _, codes, _ in P87_SECTIONS for code in codes}
+# Document code at the end of a designation, e.g. "123-2024-ПЗ", "45/23-ИОС4.1", "01-КР2"
+_CODE_RE = re.compile(r"[-\s](" + "|".join(sorted(_CODE_TO_SECTION, key=len, reverse=True)) + r")(?:\d+(?:\.\d+)*)?\s*$")
+_SECTION_NUMBER_RE = re.compile(r"раздел\s+(\d+(?:\.\d+)?)", re.IGNORECASE)
+_SECTION_IDS = {section_id for section_id, _, _, _ in P87_SECTIONS}
+
+def section_from_code(value: str):
+    match = _CODE_RE.search(str(value).strip())
+    return _CODE_TO_SECTION[match.group(1)] if match else None
+
+def sections_in_text(text: str) -> set:
+    """
+    Sections named in a sheet title / header ("Раздел 1", or the section's name).
+    """
+    found = set()
+    lowered = str(text).lower()
+    for number in _SECTION_NUMBER_RE.findall(lowered):
+        if number in _SECTION_IDS:
+            found.add(number)
+    for section_id, _, _, fragments in P87_SECTIONS:
+        if any(fragment in lowered for fragment in fragments):
+            found.add(section_id)
+    return found
+
+def detect_page_sections(extracted_data: list) -> set:
+    """
+    Sections a page belongs to, from its title block (document code in any
+    field, Название_листа) and header blocks.
+    """
+    found = set()
+    for block in extracted_data:
+        content = block.get("content")
+        if not content:
+            continue
+        if block.get("type") == "title_block" and isinstance(content, dict):
+            for key, value in content.items():
+                section_id = section_from_code(value)
+                if section_id:
+                    found.add(section_id)
+                if key == "Название_листа":
+                    found |= sections_in_text(value)
+        elif block.get("type") == "header":
+            found |= sections_in_text(content)
+    return found
+
+def build_section_index(page_sections: dict) -> dict:
+    """
+    Section id -> sorted page numbers. Sections are contiguous in a document set,
+    so pages without their own marks inherit the section of the previous page
+    (pages before the first mark take the first one).
+
+    Args:
+        page_sections (dict): page number -> set of section ids detected on the page.
+    """
+    pages = sorted(page_sections)
+    first_marked = next((page_sections[p] for p in pages if page_sections[p]), set())
+    index = {}
+    current = first_marked
+    for page in pages:
+        if page_sections[page]:
+            current = page_sections[page]
+        for section_id in current:
+            index.setdefault(section_id, []).append(page)
+    return index
+
+def save_section_index(index: dict, path: Path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+
+def load_section_index(path: Path):
+    """
+    Returns the saved section index of a document, or None if it wasn't built.
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def rule_section_id(section: str):
+    """
+    P87 section id of a rule's "section" field, e.g. "Раздел 1. Пояснительная записка" -> "1".
+    """
+    if not section:
+        return None
+    match = _SECTION_NUMBER_RE.search(section)
+    if match and match.group(1) in _SECTION_IDS:
+        return match.group(1)
+    found = sections_in_text(section)
+    return next(iter(found)) if len(found) == 1 else None
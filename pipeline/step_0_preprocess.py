@@ -2,6 +2,7 @@ import config
 from pathlib import Path
 from pdf2image import convert_from_path
 from tqdm import tqdm
+from pipeline.text_layer import extract_text_layer
 
 
 def convert_pdf_to_images(pdf_path: Path) -> Path:
@@ -38,6 +39,10 @@ def convert_pdf_to_images(pdf_path: Path) -> Path:
     print(f"Successfully converted {len(images)} pages.")
     print(f"Images saved to: {output_dir}")
 
+    # Native words with boxes, used by Step 2 to skip OCR of text blocks
+    if config.TEXT_LAYER_ENABLED:
+        extract_text_layer(pdf_path, output_dir)
+
     return output_dir
 
 
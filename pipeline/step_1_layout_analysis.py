@@ -1,58 +1,104 @@
-import json
 from pathlib import Path
 from tqdm import tqdm
 import utils
 import prompts
+import schemas
+import metrics
+import config
+from pipeline.page_routing import route_page
+from pipeline.text_layer import load_page_text_layer
+from pipeline.artifact_store import open_store
+
+def clean_single_pass_blocks(layout_data) -> list:
+    """
+    Validates the answer of the single-pass prompt. Blocks keep their "content"
+    only if it has the shape step 2 would produce (text for text_block/header,
+    fields dict for title_block); the rest are extracted by step 2 as usual.
+    """
+    if not isinstance(layout_data, list):
+        raise ValueError("single-pass answer is not a JSON list")
+
+    blocks = []
+    for block in layout_data:
+        if not isinstance(block, dict) or not block.get("type") or not block.get("box"):
+            continue
+        block_type = block["type"]
+        content = block.get("content")
+        cleaned = {"type": block_type, "box": block["box"]}
+        if block_type in ("text_block", "header") and isinstance(content, str) and content.strip():
+            cleaned["content"] = content
+        elif block_type == "title_block" and isinstance(content, dict) and content:
+            cleaned["content"] = content
+        blocks.append(cleaned)
+    return blocks
 
 def analyze_layout(images_dir: Path) -> Path:
     """
     Analyzes the layout of images in a directory using Qwen-VL.
+    With config.SINGLE_PASS_ROUTING, simple text pages get one combined prompt
+    and their layout JSON also carries the blocks' content (used by step 2).
     
     Args:
         images_dir (Path): Directory containing page images (e.g., page_1.png).
         
     Returns:
-        Path: Directory where layout JSONs are saved.
+        Path: Where the layout JSONs are saved (folder, or the document's artifacts.sqlite).
     """
     
-    # Create a subdirectory for layout JSONs
-    layout_dir = images_dir / "layout"
-    layout_dir.mkdir(exist_ok=True)
+    # Layout JSONs go to the document's artifact store (layout/ subfolder or SQLite)
+    store = open_store(images_dir)
+    layout_dir = store.location("layout")
     
     # Find all PNG images
     image_files = sorted(list(images_dir.glob("*.png")))
     
     if not image_files:
         print(f"No images found in {images_dir} to analyze.")
+        store.close()
         return layout_dir
 
     print(f"Analyzing layout for {len(image_files)} pages in {images_dir.name}...")
+    routing_stats = {"single_pass": 0, "complete": 0, "targeted": 0}
 
     for image_path in tqdm(image_files, desc="Analyzing Pages"):
-        # Define output JSON path
-        json_filename = image_path.stem + ".json" # e.g., page_1.json
-        json_path = layout_dir / json_filename
+        page_number = utils.page_number_from_path(image_path)
         
         # Skip if already exists (simple caching mechanism)
-        if json_path.exists():
+        if store.has("layout", page_number):
             continue
 
         try:
-            # Call Qwen-VL
-            response_text = utils.call_qwen_vl(image_path, prompts.LAYOUT_ANALYSIS_PROMPT)
-            
-            # Parse JSON
-            layout_data = utils.parse_json_from_response(response_text)
+            route = "targeted"
+            if config.SINGLE_PASS_ROUTING:
+                text_layer = load_page_text_layer(images_dir, image_path.stem) if config.TEXT_LAYER_ENABLED else None
+                route, _ = route_page(image_path, text_layer)
+
+            # Call Qwen-VL (answer validated against the schema, re-asked if invalid)
+            send = lambda prompt, schema: utils.call_qwen_vl(image_path, prompt, schema)
+            if route == "single_pass":
+                with metrics.tags(stage="single_pass", page=page_number):
+                    response = utils.request_json(send, prompts.PAGE_SINGLE_PASS_PROMPT, schemas.SINGLE_PASS_SCHEMA)
+                layout_data = clean_single_pass_blocks(response)
+                routing_stats["single_pass"] += 1
+                if all("content" in block for block in layout_data):
+                    routing_stats["complete"] += 1
+            else:
+                with metrics.tags(stage="layout", page=page_number):
+                    layout_data = utils.request_json(send, prompts.LAYOUT_ANALYSIS_PROMPT, schemas.LAYOUT_SCHEMA)
+                routing_stats["targeted"] += 1
             
-            # Save to file
-            with open(json_path, "w", encoding="utf-8") as f:
-                json.dump(layout_data, f, ensure_ascii=False, indent=2)
+            # Save to the store
+            store.put("layout", page_number, layout_data)
                 
         except Exception as e:
             print(f"Error analyzing {image_path.name}: {e}")
             # Optionally, we could continue to the next page instead of crashing
             continue
             
+    if config.SINGLE_PASS_ROUTING:
+        print(f"Page routing: {routing_stats['single_pass']} single-pass pages "
+              f"({routing_stats['complete']} without block calls), {routing_stats['targeted']} targeted")
+    store.close()
     print(f"Layout analysis complete. Results saved in {layout_dir}")
     return layout_dir
 
@@ -1,9 +1,25 @@
 import json
+import copy
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from PIL import Image
 from tqdm import tqdm
 import utils
 import prompts
+import schemas
+import metrics
+import config
+from pipeline.block_reuse import BlockReuseIndex, changed_area
+from pipeline.text_layer import load_page_text_layer, native_block_text
+from pipeline.artifact_store import open_store
+
+# Relative extraction cost of a block type (~ VLM latency of a typical crop),
+# used to start the most expensive pages first
+BLOCK_COST = {"drawing": 4.0, "table": 3.0, "title_block": 1.0, "text_block": 1.0, "header": 0.5}
+
+# Block types answered with JSON (validated, re-asked per block if invalid)
+BLOCK_SCHEMAS = {"title_block": schemas.TITLE_BLOCK_SCHEMA, "drawing": schemas.DRAWING_SCHEMA}
 
 def crop_image(image: Image.Image, box: list) -> Image.Image:
     """
@@ -21,9 +37,162 @@ def crop_image(image: Image.Image, box: list) -> Image.Image:
     # Add a small padding (optional)
     return image.crop((left, top, right, bottom))
 
-def extract_data_from_page(image_path: Path, layout_path: Path, output_dir: Path):
+def reuse_block_extraction(reuse_index: BlockReuseIndex, block_type: str, cropped_image: Image.Image,
+                           crops_dir: Path, block_idx: int):
+    """
+    Returns the content of a near-identical earlier block, or None if a fresh
+    extraction is needed. For title blocks with small differences, only the
+    changed regions are sent to the VLM and merged into the earlier fields.
+    """
+    match = reuse_index.lookup(block_type, cropped_image)
+    if match is None:
+        return None
+    entry, boxes, trimmed = match
+
+    if not boxes:
+        reuse_index.count("reused")
+        return copy.deepcopy(entry["content"])
+
+    if block_type != "title_block" or not isinstance(entry["content"], dict):
+        return None
+    if changed_area(boxes, trimmed) > config.PHASH_MAX_DIFF_AREA:
+        return None
+
+    content = dict(entry["content"])
+    prompt = prompts.TITLE_BLOCK_REGION_PROMPT.format(fields=json.dumps(entry["content"], ensure_ascii=False))
+    for k, region in enumerate(boxes):
+        region_path = crops_dir / f"block_{block_idx}_title_block_region_{k}.png"
+        trimmed.crop(region).save(region_path)
+        try:
+            with metrics.tags(block_type="title_block_region"):
+                update = utils.request_json(lambda p, s: utils.call_qwen_vl(region_path, p, s),
+                                            prompt, schemas.TITLE_BLOCK_SCHEMA)
+            reuse_index.count("region_calls")
+        except Exception as e:
+            print(f"    Region re-extraction failed ({e}), extracting the whole title block.")
+            return None
+        if not isinstance(update, dict):
+            return None
+        content.update(update)
+
+    reuse_index.count("partial")
+    return content
+
+def select_prompt(block_type: str) -> str:
+    """
+    Returns the extraction prompt for a block type ("" for unknown types).
+    """
+    if block_type == "title_block":
+        return prompts.TITLE_BLOCK_PROMPT
+    elif block_type == "table":
+        return prompts.TABLE_PROMPT
+    elif block_type == "drawing":
+        return prompts.DRAWING_PROMPT
+    elif block_type == "text_block" or block_type == "header":
+        return prompts.TEXT_BLOCK_PROMPT
+    return ""
+
+def block_area(box: list) -> float:
+    """
+    Fraction of the page covered by a normalized [ymin, xmin, ymax, xmax] box.
+    """
+    ymin, xmin, ymax, xmax = box
+    return max(0, ymax - ymin) * max(0, xmax - xmin) / 1_000_000
+
+def is_batchable(block_type: str, box: list) -> bool:
+    return (config.BATCH_SMALL_BLOCKS
+            and block_type in ("text_block", "header")
+            and block_area(box) <= config.BATCH_SMALL_BLOCK_MAX_AREA)
+
+def estimate_page_cost(layout_data: list) -> float:
+    """
+    Expected extraction work of a page from its layout: block type weights,
+    scaled up for large crops (more image tokens and longer answers).
+    """
+    cost = 0.0
+    for block in layout_data or []:
+        if not isinstance(block, dict) or "content" in block or not block.get("box"):
+            continue
+        cost += BLOCK_COST.get(block.get("type"), 0.0) * (1 + 4 * block_area(block["box"]))
+    return cost
+
+def extract_block(crop_path: Path, block_type: str, prompt: str):
+    """
+    One VLM call for one block. Returns the parsed content (raises on API errors).
+    Title blocks and drawings are validated against their schema; an invalid
+    answer re-asks this block only.
+    """
+    schema = BLOCK_SCHEMAS.get(block_type)
+    if schema is None:
+        return utils.call_qwen_vl(crop_path, prompt)
+
+    try:
+        return utils.request_json(lambda p, s: utils.call_qwen_vl(crop_path, p, s), prompt, schema)
+    except ValueError as e:
+        # Still invalid after re-asking, keep raw text
+        return getattr(e, "response_text", "")
+
+def is_reusable(block_type: str, content) -> bool:
+    """
+    Whether an extraction may enter the reuse index: schema blocks only with a
+    valid answer (not the raw text kept after failed re-asks), text only non-empty.
+    """
+    schema = BLOCK_SCHEMAS.get(block_type)
+    if schema is not None:
+        return schemas.is_valid(content, schema)
+    return isinstance(content, str) and bool(content.strip())
+
+def extract_block_batch(batch: list) -> dict:
+    """
+    Packs several small text crops into one multi-image request and splits the
+    keyed JSON answer back per block. Blocks missing from the answer (or all of
+    them, if it doesn't parse) fall back to one request per block.
+
+    Args:
+        batch (list): [(block_index, block_type, crop_path), ...]
+
+    Returns:
+        dict: block_index -> extracted text (failed blocks are omitted).
+    """
+    if len(batch) == 1:
+        i, block_type, crop_path = batch[0]
+        with metrics.tags(block_type=block_type):
+            return {i: extract_block(crop_path, block_type, select_prompt(block_type))}
+
+    keys = {f"block_{i}": i for i, _, _ in batch}
+    prompt = prompts.MULTI_TEXT_BLOCK_PROMPT.format(keys=", ".join(keys))
+
+    answers = {}
+    try:
+        with metrics.tags(block_type="text_batch"):
+            response_text = utils.call_qwen_vl_multi([(f"block_{i}", crop_path) for i, _, crop_path in batch], prompt)
+        parsed = utils.parse_json_from_response(response_text)
+        if isinstance(parsed, dict):
+            for key, text in parsed.items():
+                if key in keys and isinstance(text, str):
+                    answers[keys[key]] = text
+    except Exception as e:
+        print(f"    Batched extraction failed ({e}), falling back to single blocks.")
+
+    for i, block_type, crop_path in batch:
+        if i in answers:
+            continue
+        try:
+            with metrics.tags(block_type=block_type):
+                answers[i] = extract_block(crop_path, block_type, select_prompt(block_type))
+        except Exception as e:
+            print(f"    Error extracting block {i} ({block_type}): {e}")
+
+    return answers
+
+def extract_data_from_page(image_path: Path, layout_data: list, crops_dir: Path, reuse_index: BlockReuseIndex = None,
+                           text_layer: dict = None):
     """
     Extracts data from specific blocks on a page based on layout analysis.
+    If a reuse index is given, near-identical blocks reuse earlier extractions.
+    Blocks that already carry content (single-pass pages of step 1) are kept as is.
+    If the page has a native text layer, text blocks covered by it skip the VLM.
+    Small text blocks are packed into multi-image requests (config.BATCH_SMALL_BLOCKS).
     """
     # Load image
     try:
@@ -32,19 +201,10 @@ def extract_data_from_page(image_path: Path, layout_path: Path, output_dir: Path
         print(f"Error opening image {image_path}: {e}")
         return
 
-    # Load layout JSON
-    try:
-        with open(layout_path, "r", encoding="utf-8") as f:
-            layout_data = json.load(f)
-    except Exception as e:
-        print(f"Error loading layout {layout_path}: {e}")
-        return
-
-    page_results = []
-    
-    # Create a temporary directory for crops (useful for debugging, optional)
-    crops_dir = output_dir / "crops" / image_path.stem
-    crops_dir.mkdir(parents=True, exist_ok=True)
+    page_number = utils.page_number_from_path(image_path)
+    block_results = {} # block index -> result (keeps layout order)
+    batch = [] # Small text blocks, extracted together after the loop
+    crops = {} # block index -> cropped image (for the reuse index)
 
     print(f"  Processing {len(layout_data)} blocks for {image_path.name}...")
 
@@ -55,88 +215,171 @@ def extract_data_from_page(image_path: Path, layout_path: Path, output_dir: Path
         if not block_type or not box:
             continue
 
+        # Content already read by the single-pass call of step 1
+        if "content" in block:
+            block_results[i] = {
+                "type": block_type,
+                "box": box,
+                "content": block["content"],
+                "source": "single_pass"
+            }
+            continue
+
+        # Select Prompt
+        prompt = select_prompt(block_type)
+        if not prompt:
+            continue # Skip unknown types
+
         # Crop the image
         cropped_image = crop_image(image, box)
         crop_path = crops_dir / f"block_{i}_{block_type}.png"
         cropped_image.save(crop_path)
+        crops[i] = cropped_image
 
-        # Select Prompt
-        prompt = ""
-        if block_type == "title_block":
-            prompt = prompts.TITLE_BLOCK_PROMPT
-        elif block_type == "table":
-            prompt = prompts.TABLE_PROMPT
-        elif block_type == "drawing":
-            prompt = prompts.DRAWING_PROMPT
-        elif block_type == "text_block" or block_type == "header":
-            prompt = prompts.TEXT_BLOCK_PROMPT
-        else:
-            continue # Skip unknown types
+        # Exact text from the PDF's own text layer (CAD/Word exports)
+        if text_layer and block_type in config.TEXT_LAYER_BLOCK_TYPES:
+            native_text = native_block_text(text_layer, box, cropped_image)
+            if native_text:
+                block_results[i] = {
+                    "type": block_type,
+                    "box": box,
+                    "content": native_text,
+                    "source": "text_layer"
+                }
+                continue
+
+        # Near-duplicate of an earlier block (stamp, standard notes)?
+        if reuse_index is not None:
+            with metrics.tags(stage="extraction", page=page_number):
+                reused_content = reuse_block_extraction(reuse_index, block_type, cropped_image, crops_dir, i)
+            if reused_content is not None:
+                block_results[i] = {
+                    "type": block_type,
+                    "box": box,
+                    "content": reused_content,
+                    "reused": True
+                }
+                continue
+
+        if is_batchable(block_type, box):
+            batch.append((i, block_type, crop_path))
+            continue
 
         # Call API with cropped image
         try:
-            response_text = utils.call_qwen_vl(crop_path, prompt)
-            
-            # Process response based on type
-            extracted_content = response_text
-            if block_type in ["title_block", "drawing"]:
-                try:
-                    extracted_content = utils.parse_json_from_response(response_text)
-                except:
-                    # Fallback if JSON parsing fails, keep raw text
-                    pass
+            with metrics.tags(stage="extraction", block_type=block_type, page=page_number):
+                extracted_content = extract_block(crop_path, block_type, prompt)
             
             # Store result
-            block_result = {
+            block_results[i] = {
                 "type": block_type,
                 "box": box, # Keep original coordinates
                 "content": extracted_content
             }
-            page_results.append(block_result)
+
+            if reuse_index is not None and is_reusable(block_type, extracted_content):
+                reuse_index.add(block_type, cropped_image, crop_path, extracted_content, f"{image_path.stem}/block_{i}")
 
         except Exception as e:
             print(f"    Error extracting block {i} ({block_type}): {e}")
 
-    return page_results
+    # Small text blocks: several crops per request
+    for start in range(0, len(batch), config.BATCH_MAX_BLOCKS):
+        group = batch[start : start + config.BATCH_MAX_BLOCKS]
+        with metrics.tags(stage="extraction", page=page_number):
+            answers = extract_block_batch(group)
+
+        for i, block_type, crop_path in group:
+            if i not in answers:
+                continue
+            block_results[i] = {
+                "type": block_type,
+                "box": layout_data[i]["box"],
+                "content": answers[i]
+            }
+            if reuse_index is not None and is_reusable(block_type, answers[i]):
+                reuse_index.add(block_type, crops[i], crop_path, answers[i], f"{image_path.stem}/block_{i}")
+
+    return [block_results[i] for i in sorted(block_results)]
 
 def run_targeted_extraction(images_dir: Path, layout_dir: Path) -> Path:
     """
     Main function for Step 2.
+    Layouts are read from (and results written to) the document's artifact store;
+    `layout_dir` is what step 1 returned. Pages run on config.EXTRACTION_CONCURRENCY
+    workers, the most expensive ones first.
     """
-    extraction_dir = images_dir / "extracted"
-    extraction_dir.mkdir(exist_ok=True)
+    store = open_store(images_dir)
+    extraction_dir = store.location("extraction")
     
-    layout_files = sorted(list(layout_dir.glob("*.json")))
+    layout_pages = store.pages("layout")
     
-    if not layout_files:
+    if not layout_pages:
         print(f"No layout files found in {layout_dir}.")
+        store.close()
         return extraction_dir
 
-    print(f"Starting targeted extraction for {len(layout_files)} pages...")
+    print(f"Starting targeted extraction for {len(layout_pages)} pages...")
+
+    native_blocks = 0
+    reuse_index = None
+    if config.PHASH_REUSE_ENABLED:
+        reuse_index = BlockReuseIndex(store.meta_path("reuse_index"), open_crop=store.open_crop)
 
-    for layout_file in tqdm(layout_files, desc="Extracting Data"):
+    # Pages still to extract, most expensive first (longest-processing-time order),
+    # so that drawing-heavy pages don't start last and stretch the tail
+    pending = []
+    for page_number in layout_pages:
         # Determine corresponding image path
-        # layout filename is "page_N.json", image is "page_N.png"
-        image_filename = layout_file.stem + ".png" 
-        image_path = images_dir / image_filename
+        # layout of page N belongs to "page_N.png"
+        image_path = images_dir / f"page_{page_number}.png"
         
         if not image_path.exists():
-            print(f"Warning: Image not found for layout {layout_file.name}")
+            print(f"Warning: Image not found for layout of page {page_number}")
             continue
-            
-        output_json_path = extraction_dir / f"{layout_file.stem}_data.json"
         
         # Skip if already exists
-        if output_json_path.exists():
+        if store.has("extraction", page_number):
             continue
 
-        extracted_data = extract_data_from_page(image_path, layout_file, extraction_dir)
+        layout_data = store.get("layout", page_number)
+        pending.append((estimate_page_cost(layout_data), page_number, image_path, layout_data))
+    pending.sort(key=lambda item: -item[0])
+
+    def process_page(page_number: int, image_path: Path, layout_data: list) -> int:
+        text_layer = load_page_text_layer(images_dir, image_path.stem) if config.TEXT_LAYER_ENABLED else None
+        extracted_data = extract_data_from_page(image_path, layout_data, store.crops_dir(page_number), reuse_index, text_layer)
         
-        if extracted_data:
-            with open(output_json_path, "w", encoding="utf-8") as f:
-                json.dump(extracted_data, f, ensure_ascii=False, indent=2)
+        # Page result and its crops are written together
+        with store.transaction():
+            if extracted_data:
+                store.put("extraction", page_number, extracted_data)
+            store.save_crops(page_number)
 
-    print(f"Extraction complete. Results saved in {extraction_dir}")
-    return extraction_dir
+        if reuse_index is not None:
+            reuse_index.save()
+        return sum(1 for block in extracted_data or [] if block.get("source") == "text_layer")
+
+    with ThreadPoolExecutor(max_workers=max(1, config.EXTRACTION_CONCURRENCY)) as pool:
+        futures = {
+            pool.submit(contextvars.copy_context().run, process_page, page_number, image_path, layout_data): page_number
+            for _, page_number, image_path, layout_data in pending
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Extracting Data"):
+            try:
+                native_blocks += future.result()
+            except Exception as e:
+                print(f"Error extracting page {futures[future]}: {e}")
 
+    store.close()
 
+    if reuse_index is not None:
+        stats = reuse_index.stats
+        print(f"Block reuse: {stats['reused']} reused, {stats['partial']} partially re-extracted "
+              f"({stats['region_calls']} region calls) of {stats['eligible']} eligible blocks")
+
+    if native_blocks:
+        print(f"Native text layer: {native_blocks} blocks extracted without a VLM call")
+
+    print(f"Extraction complete. Results saved in {extraction_dir}")
+    return extraction_dir
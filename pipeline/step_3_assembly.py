@@ -1,7 +1,8 @@
-import json
 from pathlib import Path
 from tqdm import tqdm
-import re
+from pipeline.artifact_store import open_store
+from pipeline.section_index import detect_page_sections, build_section_index, save_section_index
+from pipeline.drawing_index import drawing_text, page_marks, save_drawing_index
 
 def assemble_page_data(extracted_data: list, page_number: int) -> dict:
     """
@@ -43,27 +44,15 @@ def assemble_page_data(extracted_data: list, page_number: int) -> dict:
             full_text_parts.append(str(content))
 
         elif b_type == "drawing":
-            # Content might be a list of text items with boxes
-            if isinstance(content, list):
-                final_doc["drawings"].extend(content)
-                # Extract just the text for indexing
-                drawing_texts = [item.get("text", "") for item in content if isinstance(item, dict)]
-                full_text_parts.extend(drawing_texts)
-            elif isinstance(content, dict):
-                 # Sometimes model returns a single object
-                 final_doc["drawings"].append(content)
-                 
-                 # Add description to full text
-                 if "description" in content:
-                     full_text_parts.append(str(content["description"]))
-                 
-                 # Add extracted text content to full text
-                 if "content" in content and isinstance(content["content"], list):
-                      drawing_texts = [item.get("text", "") for item in content["content"] if isinstance(item, dict)]
-                      full_text_parts.extend(drawing_texts)
-            else:
-                 # Fallback
-                 pass
+            # One entry per drawing; dimensions and axis tags go to the drawing
+            # side index (run_assembly), only description + labels to full text
+            if isinstance(content, (list, str)):
+                content = {"content": content}
+            if isinstance(content, dict):
+                final_doc["drawings"].append(content)
+                compact = drawing_text(content)
+                if compact:
+                    full_text_parts.append(compact)
 
         elif b_type == "text_block" or b_type == "header":
              final_doc["text_blocks"].append(str(content))
@@ -77,37 +66,57 @@ def assemble_page_data(extracted_data: list, page_number: int) -> dict:
 def run_assembly(images_dir: Path, extracted_dir: Path) -> Path:
     """
     Main function for Step 3: Assembly.
+    Reads extraction results from the document's artifact store (`extracted_dir`
+    is what step 2 returned) and writes the assembled pages in one transaction.
     """
-    final_output_dir = images_dir / "final_json"
-    final_output_dir.mkdir(exist_ok=True)
+    store = open_store(images_dir)
+    final_output_dir = store.location("page")
     
     # Find extraction results
-    extracted_files = sorted(list(extracted_dir.glob("*_data.json")))
+    extracted_pages = store.pages("extraction")
     
-    if not extracted_files:
+    if not extracted_pages:
         print(f"No extracted data found in {extracted_dir}.")
+        store.close()
         return final_output_dir
 
-    print(f"Assembling final documents for {len(extracted_files)} pages...")
+    print(f"Assembling final documents for {len(extracted_pages)} pages...")
+
+    page_sections = {}
+    drawing_marks = []
+    with store.transaction():
+        for page_num in tqdm(extracted_pages, desc="Assembling"):
+            try:
+                data = store.get("extraction", page_num)
+                    
+                final_doc = assemble_page_data(data, page_num)
+                store.put("page", page_num, final_doc)
+                page_sections[page_num] = detect_page_sections(data)
+                drawing_marks.extend(page_marks(final_doc["drawings"], page_num))
+                    
+            except Exception as e:
+                print(f"Error assembling page {page_num}: {e}")
 
-    for file_path in tqdm(extracted_files, desc="Assembling"):
-        # Parse page number from filename (page_1_data.json)
-        match = re.search(r"page_(\d+)", file_path.name)
-        page_num = int(match.group(1)) if match else 0
-        
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                
-            final_doc = assemble_page_data(data, page_num)
-            
-            output_path = final_output_dir / f"page_{page_num}.json"
-            with open(output_path, "w", encoding="utf-8") as f:
-                json.dump(final_doc, f, ensure_ascii=False, indent=2)
-                
-        except Exception as e:
-            print(f"Error assembling {file_path.name}: {e}")
+    # Which P87 sections the document covers (used by the audit, see step 6)
+    # No marks at all means detection failed, not that every section is missing:
+    # no index is saved, so the audit searches the whole document
+    section_index = build_section_index(page_sections)
+    section_path = store.meta_path("sections")
+    if section_index:
+        save_section_index(section_index, section_path)
+        print(f"Sections found: {', '.join(sorted(section_index, key=lambda s: [int(x) for x in s.split('.')]))}")
+    else:
+        section_path.unlink(missing_ok=True)
+        print("No P87 section marks found (title block codes / headers), no section index saved.")
 
+    # Dimensions / axis tags / levels of the drawings (exact lookups, see query_rag)
+    save_drawing_index(drawing_marks, store.meta_path("drawings"))
+    if drawing_marks:
+        kinds = {}
+        for mark in drawing_marks:
+            kinds[mark["kind"]] = kinds.get(mark["kind"], 0) + 1
+        print(f"Drawing marks indexed: {', '.join(f'{n} {kind}' for kind, n in sorted(kinds.items()))}")
+
+    store.close()
     print(f"Assembly complete. Final JSONs saved in {final_output_dir}")
     return final_output_dir
-
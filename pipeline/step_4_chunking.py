@@ -1,7 +1,9 @@
-import json
 from pathlib import Path
 from tqdm import tqdm
 import config
+import utils
+from pipeline.artifact_store import open_store
+from pipeline.drawing_index import drawing_text
 
 def create_chunk_object(content: str, chunk_type: str, metadata: dict, page_num: int) -> dict:
     """
@@ -17,6 +19,78 @@ def create_chunk_object(content: str, chunk_type: str, metadata: dict, page_num:
         }
     }
 
+def parse_markdown_table(markdown: str) -> tuple:
+    """
+    Splits a Markdown table into (header_lines, rows, before, after).
+    header_lines are the column names + the |---| separator; `before`/`after` are
+    non-table lines around it (captions, notes); empty for a table without the
+    separator. Returns None if there is no table.
+    """
+    lines = markdown.strip().splitlines()
+    table_idx = [i for i, line in enumerate(lines) if line.strip().startswith("|")]
+    if len(table_idx) < 2:
+        return None
+
+    first, last = table_idx[0], table_idx[-1]
+    table_lines = [line for line in lines[first : last + 1] if line.strip()]
+    before = "\n".join(lines[:first]).strip()
+    after = "\n".join(lines[last + 1:]).strip()
+
+    # Header = everything up to and including the |---|---| separator;
+    # without a separator every line is a data row
+    header_len = 0
+    for i, line in enumerate(table_lines[:3]):
+        if set(line.replace("|", "").strip()) <= set("-: ") and "-" in line:
+            header_len = i + 1
+            break
+    return table_lines[:header_len], table_lines[header_len:], before, after
+
+def split_table(markdown: str) -> list:
+    """
+    Splits a large Markdown table into row groups of about config.TABLE_CHUNK_TOKENS.
+    Every group repeats the header rows, if the table has them.
+
+    Returns:
+        list: [{"content", "row_start", "row_end", "header_lines"}], rows numbered from 1.
+        A single group if the table fits the budget or can't be parsed.
+    """
+    parsed = parse_markdown_table(markdown)
+    if parsed is None or utils.estimate_tokens(markdown) <= config.TABLE_CHUNK_TOKENS:
+        rows = len(parsed[1]) if parsed else 0
+        return [{"content": markdown, "row_start": 1, "row_end": rows, "header_lines": len(parsed[0]) if parsed else 0}]
+
+    header, rows, before, after = parsed
+    header_text = "\n".join(header)
+    budget = max(1, config.TABLE_CHUNK_TOKENS - utils.estimate_tokens(header_text))
+
+    groups = []
+    current, current_tokens, start = [], 0, 1
+    for n, row in enumerate(rows, start=1):
+        row_tokens = utils.estimate_tokens(row)
+        if current and current_tokens + row_tokens > budget:
+            groups.append((start, n - 1, current))
+            current, current_tokens, start = [], 0, n
+        current.append(row)
+        current_tokens += row_tokens
+    if current:
+        groups.append((start, len(rows), current))
+
+    result = []
+    for k, (row_start, row_end, group_rows) in enumerate(groups):
+        parts = [*header, *group_rows]
+        # Caption goes with the first group, notes under the table with the last one
+        if k == 0 and before:
+            parts.insert(0, before)
+        if k == len(groups) - 1 and after:
+            parts.append(after)
+        result.append({
+            "content": "\n".join(parts),
+            "row_start": row_start,
+            "row_end": row_end,
+            "header_lines": len(header)
+        })
+    return result
+
 def process_page_chunks(page_data: dict) -> list:
     """
     Dynamically splits a page JSON into logical chunks.
@@ -33,30 +107,28 @@ def process_page_chunks(page_data: dict) -> list:
         del base_metadata["raw_text"]
 
     # 2. Tables -> Independent Chunks
-    for table in page_data.get("tables", []):
+    # Large tables are split into row groups (header repeated); table_id + row range
+    # let step 6 merge adjacent groups back together
+    for t, table in enumerate(page_data.get("tables", [])):
         content = table.get("markdown", "")
-        if len(content) > config.MIN_CHUNK_SIZE:
-            chunks.append(create_chunk_object(content, "table", base_metadata, page_num))
+        if len(content) <= config.MIN_CHUNK_SIZE:
+            continue
+        groups = split_table(content)
+        for group in groups:
+            chunks.append(create_chunk_object(group["content"], "table", {
+                **base_metadata,
+                "table_id": f"page_{page_num}_table_{t}",
+                "row_start": group["row_start"],
+                "row_end": group["row_end"],
+                "header_lines": group["header_lines"],
+                "table_parts": len(groups)
+            }, page_num))
 
     # 3. Drawings -> Independent Chunks
+    # Only the description and meaningful labels; dimensions and axis tags
+    # are in the drawing side index built by step 3
     for drawing in page_data.get("drawings", []):
-        # Construct a rich description for the drawing chunk
-        parts = []
-        if "description" in drawing:
-            parts.append(f"Описание чертежа: {drawing['description']}")
-        
-        # Add OCR content
-        if "content" in drawing:
-             # If it's a list of text boxes
-            if isinstance(drawing["content"], list):
-                texts = [item.get("text", "") for item in drawing["content"] if isinstance(item, dict)]
-                if texts:
-                    parts.append(f"Текст на чертеже: {', '.join(texts)}")
-            # If it's just text (fallback)
-            elif isinstance(drawing["content"], str):
-                parts.append(f"Текст: {drawing['content']}")
-        
-        full_content = "\n".join(parts)
+        full_content = drawing_text(drawing)
         if len(full_content) > config.MIN_CHUNK_SIZE:
             chunks.append(create_chunk_object(full_content, "drawing", base_metadata, page_num))
 
@@ -104,43 +176,36 @@ def process_page_chunks(page_data: dict) -> list:
 def run_chunking(input_dir: Path) -> Path:
     """
     Main function for Step 4: Chunking.
-    Reads assembled JSONs and outputs a flat list of chunks.
+    Reads assembled pages and outputs a flat list of chunks.
+    Returns the chunk file (all_chunks.json, or the document's artifacts.sqlite).
     """
-    # Input: final_json folder from Step 3
-    source_dir = input_dir / "final_json"
-    if not source_dir.exists():
-        print(f"Input directory {source_dir} does not exist. Run Step 3 first.")
+    # Input: assembled pages from Step 3
+    store = open_store(input_dir)
+    pages = store.pages("page")
+    if not pages:
+        print(f"No assembled pages in {store.location('page')}. Run Step 3 first.")
+        store.close()
         return None
 
-    # Output: chunks folder
-    output_dir = input_dir / "chunks"
-    output_dir.mkdir(exist_ok=True)
-
-    files = sorted(list(source_dir.glob("*.json")))
-    print(f"Generating chunks from {len(files)} documents...")
+    print(f"Generating chunks from {len(pages)} documents...")
 
     all_chunks = []
     
-    for file_path in tqdm(files, desc="Chunking"):
+    for page_num in tqdm(pages, desc="Chunking"):
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            data = store.get("page", page_num)
             
             page_chunks = process_page_chunks(data)
             all_chunks.extend(page_chunks)
             
         except Exception as e:
-            print(f"Error processing {file_path.name}: {e}")
+            print(f"Error processing page {page_num}: {e}")
 
-    # Save all chunks to a single file (good for small-medium projects)
-    # For huge projects, you might want to save batches.
-    output_file = output_dir / "all_chunks.json"
-    
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(all_chunks, f, ensure_ascii=False, indent=2)
+    # Save all chunks (chunks/all_chunks.json or the chunks table)
+    output_file = store.put_chunks(all_chunks)
+    store.close()
 
     print(f"Chunking complete. Generated {len(all_chunks)} chunks.")
     print(f"Saved to: {output_file}")
     
     return output_file
-
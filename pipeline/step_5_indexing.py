@@ -1,54 +1,53 @@
-import json
-import chromadb
-from chromadb.utils import embedding_functions
-from sentence_transformers import SentenceTransformer
 import config
 from tqdm import tqdm
-import shutil
+from pipeline.artifact_store import load_chunks, document_dir, open_store
+from pipeline.collection_registry import collection_name, register_collection
+from pipeline.section_index import load_section_index
 
-# Custom Embedding Function class to wrap SentenceTransformer for Chroma
-class LocalEmbeddingFunction(chromadb.EmbeddingFunction):
-    def __init__(self, model_name):
-        print(f"Loading embedding model: {model_name}...")
-        self.model = SentenceTransformer(model_name)
+EMBED_BATCH_SIZE = 5 # Chunks per embedding pass (small batches for local embedding)
 
-    def __call__(self, input):
-        return self.model.encode(input, batch_size=4, convert_to_tensor=False).tolist()
-
-def run_indexing(chunks_file: str):
+def run_indexing(chunks_file: str, project: str = None):
     """
     Reads chunks from JSON and indexes them into ChromaDB using a local DeepVK model.
+    Every document gets its own collection within its project (config.DEFAULT_PROJECT
+    if not given); re-indexing a document only replaces that document's collection.
     """
     if not chunks_file.exists():
         print(f"Chunks file not found: {chunks_file}")
         return
 
     print("Loading chunks...")
-    with open(chunks_file, "r", encoding="utf-8") as f:
-        chunks = json.load(f)
+    chunks = load_chunks(chunks_file)
     
     if not chunks:
         print("No chunks to index.")
         return
         
-    print(f"Loaded {len(chunks)} chunks. initializing Vector Store...")
+    project = project or config.DEFAULT_PROJECT
+    document = document_dir(chunks_file).name
+    name = collection_name(project, document)
+    print(f"Loaded {len(chunks)} chunks. initializing Vector Store (project '{project}', collection '{name}')...")
+
+    # Heavy imports (chromadb, torch) only when we actually index
+    from pipeline.embeddings import get_client, get_embedding_function
+    from pipeline.dense_retrieval import export_embedding_matrix
 
     # Initialize Chroma Client
-    client = chromadb.PersistentClient(path=str(config.CHROMA_DB_PATH))
+    client = get_client()
     
     # Initialize Embedding Function (DeepVK)
-    embedding_fn = LocalEmbeddingFunction(config.EMBEDDING_MODEL_NAME)
+    embedding_fn = get_embedding_function()
 
     # Get or Create Collection
-    # We delete the existing one to ensure a fresh index
+    # We delete this document's previous collection to ensure a fresh index
     try:
-        client.delete_collection(name=config.COLLECTION_NAME)
-        print(f"Deleted existing collection '{config.COLLECTION_NAME}'")
+        client.delete_collection(name=name)
+        print(f"Deleted existing collection '{name}'")
     except Exception:
         pass # Collection didn't exist or error deleting
 
     collection = client.create_collection(
-        name=config.COLLECTION_NAME,
+        name=name,
         embedding_function=embedding_fn
     )
 
@@ -84,8 +83,9 @@ def run_indexing(chunks_file: str):
         metadatas.append(clean_meta)
 
     # Add to Chroma in batches (to avoid memory issues)
-    batch_size = 5 # Smaller batch size for local embedding
+    batch_size = EMBED_BATCH_SIZE
     total_batches = (len(ids) + batch_size - 1) // batch_size
+    all_embeddings = [] # Kept for the dense matrix export
 
     for b in tqdm(range(total_batches), desc="Vectorizing"):
         start_idx = b * batch_size
@@ -94,12 +94,29 @@ def run_indexing(chunks_file: str):
         batch_ids = ids[start_idx:end_idx]
         batch_docs = documents[start_idx:end_idx]
         batch_meta = metadatas[start_idx:end_idx]
+
+        # Embed once ourselves so the same vectors go to Chroma and the dense matrix
+        batch_embeddings = embedding_fn(batch_docs)
+        all_embeddings.extend(batch_embeddings)
         
         collection.add(
             ids=batch_ids,
             documents=batch_docs,
-            metadatas=batch_meta
+            metadatas=batch_meta,
+            embeddings=batch_embeddings
         )
 
     print(f"Successfully indexed {len(ids)} chunks into '{config.CHROMA_DB_PATH}'")
+
+    # Export memory-mapped embedding matrix for the vectorized retrieval path
+    export_embedding_matrix(name, ids, documents, metadatas, all_embeddings)
+
+    # Section index from step 3 travels with the collection (None = not built);
+    # the drawing marks stay in the document folder, the registry keeps their path
+    with open_store(document_dir(chunks_file)) as store:
+        sections = load_section_index(store.meta_path("sections"))
+        drawing_index = store.meta_path("drawings")
+
+    register_collection(name, project, document, len(ids), sections=sections,
+                        drawing_index=str(drawing_index) if drawing_index.exists() else None)
     return config.CHROMA_DB_PATH
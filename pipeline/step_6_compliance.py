@@ -1,8 +1,13 @@
 import json
+import time
 import utils
 import config
-import chromadb
-from pipeline.step_5_indexing import LocalEmbeddingFunction
+import metrics
+import schemas
+from concurrent.futures import ThreadPoolExecutor
+from pipeline import rule_plans
+from pipeline.collection_registry import resolve_collections, list_collections, section_pages
+from pipeline.section_index import rule_section_id
 
 # --- System Prompts ---
 
@@ -43,89 +48,465 @@ VALIDATOR_PROMPT = """
 }}
 """
 
-def get_relevant_context(queries: list, n_results: int = 3) -> list:
+MAX_CONTEXT_CHARS = 10000 # Validator context budget
+
+_reranker = None
+
+def get_reranker():
     """
-    Searches ChromaDB for multiple queries and deduplicates results.
+    Lazily loads the cross-encoder used for reranking (CPU, loaded once per process).
     """
-    client = chromadb.PersistentClient(path=str(config.CHROMA_DB_PATH))
-    embedding_fn = LocalEmbeddingFunction(config.EMBEDDING_MODEL_NAME)
-    try:
-        collection = client.get_collection(name=config.COLLECTION_NAME, embedding_function=embedding_fn)
-    except:
-        print("Error: Collection not found. Run Step 5 first.")
+    global _reranker
+    if _reranker is None:
+        from sentence_transformers import CrossEncoder
+        print(f"Loading rerank model: {config.RERANK_MODEL_NAME}...")
+        _reranker = CrossEncoder(config.RERANK_MODEL_NAME, device=config.RERANK_DEVICE)
+    return _reranker
+
+def retrieve_candidates(queries: list, n_results: int = 3, query_embeddings: list = None, collections: list = None,
+                        page_filters: dict = None) -> list:
+    """
+    Searches the project's collections for multiple queries and deduplicates results.
+    Collections are searched in parallel; per query the n_results closest hits of
+    all collections are kept. Queries are embedded once for all collections
+    (not at all with compiled rule plans).
+    page_filters (collection name -> page list) limits a collection's search to
+    those pages with a metadata filter.
+    Returns a list of {"document": ..., "metadata": ..., "distance": ...} dicts in retrieval order.
+    """
+    from pipeline.embeddings import COLLECTION_NOT_FOUND, get_client, get_embedding_function
+    names = collections if collections is not None else resolve_collections()
+    if not names:
+        print("Error: No indexed collections found. Run Step 5 first.")
         return []
 
-    unique_docs = {} # Map content -> metadata
-    
-    for q in queries:
-        results = collection.query(query_texts=[q], n_results=n_results)
-        
-        ids = results['ids'][0]
-        docs = results['documents'][0]
-        metas = results['metadatas'][0]
-        
-        for i, doc in enumerate(docs):
+    client = get_client()
+    embedding_fn = get_embedding_function()
+    if not query_embeddings:
+        query_embeddings = embedding_fn(queries)
+    documents = collection_documents()
+
+    def search(name: str):
+        try:
+            collection = client.get_collection(name=name, embedding_function=embedding_fn)
+        except COLLECTION_NOT_FOUND:
+            print(f"Error: Collection '{name}' not found. Run Step 5 first.")
+            return name, None
+        pages = (page_filters or {}).get(name)
+        where = {"page_number": {"$in": pages}} if pages else None
+        return name, collection.query(query_embeddings=list(query_embeddings), n_results=n_results, where=where)
+
+    with ThreadPoolExecutor(max_workers=min(len(names), config.RETRIEVAL_FANOUT_WORKERS)) as pool:
+        shard_results = list(pool.map(search, names))
+    return merge_shards(shard_results, len(queries), n_results, documents)
+
+def merge_shards(shard_results: list, n_queries: int, n_results: int, documents: dict) -> list:
+    """
+    Merges per-collection query results [(name, results or None)]: per query
+    the n_results closest hits of all collections, deduplicated by content
+    (first, closest occurrence kept), in query order.
+    """
+    hits_per_query = [[] for _ in range(n_queries)] # (distance, document, metadata) per query
+    for name, results in shard_results:
+        if results is None:
+            continue
+        for q in range(n_queries):
+            for doc, meta, dist in zip(results['documents'][q], results['metadatas'][q], results['distances'][q]):
+                hits_per_query[q].append((dist, doc, {**meta, "collection": name, "document": documents.get(name)}))
+
+    unique_docs = {} # Map content -> (metadata, distance)
+    for hits in hits_per_query:
+        for dist, doc, meta in sorted(hits, key=lambda hit: hit[0])[:n_results]:
             if doc not in unique_docs:
-                unique_docs[doc] = metas[i]
-                
-    # Convert back to list of formatted strings
+                unique_docs[doc] = (meta, dist)
+
+    return [{"document": doc, "metadata": meta, "distance": dist} for doc, (meta, dist) in unique_docs.items()]
+
+def collection_documents() -> dict:
+    """
+    Collection name -> document name, from the registry.
+    """
+    return {name: entry.get("document") for name, entry in list_collections().items()}
+
+def merge_table_groups(candidates: list) -> list:
+    """
+    Merges retrieved row groups of the same table (step 4 table_id / row range)
+    that follow each other into one candidate, so the header is sent once.
+    The merged table takes the place of its first retrieved group.
+    """
+    def table_key(item):
+        # table_id is unique within a document only
+        return item["metadata"].get("collection"), item["metadata"].get("table_id")
+
+    groups = {}
+    for item in candidates:
+        if item["metadata"].get("table_id") is not None and item["metadata"].get("table_parts", 1) > 1:
+            groups.setdefault(table_key(item), []).append(item)
+
+    merged = {} # table_id -> merged candidates
+    for table_id, items in groups.items():
+        items = sorted(items, key=lambda item: item["metadata"].get("row_start", 0))
+        runs = [dict(items[0], metadata=dict(items[0]["metadata"]))]
+        for item in items[1:]:
+            last = runs[-1]
+            if item["metadata"].get("row_start") == last["metadata"].get("row_end", 0) + 1:
+                rows = item["document"].splitlines()[item["metadata"].get("header_lines", 0):]
+                last["document"] = "\n".join([last["document"], *rows])
+                last["metadata"]["row_end"] = item["metadata"].get("row_end")
+            else:
+                runs.append(dict(item, metadata=dict(item["metadata"])))
+        merged[table_id] = runs
+
+    result = []
+    for item in candidates:
+        key = table_key(item)
+        if key in merged:
+            result.extend(merged.pop(key))
+        elif key not in groups:
+            result.append(item)
+    return result
+
+def format_context(candidates: list) -> list:
+    """
+    Converts candidates to the formatted strings used in VALIDATOR_PROMPT.
+    Adjacent row groups of a split table are merged first. If the candidates
+    come from several documents, the document name is added to the source label.
+    """
+    several_documents = len({item["metadata"].get("document") for item in candidates}) > 1
     context_list = []
-    for doc, meta in unique_docs.items():
+    for item in merge_table_groups(candidates):
+        meta = item["metadata"]
         page = meta.get('page_number', '?')
         doc_type = meta.get('type', 'text')
-        context_list.append(f"[Стр. {page}, Тип: {doc_type}] {doc}")
+        source = f"Документ: {meta.get('document')}, Стр. {page}" if several_documents else f"Стр. {page}"
+        if meta.get("table_parts", 1) > 1:
+            context_list.append(f"[{source}, Тип: {doc_type}, строки {meta.get('row_start')}-{meta.get('row_end')}] {item['document']}")
+            continue
+        context_list.append(f"[{source}, Тип: {doc_type}] {item['document']}")
         
     return context_list
 
-def check_rule_compliance(rule_text: str):
+def get_relevant_context(queries: list, n_results: int = 3, collections: list = None) -> list:
     """
-    Main agent loop for a single rule.
+    Searches ChromaDB for multiple queries and returns formatted context strings.
+    """
+    return format_context(retrieve_candidates(queries, n_results, collections=collections))
+
+def rerank_candidates(rule_text: str, candidates: list, top_k: int) -> tuple:
+    """
+    Scores (rule, candidate) pairs with the cross-encoder and keeps the top_k.
+    Returns (kept_candidates, stats).
+    """
+    if not candidates:
+        return [], {"candidates": 0, "kept": 0, "latency_ms": 0.0}
+
+    model = get_reranker()
+    pairs = [(rule_text, item["document"]) for item in candidates]
+
+    start = time.perf_counter()
+    scores = model.predict(pairs, batch_size=config.RERANK_BATCH_SIZE, show_progress_bar=False)
+    latency_ms = (time.perf_counter() - start) * 1000
+
+    ranked = sorted(zip(candidates, scores), key=lambda pair: float(pair[1]), reverse=True)
+    kept = []
+    for item, score in ranked[:top_k]:
+        kept.append({**item, "rerank_score": float(score)})
+
+    stats = {
+        "candidates": len(candidates),
+        "kept": len(kept),
+        "latency_ms": round(latency_ms, 1),
+    }
+    return kept, stats
+
+def ask_llm_json(prompt: str, schema: dict, label: str = "LLM") -> tuple:
+    """
+    Calls the text LLM for a JSON answer matching `schema`, streaming with early
+    stop if enabled. An invalid answer re-asks this call only (utils.request_json).
+    Returns (value, timings of the last attempt or None); raises ValueError if
+    no valid answer was received.
+    """
+    timings = {}
+
+    def send(attempt_prompt: str, attempt_schema: dict) -> str:
+        if not config.LLM_STREAM_JSON:
+            return utils.call_llm_text(attempt_prompt, schema=attempt_schema)
+        response, timings["last"] = utils.call_llm_json_stream(
+            attempt_prompt, expect="[" if schema["type"] == "array" else "{",
+            accept=lambda value: schemas.is_valid(value, schema), schema=attempt_schema
+        )
+        t = timings["last"]
+        print(f"  {label}: TTFT {t['ttft_ms']} ms, total {t['total_ms']} ms"
+              f"{' (early stop)' if t['early_stop'] else ''}")
+        return response
+
+    value = utils.request_json(send, prompt, schema)
+    return value, timings.get("last")
+
+def generate_queries(rule_text: str) -> tuple:
+    """
+    Asks the LLM (GENERATOR_PROMPT) for search queries for a rule.
+    Falls back to the rule text itself. Returns (queries, timings, generated) -
+    generated is False for the fallback, which must not be compiled into a plan.
     """
-    print(f"\nChecking Rule: {rule_text[:50]}...")
-    
-    # 1. Generate Queries
-    print("  Thinking about search queries...")
     gen_prompt = GENERATOR_PROMPT.format(rule=rule_text)
-    response = utils.call_llm_text(gen_prompt)
-    
+    timings = None
     try:
-        queries = utils.parse_json_from_response(response)
-        if not isinstance(queries, list): raise ValueError
-    except:
+        with metrics.tags(stage="query_generation"):
+            queries, timings = ask_llm_json(gen_prompt, schemas.QUERIES_SCHEMA, label="Generator")
+    except ValueError:
         print("  Failed to parse queries, using rule text as query.")
-        queries = [rule_text]
-        
-    print(f"  Generated Queries: {queries}")
-    
-    # 2. Retrieve Context
-    print("  Searching database...")
-    context_items = get_relevant_context(queries)
-    
-    if not context_items:
+        return [rule_text], timings, False
+
+    return queries, timings, True
+
+def plan_rule(rule_text: str) -> dict:
+    """
+    Step 1 of the agent loop: search queries (compiled plan or GENERATOR_PROMPT).
+    Returns {"queries", "embeddings" (or None), "timings" (or None)}.
+    """
+    plan = rule_plans.find_plan(rule_text)
+    if plan:
+        print("  Using compiled query plan.")
+        return {"queries": plan["queries"], "embeddings": plan.get("embeddings"), "timings": None}
+
+    print("  Thinking about search queries...")
+    queries, timings, _ = generate_queries(rule_text)
+    return {"queries": queries, "embeddings": None, "timings": timings}
+
+def dense_retrieve_batch(query_plans: list, n_results: int, collections: list = None, page_filters: dict = None) -> list:
+    """
+    Vectorized retrieval for many rules at once: all queries of all rules are
+    scored against each collection's exported embedding matrix in a single matmul
+    (collections in parallel), and the n_results closest hits per query are merged.
+    page_filters (collection name -> page list) restricts a collection to those pages.
+    Returns one deduplicated candidate list per plan.
+    """
+    from pipeline.dense_retrieval import DenseIndex
+    names = collections if collections is not None else resolve_collections()
+    if not names:
+        print("Error: No indexed collections found. Run Step 5 first.")
+        return [[] for _ in query_plans]
+    documents = collection_documents()
+
+    # Embed every query that has no precomputed embedding in one pass
+    missing = [q for plan in query_plans if not plan["embeddings"] for q in plan["queries"]]
+    missing_embeddings = iter([])
+    if missing:
+        from pipeline.embeddings import get_embedding_function
+        missing_embeddings = iter(get_embedding_function()(missing))
+
+    all_embeddings = []
+    owners = [] # row -> plan index
+    for plan_idx, plan in enumerate(query_plans):
+        embeddings = plan["embeddings"] or [next(missing_embeddings) for _ in plan["queries"]]
+        all_embeddings.extend(embeddings)
+        owners.extend([plan_idx] * len(embeddings))
+
+    if not all_embeddings:
+        return [[] for _ in query_plans]
+
+    def search(name: str):
+        try:
+            index = DenseIndex.load(name)
+        except FileNotFoundError as e:
+            print(f"Error: {e}")
+            return None
+        pages = (page_filters or {}).get(name)
+        rows = index.rows_on_pages(pages) if pages else None
+        indices, distances = index.search(all_embeddings, n_results, rows)
+        return [
+            [(float(dist), index.documents[idx], {**index.metadatas[idx], "collection": name, "document": documents.get(name)})
+             for idx, dist in zip(row_indices, row_distances)]
+            for row_indices, row_distances in zip(indices, distances)
+        ]
+
+    with ThreadPoolExecutor(max_workers=min(len(names), config.RETRIEVAL_FANOUT_WORKERS)) as pool:
+        shard_hits = [hits for hits in pool.map(search, names) if hits is not None]
+
+    unique_per_plan = [{} for _ in query_plans] # content -> (metadata, distance), in retrieval order
+    for row, plan_idx in enumerate(owners):
+        hits = [hit for shard in shard_hits for hit in shard[row]]
+        for dist, doc, meta in sorted(hits, key=lambda hit: hit[0])[:n_results]:
+            if doc not in unique_per_plan[plan_idx]:
+                unique_per_plan[plan_idx][doc] = (meta, dist)
+
+    return [
+        [{"document": doc, "metadata": meta, "distance": dist} for doc, (meta, dist) in unique_docs.items()]
+        for unique_docs in unique_per_plan
+    ]
+
+def validate_rule(rule_text: str, candidates: list, gen_timings: dict = None) -> dict:
+    """
+    Steps 2.1-3 of the agent loop: optional rerank, then VALIDATOR_PROMPT.
+    """
+    if not candidates:
         return {
             "status": "НЕ НАЙДЕНО",
             "reason": "База знаний не вернула релевантных данных по запросам.",
             "evidence": None
         }
-    
+
+    # 2.1 Optional Rerank (shrinks the validator prompt)
+    rerank_stats = None
+    if config.RERANK_ENABLED:
+        # Savings are measured before truncation: the cut would hide what rerank dropped
+        all_context = "\n\n".join(format_context(candidates))
+        candidates, rerank_stats = rerank_candidates(rule_text, candidates, config.RERANK_TOP_K)
+
     # Join context for LLM (limit length roughly)
-    full_context = "\n\n".join(context_items)[:10000] # Limit to avoid context overflow
-    
+    full_context = "\n\n".join(format_context(candidates))
+
+    if rerank_stats is not None:
+        rerank_stats["prompt_tokens_saved"] = utils.estimate_tokens(all_context) - utils.estimate_tokens(full_context)
+
     # 3. Validate
     print("  Analysing evidence...")
-    val_prompt = VALIDATOR_PROMPT.format(rule=rule_text, context=full_context)
-    val_response = utils.call_llm_text(val_prompt)
-    
+    val_prompt = VALIDATOR_PROMPT.format(rule=rule_text, context=full_context[:MAX_CONTEXT_CHARS]) # Limit to avoid context overflow
+
+    if rerank_stats is not None:
+        print(f"  Rerank: kept {rerank_stats['kept']}/{rerank_stats['candidates']} candidates "
+              f"in {rerank_stats['latency_ms']} ms, ~{rerank_stats['prompt_tokens_saved']} prompt tokens saved")
+
+    val_timings = None
     try:
-        result = utils.parse_json_from_response(val_response)
-        return result
-    except:
-        return {
+        with metrics.tags(stage="validation"):
+            result, val_timings = ask_llm_json(val_prompt, schemas.VERDICT_SCHEMA, label="Validator")
+    except ValueError as e:
+        result = {
             "status": "ERROR",
             "reason": "Ошибка парсинга ответа LLM",
-            "raw_response": val_response
+            "raw_response": getattr(e, "response_text", "")
         }
 
+    if isinstance(result, dict):
+        if rerank_stats is not None:
+            result["rerank"] = rerank_stats
+        if config.LLM_STREAM_JSON:
+            result["timings"] = {"generator": gen_timings, "validator": val_timings}
+    return result
+
+def candidates_per_query() -> int:
+    return config.RERANK_CANDIDATES_PER_QUERY if config.RERANK_ENABLED else 3
+
+def section_scopes(rule_sections: list, collections: list) -> list:
+    """
+    Per rule, where its P87 section is in the collections (see
+    collection_registry.section_pages): None if the rule isn't limited to a
+    section, {} if the section is missing from the project.
+    """
+    scopes = []
+    cache = {}
+    for section in rule_sections:
+        section_id = rule_section_id(section) if config.SECTION_INDEX_ENABLED and collections else None
+        if section_id is None:
+            scopes.append(None)
+            continue
+        if section_id not in cache:
+            cache[section_id] = section_pages(section_id, collections)
+        scopes.append(cache[section_id])
+    return scopes
+
+def missing_section_result(section: str) -> dict:
+    return {
+        "status": "НЕ НАЙДЕНО",
+        "reason": f"Раздел «{section}» отсутствует в документации проекта (по индексу разделов).",
+        "evidence": None,
+        "section_missing": True
+    }
+
+def check_rule_compliance(rule_text: str, collections: list = None, page_filters: dict = None):
+    """
+    Main agent loop for a single rule.
+    Searches the given collections (default: all of config.DEFAULT_PROJECT),
+    limited to the pages in page_filters (collection name -> pages) if given.
+    """
+    print(f"\nChecking Rule: {rule_text[:50]}...")
+    
+    # 1. Generate Queries (or take them from the compiled rule plan)
+    plan = plan_rule(rule_text)
+    print(f"  Generated Queries: {plan['queries']}")
+    
+    # 2. Retrieve Context
+    print("  Searching database...")
+    if config.RETRIEVAL_BACKEND == "numpy":
+        candidates = dense_retrieve_batch([plan], candidates_per_query(), collections, page_filters)[0]
+    else:
+        candidates = retrieve_candidates(plan["queries"], n_results=candidates_per_query(),
+                                         query_embeddings=plan["embeddings"], collections=collections,
+                                         page_filters=page_filters)
+    
+    return validate_rule(rule_text, candidates, plan["timings"])
+
+def check_rules_compliance(rule_texts: list, rule_ids: list = None, project: str = None, collections: list = None,
+                           rule_sections: list = None):
+    """
+    Audit loop over many rules. Yields one result per rule, in order.
+    With the numpy backend, retrieval for the whole audit is one batched search per P87 section.
+    rule_ids (optional) are used to tag model-call metrics.
+    Only the collections of `project` (or the given collection names) are searched.
+    rule_sections (optional, the rules' "section" fields): rules of sections the
+    project doesn't contain are resolved as "НЕ НАЙДЕНО" without any LLM call,
+    the others only search the pages of their section.
+    """
+    rule_ids = rule_ids or [None] * len(rule_texts)
+    collections = resolve_collections(project, collections)
+    print(f"Searching {len(collections)} collection(s) of project '{project or config.DEFAULT_PROJECT}'")
+
+    scopes = section_scopes(rule_sections or [None] * len(rule_texts), collections)
+    missing = sorted({section for section, scope in zip(rule_sections or [], scopes) if scope == {}})
+    if missing:
+        skipped = sum(1 for scope in scopes if scope == {})
+        print(f"Sections missing from the project: {'; '.join(missing)}. {skipped} rule(s) resolved without LLM calls.")
+
+    def scope_args(scope):
+        # (collections, page_filters) for a rule's section scope
+        if scope is None:
+            return collections, None
+        return [name for name in collections if name in scope], scope
+
+    if config.RETRIEVAL_BACKEND != "numpy":
+        for rule_text, rule_id, section, scope in zip(rule_texts, rule_ids, rule_sections or [None] * len(rule_texts), scopes):
+            if scope == {}:
+                yield missing_section_result(section)
+                continue
+            with metrics.tags(rule_id=rule_id):
+                result = check_rule_compliance(rule_text, *scope_args(scope))
+            yield result
+        return
+
+    query_plans = {}
+    for i, (rule_text, rule_id, scope) in enumerate(zip(rule_texts, rule_ids, scopes)):
+        if scope == {}:
+            continue
+        print(f"\nPlanning Rule: {rule_text[:50]}...")
+        with metrics.tags(rule_id=rule_id):
+            query_plans[i] = plan_rule(rule_text)
+
+    # One batched search per distinct section scope
+    groups = {}
+    for i in query_plans:
+        key = json.dumps(scopes[i], sort_keys=True)
+        groups.setdefault(key, []).append(i)
+
+    print(f"\nSearching dense index for {sum(len(p['queries']) for p in query_plans.values())} queries...")
+    start = time.perf_counter()
+    all_candidates = {}
+    for indices in groups.values():
+        group_candidates = dense_retrieve_batch([query_plans[i] for i in indices], candidates_per_query(),
+                                                *scope_args(scopes[indices[0]]))
+        all_candidates.update(zip(indices, group_candidates))
+    print(f"Batched retrieval took {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for i, (rule_text, rule_id) in enumerate(zip(rule_texts, rule_ids)):
+        if i not in query_plans:
+            yield missing_section_result(rule_sections[i])
+            continue
+        print(f"\nChecking Rule: {rule_text[:50]}...")
+        with metrics.tags(rule_id=rule_id):
+            result = validate_rule(rule_text, all_candidates[i], query_plans[i]["timings"])
+        yield result
+
 if __name__ == "__main__":
     # Test with a dummy rule
     test_rule = "В пояснительной записке должны быть указаны реквизиты договора на выполнение проектных работ."
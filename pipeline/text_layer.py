@@ -0,0 +1,168 @@
+import json
+import subprocess
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from PIL import Image, ImageChops, ImageDraw
+import config
+import image_prep
+
+# Native text layer of CAD/Word-exported PDFs. Poppler's `pdftotext -bbox-layout`
+# gives every word with its bounding box; layout blocks that are well covered by
+# these words don't need a VLM OCR call.
+
+WORD_PADDING = 3  # Pixels added around word boxes when measuring ink coverage
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+def parse_bbox_layout(xhtml_path: Path) -> list:
+    """
+    Parses pdftotext -bbox-layout output into one dict per page:
+    {"width", "height", "words": [{"text", "box", "block", "line"}]} with boxes
+    normalized to [ymin, xmin, ymax, xmax] in 0-1000 (same as the layout analysis).
+    """
+    tree = ET.parse(xhtml_path)
+    pages = []
+    for page_el in tree.iter():
+        if _local(page_el.tag) != "page":
+            continue
+        width = float(page_el.get("width"))
+        height = float(page_el.get("height"))
+        words = []
+        block_id = 0
+        line_id = 0
+        for block_el in page_el.iter():
+            if _local(block_el.tag) != "block":
+                continue
+            block_id += 1
+            for line_el in block_el:
+                if _local(line_el.tag) != "line":
+                    continue
+                line_id += 1
+                for word_el in line_el:
+                    if _local(word_el.tag) != "word" or not (word_el.text or "").strip():
+                        continue
+                    words.append({
+                        "text": word_el.text.strip(),
+                        "box": [
+                            round(float(word_el.get("yMin")) / height * 1000, 2),
+                            round(float(word_el.get("xMin")) / width * 1000, 2),
+                            round(float(word_el.get("yMax")) / height * 1000, 2),
+                            round(float(word_el.get("xMax")) / width * 1000, 2)
+                        ],
+                        "block": block_id,
+                        "line": line_id
+                    })
+        pages.append({"width": width, "height": height, "words": words})
+    return pages
+
+def extract_text_layer(pdf_path: Path, output_dir: Path) -> Path:
+    """
+    Step 0 fast path: saves the PDF's native words per page as text_layer/page_N.json.
+    Pages without a text layer get an empty word list. Returns the folder, or None
+    if poppler's pdftotext is not available.
+    """
+    layer_dir = output_dir / "text_layer"
+    layer_dir.mkdir(exist_ok=True)
+    xhtml_path = layer_dir / "bbox_layout.html"
+
+    try:
+        subprocess.run(
+            ["pdftotext", "-bbox-layout", str(pdf_path), str(xhtml_path)],
+            check=True, capture_output=True
+        )
+    except (FileNotFoundError, subprocess.CalledProcessError) as e:
+        print(f"Native text layer not extracted ({e}). All blocks will use the VLM.")
+        return None
+
+    pages = parse_bbox_layout(xhtml_path)
+    with_text = 0
+    for i, page in enumerate(pages):
+        if page["words"]:
+            with_text += 1
+        with open(layer_dir / f"page_{i + 1}.json", "w", encoding="utf-8") as f:
+            json.dump(page, f, ensure_ascii=False)
+    xhtml_path.unlink()
+
+    print(f"Native text layer: {with_text}/{len(pages)} pages have embedded text.")
+    return layer_dir
+
+def load_page_text_layer(images_dir: Path, page_stem: str):
+    """
+    Returns the saved text layer of a page (or None).
+    """
+    path = images_dir / "text_layer" / f"{page_stem}.json"
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        page = json.load(f)
+    return page if page.get("words") else None
+
+def words_in_box(page_layer: dict, box: list) -> list:
+    """
+    Words whose center lies inside a normalized [ymin, xmin, ymax, xmax] box.
+    """
+    ymin, xmin, ymax, xmax = box
+    inside = []
+    for word in page_layer["words"]:
+        wy0, wx0, wy1, wx1 = word["box"]
+        cy, cx = (wy0 + wy1) / 2, (wx0 + wx1) / 2
+        if ymin <= cy <= ymax and xmin <= cx <= xmax:
+            inside.append(word)
+    return inside
+
+def ink_coverage(cropped_image: Image.Image, box: list, words: list) -> float:
+    """
+    Share of the crop's ink pixels that fall inside native word boxes.
+    Close to 1.0 means the text layer explains everything visible in the block.
+    """
+    ink = image_prep.ink_mask(cropped_image)
+    total_ink = ink.histogram()[255]
+    if total_ink == 0:
+        return 1.0
+
+    ymin, xmin, ymax, xmax = box
+    sx = cropped_image.width / max(1e-6, xmax - xmin)
+    sy = cropped_image.height / max(1e-6, ymax - ymin)
+    word_mask = Image.new("L", cropped_image.size, 0)
+    draw = ImageDraw.Draw(word_mask)
+    for word in words:
+        wy0, wx0, wy1, wx1 = word["box"]
+        draw.rectangle([
+            (wx0 - xmin) * sx - WORD_PADDING, (wy0 - ymin) * sy - WORD_PADDING,
+            (wx1 - xmin) * sx + WORD_PADDING, (wy1 - ymin) * sy + WORD_PADDING
+        ], fill=255)
+
+    covered = ImageChops.multiply(ink, word_mask).histogram()[255]
+    return covered / total_ink
+
+def words_to_text(words: list) -> str:
+    """
+    Rebuilds text from words: lines joined by newlines, pdftotext blocks by blank lines.
+    """
+    parts = []
+    last_block, last_line = None, None
+    for word in words:
+        if last_block is not None and word["block"] != last_block:
+            parts.append("\n\n")
+        elif last_line is not None and word["line"] != last_line:
+            parts.append("\n")
+        elif parts:
+            parts.append(" ")
+        parts.append(word["text"])
+        last_block, last_line = word["block"], word["line"]
+    return "".join(parts)
+
+def native_block_text(page_layer: dict, box: list, cropped_image: Image.Image):
+    """
+    Returns the block's text from the native text layer if it covers the block
+    well enough (config.TEXT_LAYER_MIN_COVERAGE), otherwise None.
+    """
+    if not page_layer:
+        return None
+    words = words_in_box(page_layer, box)
+    if not words:
+        return None
+    if ink_coverage(cropped_image, box, words) < config.TEXT_LAYER_MIN_COVERAGE:
+        return None
+    return words_to_text(words)
@@ -0,0 +1,338 @@
+import math
+import re
+from pathlib import Path
+from PIL import Image
+import config
+import image_prep
+import metrics
+
+# Dry-run capacity planner (--plan): expected model requests per stage and
+# block type, image pixels / tokens, embedding passes, cache hits and the
+# projected wall time from the latencies recorded by earlier runs.
+# Reads PDFs, page images, cached artifacts and the rules file only - no model calls.
+
+POINTS_PER_INCH = 72
+A4_POINTS = (595.0, 842.0)
+
+# Blocks per page (count, share of the page area) when no layout of any document exists yet
+DEFAULT_PAGE_BLOCKS = {
+    "title_block": (1.0, 0.03),
+    "header": (1.0, 0.01),
+    "text_block": (2.0, 0.08),
+    "table": (0.5, 0.2),
+    "drawing": (0.5, 0.3)
+}
+QUERIES_PER_RULE = 3     # GENERATOR_PROMPT asks for 3 queries
+CHUNKS_PER_PAGE = 3.0    # Fallback when no document has been chunked yet
+
+class Plan:
+    """
+    Expected requests per row (stage or stage/block type) of a run.
+    """
+    def __init__(self, title: str):
+        self.title = title
+        self.rows = {} # row -> {"requests", "cached", "pixels", "tokens"}
+        self.sequential = set() # rows whose requests run one after another
+        self.embedded_texts = 0 # texts passed through the embedding model
+        self.embedding_passes = 0
+        self.notes = []
+
+    def add(self, stage: str, block_type: str = None, requests: float = 0, cached: float = 0,
+            sizes: list = (), sequential: bool = False):
+        """
+        Adds `requests` calls of a class; `sizes` are the (width, height) of the images of one call.
+        """
+        row = f"{stage}/{block_type}" if block_type else stage
+        entry = self.rows.setdefault(row, {"requests": 0.0, "cached": 0.0, "pixels": 0.0, "tokens": 0.0,
+                                           "key": block_type or stage})
+        entry["requests"] += requests
+        entry["cached"] += cached
+        entry["pixels"] += requests * sum(w * h for w, h in sizes)
+        entry["tokens"] += requests * sum(image_prep.image_tokens(w, h) for w, h in sizes)
+        if sequential:
+            self.sequential.add(row)
+
+def pdf_info(pdf_path: Path) -> tuple:
+    """
+    (page count, page size in points) of a PDF, via poppler's pdfinfo if
+    available, else from the page objects in the raw file (A4 assumed).
+    """
+    try:
+        from pdf2image import pdfinfo_from_path
+        info = pdfinfo_from_path(pdf_path)
+        match = re.match(r"([\d.]+) x ([\d.]+)", info.get("Page size", ""))
+        size = (float(match.group(1)), float(match.group(2))) if match else A4_POINTS
+        return int(info["Pages"]), size
+    except Exception:
+        pages = len(re.findall(rb"/Type\s*/Page(?![a-zA-Z])", Path(pdf_path).read_bytes()))
+        return pages, A4_POINTS
+
+def page_image_size(doc_dir: Path, page: int, pdf_size: tuple) -> tuple:
+    image_path = doc_dir / f"page_{page}.{config.IMAGE_FORMAT}"
+    if image_path.exists():
+        with Image.open(image_path) as img:
+            return img.size
+    return tuple(round(side / POINTS_PER_INCH * config.IMAGE_DPI) for side in pdf_size)
+
+def block_size(page_size: tuple, box: list) -> tuple:
+    ymin, xmin, ymax, xmax = box
+    return (max(1, round((xmax - xmin) / 1000 * page_size[0])), max(1, round((ymax - ymin) / 1000 * page_size[1])))
+
+def open_existing_store(doc_dir: Path):
+    """
+    The document's artifact store, or None if nothing was processed yet
+    (the planner must not create folders or databases).
+    """
+    from pipeline.artifact_store import open_store, SQLITE_FILENAME
+    if not doc_dir.exists():
+        return None
+    if config.ARTIFACT_BACKEND == "sqlite" and not (doc_dir / SQLITE_FILENAME).exists():
+        return None
+    return open_store(doc_dir)
+
+def layout_statistics() -> dict:
+    """
+    Average blocks per page (count, area share) per block type over all cached
+    layouts in the output folder, DEFAULT_PAGE_BLOCKS if there are none.
+    """
+    counts, areas, pages = {}, {}, 0
+    output_path = Path(config.OUTPUT_PATH)
+    doc_dirs = sorted(p for p in output_path.iterdir() if p.is_dir()) if output_path.exists() else []
+    for doc_dir in doc_dirs:
+        store = open_existing_store(doc_dir)
+        if store is None:
+            continue
+        with store:
+            for page in store.pages("layout"):
+                pages += 1
+                for block in store.get("layout", page) or []:
+                    if isinstance(block, dict) and block.get("box") and "content" not in block:
+                        ymin, xmin, ymax, xmax = block["box"]
+                        counts[block.get("type")] = counts.get(block.get("type"), 0) + 1
+                        areas[block.get("type")] = areas.get(block.get("type"), 0.0) + (ymax - ymin) * (xmax - xmin) / 1e6
+    if not pages:
+        return DEFAULT_PAGE_BLOCKS
+    return {t: (counts[t] / pages, areas[t] / counts[t]) for t in counts}
+
+def plan_blocks(plan: Plan, blocks: list, page_size: tuple):
+    """
+    Step 2 requests of one page from its (planned) layout blocks: (type, box) pairs.
+    Small text blocks are packed into text_batch calls as in step 2.
+    """
+    from pipeline.step_2_targeted_extraction import is_batchable, select_prompt
+
+    batch = []
+    for block_type, box in blocks:
+        if not select_prompt(block_type):
+            continue
+        profile = config.IMAGE_PROFILES.get(block_type) if config.IMAGE_PREP_ENABLED else None
+        size = image_prep.planned_size(block_size(page_size, box), profile)
+        if is_batchable(block_type, box):
+            batch.append((block_type, size))
+            continue
+        plan.add("extraction", block_type, requests=1, sizes=[size])
+
+    for start in range(0, len(batch), config.BATCH_MAX_BLOCKS):
+        group = batch[start : start + config.BATCH_MAX_BLOCKS]
+        if len(group) == 1:
+            plan.add("extraction", group[0][0], requests=1, sizes=[group[0][1]])
+        else:
+            profile = config.IMAGE_PROFILES.get("text_batch") if config.IMAGE_PREP_ENABLED else None
+            plan.add("extraction", "text_batch", requests=1,
+                     sizes=[image_prep.planned_size(size, profile) for _, size in group])
+
+def planned_page_blocks(stats: dict, carry: dict) -> list:
+    """
+    Expected (type, box) blocks of a page without a layout, from the layout statistics.
+    Fractional counts accumulate in `carry` across pages (0.5 tables per page ->
+    a table on every second page).
+    """
+    blocks = []
+    for block_type, (count, area) in stats.items():
+        carry[block_type] = carry.get(block_type, 0.0) + count
+        whole = int(carry[block_type])
+        carry[block_type] -= whole
+        side = round(math.sqrt(area) * 1000)
+        blocks.extend([(block_type, [0, 0, side, side])] * whole)
+    return blocks
+
+def plan_document(plan: Plan, pdf_path: Path, stats: dict):
+    """
+    Steps 1, 2 and 5 of one PDF: cached pages count as hits, the rest as requests.
+    """
+    from pipeline.page_routing import route_page
+    from pipeline.text_layer import load_page_text_layer
+    from pipeline.step_4_chunking import process_page_chunks
+
+    doc_dir = Path(config.OUTPUT_PATH) / pdf_path.stem
+    page_count, pdf_size = pdf_info(pdf_path)
+    images = sorted(doc_dir.glob(f"page_*.{config.IMAGE_FORMAT}")) if doc_dir.exists() else []
+    page_count = max(page_count, len(images))
+    if not page_count:
+        plan.notes.append(f"{pdf_path.name}: page count unknown (no poppler, compressed page tree).")
+        return
+
+    store = open_existing_store(doc_dir)
+    cached_layout = set(store.pages("layout")) if store else set()
+    cached_extraction = set(store.pages("extraction")) if store else set()
+    cached_pages = set(store.pages("page")) if store else set()
+    carry = {}
+    unrouted = 0
+    chunks = 0
+
+    for page in range(1, page_count + 1):
+        page_size = page_image_size(doc_dir, page, pdf_size)
+        page_call = [image_prep.baseline_size(page_size)]
+
+        # --- Step 1 ---
+        route = "targeted"
+        layout = None
+        if page in cached_layout:
+            layout = store.get("layout", page) or []
+            route = "single_pass" if any("content" in block for block in layout if isinstance(block, dict)) else "targeted"
+            plan.add("single_pass" if route == "single_pass" else "layout", cached=1, sequential=True)
+        else:
+            image_path = doc_dir / f"page_{page}.{config.IMAGE_FORMAT}"
+            if config.SINGLE_PASS_ROUTING and image_path.exists():
+                text_layer = load_page_text_layer(doc_dir, image_path.stem) if config.TEXT_LAYER_ENABLED else None
+                route, _ = route_page(image_path, text_layer)
+            elif config.SINGLE_PASS_ROUTING:
+                unrouted += 1
+            plan.add("single_pass" if route == "single_pass" else "layout", requests=1, sizes=page_call, sequential=True)
+
+        # --- Step 2 ---
+        if page in cached_extraction:
+            extracted = store.get("extraction", page) or []
+            for block in extracted:
+                if block.get("source") not in ("single_pass", "text_layer") and not block.get("reused"):
+                    plan.add("extraction", block.get("type"), cached=1)
+        elif layout is not None:
+            plan_blocks(plan, [(b["type"], b["box"]) for b in layout
+                               if isinstance(b, dict) and b.get("type") and b.get("box") and "content" not in b], page_size)
+        else:
+            planned_blocks = planned_page_blocks(stats, carry)
+            if route == "single_pass":
+                # Text, headers and the title block come with the single-pass answer
+                planned_blocks = [(t, box) for t, box in planned_blocks if t in ("table", "drawing")]
+            plan_blocks(plan, planned_blocks, page_size)
+
+        # --- Steps 4-5 ---
+        if page in cached_pages:
+            chunks += len(process_page_chunks(store.get("page", page)))
+        else:
+            chunks += CHUNKS_PER_PAGE
+
+    if store:
+        store.close()
+
+    from pipeline.step_5_indexing import EMBED_BATCH_SIZE
+    plan.embedded_texts += round(chunks)
+    plan.embedding_passes += math.ceil(chunks / EMBED_BATCH_SIZE)
+    cached_note = f", {len(cached_layout)} with cached layout, {len(cached_extraction)} with cached extraction"
+    plan.notes.append(f"{pdf_path.name}: {page_count} pages{cached_note}.")
+    if unrouted:
+        plan.notes.append(f"{pdf_path.name}: {unrouted} pages not rendered yet, planned as targeted (no single-pass routing).")
+
+def plan_ingest(pdf_files: list) -> Plan:
+    """
+    Plan of steps 0-5 for the given PDFs.
+    """
+    plan = Plan(f"ingest of {', '.join(p.name for p in pdf_files)}")
+    stats = layout_statistics()
+    for pdf_path in pdf_files:
+        plan_document(plan, Path(pdf_path), stats)
+    plan.notes.append("Block reuse and native text layer hits are not predicted: step 2 requests are an upper bound.")
+    return plan
+
+def plan_audit(rules: list, project: str = None) -> Plan:
+    """
+    Plan of an audit over `rules` for a project: compiled rule plans and rules
+    of sections missing from the project are cache hits.
+    """
+    from pipeline import rule_plans
+    from pipeline.collection_registry import resolve_collections
+    from pipeline.step_6_compliance import section_scopes
+
+    plan = Plan(f"audit of {len(rules)} rules (project '{project or config.DEFAULT_PROJECT}')")
+    collections = resolve_collections(project)
+    scopes = section_scopes([rule.get("section") for rule in rules], collections)
+    skipped = 0
+    for rule, scope in zip(rules, scopes):
+        if scope == {}:
+            skipped += 1
+            plan.add("query_generation", cached=1, sequential=True)
+            plan.add("validation", cached=1, sequential=True)
+            continue
+        compiled = rule_plans.find_plan(rule.get("text", ""))
+        if compiled:
+            plan.add("query_generation", cached=1, sequential=True)
+            if not compiled.get("embeddings"):
+                plan.embedded_texts += len(compiled["queries"])
+        else:
+            plan.add("query_generation", requests=1, sequential=True)
+            plan.embedded_texts += QUERIES_PER_RULE
+        plan.add("validation", requests=1, sequential=True)
+
+    if plan.embedded_texts:
+        # numpy backend: one embedding pass for the whole audit, chroma: one per rule
+        plan.embedding_passes = 1 if config.RETRIEVAL_BACKEND == "numpy" else len(rules) - skipped
+    if not collections:
+        plan.notes.append(f"Project '{project or config.DEFAULT_PROJECT}' has no indexed collections.")
+    if skipped:
+        plan.notes.append(f"{skipped} rules belong to sections missing from the project (resolved without calls).")
+    if config.RERANK_ENABLED:
+        plan.notes.append("Cross-encoder reranking runs locally once per rule (not in the projection).")
+    return plan
+
+def format_duration(seconds: float) -> str:
+    hours, rest = divmod(int(round(seconds)), 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {secs:02d}s"
+
+def print_plan(plan: Plan, concurrency: int = None):
+    """
+    Prints the plan with the projected wall time: sequential rows add up,
+    the other rows (step 2 blocks) run on `concurrency` workers.
+    """
+    concurrency = concurrency or config.EXTRACTION_CONCURRENCY
+    latencies = metrics.recorded_latencies()
+    mean = {key: sum(values) / len(values) for key, values in latencies.items() if values}
+
+    print(f"\n--- Run Plan: {plan.title} ---")
+    print(f"{'stage / block type':<28}{'requests':>10}{'cached':>8}{'Mpx':>8}{'image tok':>11}{'mean s':>8}{'projected s':>13}")
+    sequential_s = parallel_s = 0.0
+    total_requests = total_cached = total_tokens = 0.0
+    missing = []
+    for row, entry in sorted(plan.rows.items()):
+        latency = mean.get(entry["key"])
+        projected = entry["requests"] * latency if latency is not None else None
+        if projected is None and entry["requests"]:
+            missing.append(row)
+        elif projected is not None and row in plan.sequential:
+            sequential_s += projected
+        elif projected is not None:
+            parallel_s += projected
+        total_requests += entry["requests"]
+        total_cached += entry["cached"]
+        total_tokens += entry["tokens"]
+        latency_text = f"{latency:.2f}" if latency is not None else "-"
+        projected_text = f"{projected:.1f}" if projected is not None else "-"
+        print(f"{row:<28}{entry['requests']:>10.0f}{entry['cached']:>8.0f}{entry['pixels'] / 1e6:>8.1f}{entry['tokens']:>11.0f}"
+              f"{latency_text:>8}{projected_text:>13}")
+
+    total = total_requests + total_cached
+    print(f"{'TOTAL':<28}{total_requests:>10.0f}{total_cached:>8.0f}{'':>8}{total_tokens:>11.0f}")
+    print(f"Cache hit rate: {total_cached / total:.0%} ({total_cached:.0f} of {total:.0f} requests cached)" if total
+          else "Nothing to do.")
+    if plan.embedded_texts:
+        print(f"Embedding: {plan.embedded_texts} texts in {plan.embedding_passes} passes (not in the projection)")
+
+    wall_s = sequential_s + parallel_s / max(1, concurrency)
+    history = sum(len(values) for values in latencies.values())
+    at_concurrency = f" at concurrency {concurrency}" if parallel_s else ""
+    print(f"Projected wall time: {format_duration(wall_s)}{at_concurrency} "
+          f"(latency history: {history} calls in {config.METRICS_PATH})")
+    if missing:
+        print(f"No recorded latency for: {', '.join(missing)} (not in the projection)")
+    for note in plan.notes:
+        print(f"Note: {note}")
@@ -23,6 +23,34 @@ LAYOUT_ANALYSIS_PROMPT = """
 Верни ТОЛЬКО валидный JSON список. Не добавляй никаких пояснений.
 """
 
+# Простые (текстовые) страницы: разметка и содержимое за один проход
+PAGE_SINGLE_PASS_PROMPT = """
+Это страница строительной документации. За один проход определи блоки страницы и распознай их содержимое.
+Типы блоков:
+1. "title_block" - штамп (обычно внизу справа или внизу страницы).
+2. "table" - любые таблицы, спецификации, ведомости.
+3. "drawing" - чертежи, схемы, планы, графические узлы.
+4. "text_block" - блоки сплошного текста, примечания, списки.
+5. "header" - крупные заголовки разделов или листов.
+
+Верни JSON-список объектов. Каждый объект должен иметь поля:
+- "type": тип блока (один из перечисленных выше)
+- "box": координаты [ymin, xmin, ymax, xmax] (нормализованные от 0 до 1000)
+- "content": содержимое блока:
+  - для "text_block" и "header" - весь текст блока строкой, с сохранением абзацев и списков;
+  - для "title_block" - JSON-объект с полями "Номер_проекта", "Название_листа", "Организация", "Лист", "Листов", "Стадия", "Разработал", "Проверил" (только найденные поля);
+  - для "table" и "drawing" поле "content" НЕ добавляй.
+
+Пример:
+[
+  {"type": "header", "box": [50, 100, 100, 900], "content": "1. Общие данные"},
+  {"type": "text_block", "box": [110, 100, 400, 900], "content": "Проектная документация разработана..."},
+  {"type": "title_block", "box": [850, 600, 980, 990], "content": {"Лист": "3", "Стадия": "П"}}
+]
+
+Верни ТОЛЬКО валидный JSON список. Не добавляй никаких пояснений.
+"""
+
 # --- Step 2: Targeted Extraction ---
 
 # А. Штамп (Title Block)
@@ -35,6 +63,19 @@ TITLE_BLOCK_PROMPT = """
 Верни ТОЛЬКО JSON.
 """
 
+# А.1 Изменившиеся области штампа (при повторном использовании штампа с другого листа)
+TITLE_BLOCK_REGION_PROMPT = """
+Это фрагмент штампа (title block). Штамп почти совпадает со штампом другого листа,
+для которого уже извлечены поля:
+{fields}
+
+На фрагменте - только область, где значения отличаются (например, номер или название листа).
+Распознай текст на фрагменте и определи, к каким из этих полей он относится.
+Верни JSON только с изменившимися полями, ключи - как в данных выше.
+
+Верни ТОЛЬКО JSON.
+"""
+
 # Б. Таблица (Table)
 TABLE_PROMPT = """
 Извлеки все данные из этой таблицы.
@@ -67,3 +108,24 @@ TEXT_BLOCK_PROMPT = """
 Распознай весь текст в этом блоке. Сохрани форматирование (абзацы, списки).
 Верни результат просто текстом.
 """
+
+# Д. Несколько небольших текстовых блоков в одном запросе
+MULTI_TEXT_BLOCK_PROMPT = """
+Ниже несколько изображений небольших текстовых блоков. Перед каждым изображением указан его ключ.
+Распознай весь текст каждого блока. Сохрани форматирование (абзацы, списки).
+
+Верни результат в формате JSON-объекта, где ключ - ключ блока, а значение - распознанный текст:
+{{"block_0": "текст первого блока", "block_3": "текст второго блока"}}
+
+Ключи блоков: {keys}
+Верни ТОЛЬКО JSON.
+"""
+
+# --- Structured Output ---
+
+# Дополнение к исходному запросу, если ответ не прошел проверку по JSON-схеме
+SCHEMA_REASK_SUFFIX = """
+
+Предыдущий ответ не прошел проверку: {error}
+Верни ответ строго в указанном JSON-формате, без пояснений.
+"""
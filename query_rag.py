@@ -1,58 +1,82 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
 import config
 import argparse
 
-# Re-use the same embedding function wrapper
-class LocalEmbeddingFunction(chromadb.EmbeddingFunction):
-    def __init__(self, model_name):
-        self.model = SentenceTransformer(model_name)
+def lookup_drawing_marks(kind: str, value: str, names: list) -> int:
+    """
+    Finds an axis / dimension / level / section cut in the drawing side indexes
+    of the given collections (exact match, no embedding search).
+    Returns the number of marks found.
+    """
+    from pipeline.collection_registry import drawing_indexes, load_registry
+    from pipeline.drawing_index import load_drawing_index, find_marks
+
+    indexes = drawing_indexes(names)
+    if not indexes:
+        print("No drawing index for these collections. Re-run assembly and indexing (steps 3-5).")
+        return 0
 
-    def __call__(self, input):
-        return self.model.encode(input, convert_to_tensor=False).tolist()
+    collections = load_registry()["collections"]
+    total = 0
+    print(f"\n--- Drawing marks: {kind} {value} ---")
+    for name, path in sorted(indexes.items()):
+        marks = find_marks(load_drawing_index(path) or [], value, kind)
+        if not marks:
+            continue
+        total += len(marks)
+        print(f"\nDocument: {collections[name].get('document')} ({len(marks)} found)")
+        for mark in sorted(marks, key=lambda m: (m["page"], m["drawing"])):
+            print(f"Page: {mark['page']} | Drawing: {mark['drawing']} | Text: {mark['text']} | Box: {mark.get('box')}")
+    if not total:
+        print(f"Not found in {len(indexes)} document(s).")
+    return total
 
-def query_database(query_text: str, n_results: int = 3):
+def semantic_search(query_text: str, n_results: int, names: list):
     """
-    Queries the ChromaDB for relevant chunks.
+    Embedding search over the given collections (in parallel), prints the best chunks.
     """
-    print(f"Querying: '{query_text}'...")
-    
-    client = chromadb.PersistentClient(path=str(config.CHROMA_DB_PATH))
-    
-    embedding_fn = LocalEmbeddingFunction(config.EMBEDDING_MODEL_NAME)
-    
-    try:
-        collection = client.get_collection(
-            name=config.COLLECTION_NAME,
-            embedding_function=embedding_fn
-        )
-    except Exception as e:
-        print(f"Error accessing collection: {e}")
-        return
+    # Heavy imports (chromadb, torch) only when a query actually runs
+    from pipeline.step_6_compliance import retrieve_candidates
 
-    results = collection.query(
-        query_texts=[query_text],
-        n_results=n_results
-    )
+    results = retrieve_candidates([query_text], n_results=n_results, collections=names)
     
     # Display Results
-    print("\n--- Found Results ---")
-    for i in range(len(results['ids'][0])):
-        doc_id = results['ids'][0][i]
-        content = results['documents'][0][i]
-        meta = results['metadatas'][0][i]
-        distance = results['distances'][0][i] if 'distances' in results else "N/A"
-
-        print(f"\nResult #{i+1} (ID: {doc_id})")
+    print(f"\n--- Found Results ({len(names)} collection(s)) ---")
+    for i, item in enumerate(results):
+        content = item["document"]
+        meta = item["metadata"]
+        distance = item["distance"]
+
+        print(f"\nResult #{i+1} (Document: {meta.get('document')}, distance: {distance:.4f})")
         print(f"Page: {meta.get('page_number', '?')} | Type: {meta.get('type', '?')}")
         print("-" * 40)
         print(content[:300] + "..." if len(content) > 300 else content)
         print("-" * 40)
 
+def query_database(query_text: str, n_results: int = 3, project: str = None, collections: list = None):
+    """
+    Queries the project's collections (in parallel) for relevant chunks.
+    "Ось Б" / "размер 3600" / "отметка +3.300" / "разрез 1-1" queries use the
+    drawing side index first and fall back to the semantic search without a hit.
+    """
+    from pipeline.collection_registry import resolve_collections
+    from pipeline.drawing_index import parse_mark_query
+
+    names = resolve_collections(project, collections)
+    if not names:
+        print(f"No indexed collections for project '{project or config.DEFAULT_PROJECT}'. Run indexing first.")
+        return
+
+    mark_query = parse_mark_query(query_text)
+    if mark_query and lookup_drawing_marks(*mark_query, names):
+        return
+
+    print(f"Querying: '{query_text}'...")
+    semantic_search(query_text, n_results, names)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Query the RAG system.")
     parser.add_argument("query", type=str, help="The question to ask.")
+    parser.add_argument("--project", help=f"Project to search (default: {config.DEFAULT_PROJECT}).")
     args = parser.parse_args()
     
-    query_database(args.query)
-
+    query_database(args.query, project=args.project)
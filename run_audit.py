@@ -1,9 +1,12 @@
-from pipeline.step_6_compliance import check_rule_compliance
+from pipeline.step_6_compliance import check_rules_compliance
+import config
+import metrics
 import json
 import os
+import argparse
 
 # Load rules from JSON file
-RULES_PATH = "data/rules_p87.json"
+RULES_PATH = config.RULES_PATH
 
 def load_rules():
     if not os.path.exists(RULES_PATH):
@@ -12,21 +15,33 @@ def load_rules():
     with open(RULES_PATH, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def main():
+def main(project: str = None, plan: bool = False):
     rules = load_rules()
     if not rules:
         return
 
-    print(f"Starting Audit for {len(rules)} rules from {RULES_PATH}...\n")
+    if plan:
+        # Expected requests and wall time only, no model calls
+        import planner
+        planner.print_plan(planner.plan_audit(rules, project))
+        return
+
+    print(f"Starting Audit for {len(rules)} rules from {RULES_PATH} (project '{project or config.DEFAULT_PROJECT}')...\n")
     
     report = []
+    rerank_latency_ms = 0.0
+    rerank_tokens_saved = 0
+    
+    rule_texts = [rule_obj.get("text", "") for rule_obj in rules]
+    rule_ids = [rule_obj.get("id", str(i+1)) for i, rule_obj in enumerate(rules)]
+    rule_sections = [rule_obj.get("section") for rule_obj in rules]
+    results = check_rules_compliance(rule_texts, rule_ids, project=project, rule_sections=rule_sections)
     
-    for i, rule_obj in enumerate(rules):
-        rule_text = rule_obj.get("text", "")
+    for i, (rule_obj, result) in enumerate(zip(rules, results)):
+        rule_text = rule_texts[i]
         rule_id = rule_obj.get("id", str(i+1))
         
         print(f"--- Rule {rule_id} ---")
-        result = check_rule_compliance(rule_text)
         
         report_item = {
             "rule_id": rule_id,
@@ -41,13 +56,26 @@ def main():
         print(f"VERDICT: {status}")
         if status == "ВЫПОЛНЕНО":
             print(f"Evidence: {result.get('evidence')}")
+
+        rerank = result.get("rerank")
+        if rerank:
+            rerank_latency_ms += rerank.get("latency_ms", 0.0)
+            rerank_tokens_saved += rerank.get("prompt_tokens_saved", 0)
             
     # Save full report
     with open("audit_report.json", "w", encoding="utf-8") as f:
         json.dump(report, f, ensure_ascii=False, indent=2)
         
     print(f"\nAudit Complete. Report saved to 'audit_report.json'")
+    if config.RERANK_ENABLED:
+        print(f"Rerank: {rerank_latency_ms:.0f} ms total, ~{rerank_tokens_saved} validator prompt tokens saved")
+
+    metrics.write_run_summary()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Check all rules against one project's documents.")
+    parser.add_argument("--project", help=f"Project to audit (default: {config.DEFAULT_PROJECT}).")
+    parser.add_argument("--plan", action="store_true", help="Only print the expected requests and wall time (no model calls).")
+    args = parser.parse_args()
+    main(project=args.project, plan=args.plan)
 
@@ -0,0 +1,156 @@
+
+# --- JSON Schemas of the model outputs ---
+# Sent as response_format / guided_json with config.STRUCTURED_OUTPUT and always
+# used to validate the parsed answers (utils.request_json).
+
+BLOCK_TYPES = ["title_block", "table", "drawing", "text_block", "header"]
+
+BOX_SCHEMA = {"type": "array", "items": {"type": "number"}, "minItems": 4, "maxItems": 4}
+
+# Поля штампа: значения - строки (номера листов допускаются числами)
+FIELD_SCHEMA = {"type": ["string", "number"]}
+
+TITLE_BLOCK_SCHEMA = {
+    "title": "title_block",
+    "type": "object",
+    "properties": {
+        field: FIELD_SCHEMA
+        for field in ["Номер_проекта", "Название_листа", "Организация", "Лист", "Листов", "Стадия", "Разработал", "Проверил"]
+    },
+    "additionalProperties": FIELD_SCHEMA
+}
+
+# Step 1: layout analysis
+LAYOUT_SCHEMA = {
+    "title": "layout",
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "type": {"type": "string", "enum": BLOCK_TYPES},
+            "box": BOX_SCHEMA
+        },
+        "required": ["type", "box"]
+    }
+}
+
+# Step 1: single-pass pages (content is optional, checked by clean_single_pass_blocks)
+SINGLE_PASS_SCHEMA = {
+    "title": "single_pass_page",
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "type": {"type": "string", "enum": BLOCK_TYPES},
+            "box": BOX_SCHEMA,
+            "content": {"type": ["string", "object"]}
+        },
+        "required": ["type", "box"]
+    }
+}
+
+# Step 2: drawing
+DRAWING_SCHEMA = {
+    "title": "drawing",
+    "type": "object",
+    "properties": {
+        "description": {"type": "string"},
+        "content": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "text": {"type": "string"},
+                    "box": BOX_SCHEMA
+                },
+                "required": ["text"]
+            }
+        }
+    },
+    "required": ["description", "content"]
+}
+
+# Step 6: query generation
+QUERIES_SCHEMA = {
+    "title": "search_queries",
+    "type": "array",
+    "items": {"type": "string"},
+    "minItems": 1
+}
+
+# Step 6: validator verdict
+VERDICT_SCHEMA = {
+    "title": "verdict",
+    "type": "object",
+    "properties": {
+        "status": {"type": "string", "enum": ["ВЫПОЛНЕНО", "НЕ НАЙДЕНО", "НАРУШЕНИЕ"]},
+        "reason": {"type": "string"},
+        "evidence": {"type": ["string", "null"]},
+        "source_page": {"type": ["string", "integer", "null"]}
+    },
+    "required": ["status", "reason"]
+}
+
+class SchemaError(ValueError):
+    pass
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool,
+    "null": type(None)
+}
+
+def _is_type(value, type_name: str) -> bool:
+    # bool is an int subclass, but not a JSON number
+    if type_name in ("number", "integer") and isinstance(value, bool):
+        return False
+    return isinstance(value, _TYPES[type_name])
+
+def validate(value, schema: dict, path: str = "$"):
+    """
+    Checks a parsed value against the subset of JSON Schema used above
+    (type, enum, properties, required, additionalProperties, items, minItems, maxItems).
+    Raises SchemaError with the path of the first mismatch.
+    """
+    types = schema.get("type")
+    if types is not None:
+        types = [types] if isinstance(types, str) else types
+        if not any(_is_type(value, t) for t in types):
+            raise SchemaError(f"{path}: expected {' or '.join(types)}, got {type(value).__name__}")
+
+    if "enum" in schema and value not in schema["enum"]:
+        raise SchemaError(f"{path}: {value!r} is not one of {schema['enum']}")
+
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                raise SchemaError(f"{path}: missing required field '{key}'")
+        properties = schema.get("properties", {})
+        extra = schema.get("additionalProperties", True)
+        for key, item in value.items():
+            if key in properties:
+                validate(item, properties[key], f"{path}.{key}")
+            elif extra is False:
+                raise SchemaError(f"{path}: unexpected field '{key}'")
+            elif isinstance(extra, dict):
+                validate(item, extra, f"{path}.{key}")
+
+    if isinstance(value, list):
+        if len(value) < schema.get("minItems", 0):
+            raise SchemaError(f"{path}: expected at least {schema['minItems']} items")
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            raise SchemaError(f"{path}: expected at most {schema['maxItems']} items")
+        if "items" in schema:
+            for i, item in enumerate(value):
+                validate(item, schema["items"], f"{path}[{i}]")
+
+def is_valid(value, schema: dict) -> bool:
+    try:
+        validate(value, schema)
+        return True
+    except SchemaError:
+        return False
@@ -0,0 +1,24 @@
+import json
+import pytest
+from pipeline.artifact_store import export_to_folder, load_chunks, open_store
+
+@pytest.mark.parametrize("backend", ["folder", "sqlite"])
+def test_round_trip(tmp_path, backend):
+    with open_store(tmp_path, backend) as store:
+        with store.transaction():
+            store.put("layout", 2, [{"type": "table", "box": [0, 0, 10, 10]}])
+            store.put("layout", 1, [])
+        chunks_file = store.put_chunks([{"content": "Текст", "metadata": {"page_number": 1}}])
+
+    with open_store(tmp_path, backend) as store:
+        assert store.pages("layout") == [1, 2]
+        assert store.has("layout", 2) and not store.has("extraction", 2)
+        assert store.get("layout", 2) == [{"type": "table", "box": [0, 0, 10, 10]}]
+    assert load_chunks(chunks_file) == [{"content": "Текст", "metadata": {"page_number": 1}}]
+
+def test_sqlite_export_to_folder(tmp_path):
+    with open_store(tmp_path, "sqlite") as store:
+        store.put("extraction", 3, [{"type": "header", "content": "Общие данные"}])
+    export_to_folder(tmp_path)
+    with open_store(tmp_path, "folder") as store:
+        assert store.get("extraction", 3) == [{"type": "header", "content": "Общие данные"}]
@@ -0,0 +1,86 @@
+import json
+import pytest
+import metrics
+import utils
+from pipeline.step_2_targeted_extraction import extract_block_batch
+
+BATCH = [
+    (0, "text_block", "crops/block_0.png"),
+    (3, "header", "crops/block_3.png"),
+    (5, "text_block", "crops/block_5.png"),
+]
+
+@pytest.fixture
+def vl(monkeypatch):
+    """
+    Stubs the VL calls: `vl.batch_answer` is what the batched request returns
+    (an Exception instance is raised), single-block calls answer "single:<crop>".
+    """
+    class Calls:
+        batch_answer = None
+        batches = []
+        singles = []
+    calls = Calls()
+
+    def call_multi(labeled_images, prompt, schema=None):
+        calls.batches.append((labeled_images, prompt, metrics.current_tags().get("block_type")))
+        if isinstance(calls.batch_answer, Exception):
+            raise calls.batch_answer
+        return calls.batch_answer
+
+    def call_single(image_path, prompt, schema=None):
+        calls.singles.append((image_path, metrics.current_tags().get("block_type")))
+        return f"single:{image_path}"
+
+    monkeypatch.setattr(utils, "call_qwen_vl_multi", call_multi)
+    monkeypatch.setattr(utils, "call_qwen_vl", call_single)
+    return calls
+
+def test_batched_answer_is_split_per_block(vl):
+    vl.batch_answer = json.dumps({"block_0": "Общие данные", "block_3": "ПЗ", "block_5": "Примечания"},
+                                 ensure_ascii=False)
+    assert extract_block_batch(BATCH) == {0: "Общие данные", 3: "ПЗ", 5: "Примечания"}
+    assert not vl.singles
+
+    labeled_images, prompt, block_type = vl.batches[0]
+    assert labeled_images == [("block_0", "crops/block_0.png"), ("block_3", "crops/block_3.png"),
+                              ("block_5", "crops/block_5.png")]
+    assert "block_0, block_3, block_5" in prompt
+    assert block_type == "text_batch"
+
+def test_answer_in_markdown_fence(vl):
+    vl.batch_answer = '```json\n{"block_0": "a", "block_3": "b", "block_5": "c"}\n```'
+    assert extract_block_batch(BATCH) == {0: "a", 3: "b", 5: "c"}
+
+def test_missing_keys_fall_back_per_block(vl):
+    # block_5 missing, block_3 not a string, block_9 not in the batch
+    vl.batch_answer = json.dumps({"block_0": "Общие данные", "block_3": ["ПЗ"], "block_9": "чужой"})
+    assert extract_block_batch(BATCH) == {
+        0: "Общие данные",
+        3: "single:crops/block_3.png",
+        5: "single:crops/block_5.png"
+    }
+    # Fallback calls are tagged with their own block type
+    assert vl.singles == [("crops/block_3.png", "header"), ("crops/block_5.png", "text_block")]
+
+@pytest.mark.parametrize("answer", ["не JSON вовсе", '["block_0", "block_3"]', '{"block_0": "обрыв'])
+def test_invalid_json_falls_back_per_block(vl, answer):
+    vl.batch_answer = answer
+    assert extract_block_batch(BATCH) == {i: f"single:{crop}" for i, _, crop in BATCH}
+    assert len(vl.singles) == 3
+
+def test_failed_batch_call_falls_back_per_block(vl):
+    vl.batch_answer = TimeoutError("read timed out")
+    assert extract_block_batch(BATCH) == {i: f"single:{crop}" for i, _, crop in BATCH}
+
+def test_failed_single_block_is_omitted(vl, monkeypatch):
+    vl.batch_answer = json.dumps({"block_0": "a", "block_3": "b"})
+    def broken(image_path, prompt, schema=None):
+        raise ConnectionError("endpoint down")
+    monkeypatch.setattr(utils, "call_qwen_vl", broken)
+    assert extract_block_batch(BATCH) == {0: "a", 3: "b"}
+
+def test_single_block_skips_batch_prompt(vl):
+    assert extract_block_batch(BATCH[:1]) == {0: "single:crops/block_0.png"}
+    assert not vl.batches
+    assert vl.singles == [("crops/block_0.png", "text_block")]
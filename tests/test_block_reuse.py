@@ -0,0 +1,90 @@
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+import pytest
+import config
+from pipeline.block_reuse import BlockReuseIndex, diff_regions, trim_whitespace
+from pipeline.step_2_targeted_extraction import reuse_block_extraction
+
+def draw_table(values: dict, font_size: int = 20, width: int = 2400) -> Image.Image:
+    """
+    4 x 6 table at 300 DPI scale; `values` overrides cells (row, col) -> text.
+    """
+    font = ImageFont.load_default(size=font_size)
+    image = Image.new("RGB", (width, 600), "white")
+    draw = ImageDraw.Draw(image)
+    col_w = (width - 40) // 4
+    for r in range(7):
+        draw.line([20, 20 + r * 80, width - 20, 20 + r * 80], fill="black", width=3)
+    for c in range(5):
+        draw.line([20 + c * col_w, 20, 20 + c * col_w, 500], fill="black", width=3)
+    for r in range(6):
+        for c in range(4):
+            text = values.get((r, c), "12" if c == 1 else "1.5")
+            draw.text((40 + c * col_w, 45 + r * 80), text, fill="black", font=font)
+    return image
+
+@pytest.mark.parametrize("font_size", [16, 20, 28])
+def test_single_digit_change_is_found(font_size):
+    reference = trim_whitespace(draw_table({}, font_size))
+    changed = trim_whitespace(draw_table({(2, 1): "13", (4, 3): "1.6"}, font_size))
+    boxes = diff_regions(reference, changed)
+    assert len(boxes) == 2
+    # Each box covers its changed cell
+    cells = [(2, 1), (4, 3)]
+    col_w = (2400 - 40) // 4
+    for (r, c), (left, top, right, bottom) in zip(cells, sorted(boxes, key=lambda b: b[1])):
+        x, y = 40 + c * col_w - 20, 45 + r * 80 - 20 # trimmed coordinates
+        assert left <= x <= right and top <= y <= bottom
+
+def test_pixel_shift_is_not_a_change():
+    reference = trim_whitespace(draw_table({}))
+    shifted = trim_whitespace(ImageChops.offset(draw_table({}), 2, 1))
+    assert diff_regions(reference, shifted) == []
+
+def test_half_pixel_jitter_is_not_a_change():
+    upscaled = draw_table({}).resize((4800, 1200), Image.LANCZOS)
+    reference = trim_whitespace(upscaled.resize((2400, 600), Image.LANCZOS))
+    jittered = trim_whitespace(ImageChops.offset(upscaled, 1, 1).resize((2400, 600), Image.LANCZOS))
+    assert diff_regions(reference, jittered) == []
+
+def test_table_with_changed_digit_is_extracted_again(tmp_path):
+    reuse_index = BlockReuseIndex(tmp_path / "reuse_index.json")
+    original = draw_table({})
+    reuse_index.add("table", original, tmp_path / "block_0_table.png", "| 12 | 1.5 |", "extracted")
+
+    assert reuse_block_extraction(reuse_index, "table", draw_table({(2, 1): "13"}), tmp_path, 1) is None
+    assert reuse_block_extraction(reuse_index, "table", draw_table({}), tmp_path, 2) == "| 12 | 1.5 |"
+
+def test_exact_types_need_identical_pixels(tmp_path):
+    assert "table" in config.PHASH_EXACT_TYPES
+    upscaled = draw_table({}).resize((4800, 1200), Image.LANCZOS)
+    jittered = ImageChops.offset(upscaled, 1, 1).resize((2400, 600), Image.LANCZOS)
+    reuse_index = BlockReuseIndex(tmp_path / "reuse_index.json")
+    reuse_index.add("table", upscaled.resize((2400, 600), Image.LANCZOS), tmp_path / "block_0_table.png", "table", "extracted")
+    # Sub-pixel jitter passes the diff, but tables only reuse pixel-identical crops
+    _, boxes, _ = reuse_index.lookup("table", jittered)
+    assert boxes
+
+def extract_title_block(tmp_path, monkeypatch, answer: str):
+    import utils
+    from pipeline.step_2_targeted_extraction import extract_data_from_page
+
+    monkeypatch.setattr(utils, "call_qwen_vl", lambda path, prompt, schema=None: answer)
+    page_path = tmp_path / "page_1.png"
+    page = Image.new("RGB", (1000, 1000), "white")
+    page.paste(draw_table({}).resize((500, 125)), (450, 800))
+    page.save(page_path)
+    reuse_index = BlockReuseIndex(tmp_path / "reuse_index.json")
+    results = extract_data_from_page(page_path, [{"type": "title_block", "box": [790, 440, 935, 960]}],
+                                     tmp_path, reuse_index)
+    return results, reuse_index
+
+def test_failed_extraction_is_not_indexed(tmp_path, monkeypatch):
+    # Invalid after the re-asks: the raw text is kept on the page, but never reused
+    results, reuse_index = extract_title_block(tmp_path, monkeypatch, "Штамп не распознан")
+    assert results[0]["content"] == "Штамп не распознан"
+    assert reuse_index.entries == {}
+
+def test_valid_extraction_is_indexed(tmp_path, monkeypatch):
+    results, reuse_index = extract_title_block(tmp_path, monkeypatch, '{"Лист": "3", "Стадия": "П"}')
+    assert results[0]["content"] == {"Лист": "3", "Стадия": "П"}
+    assert [entry["content"] for entry in reuse_index.entries["title_block"]] == [{"Лист": "3", "Стадия": "П"}]
@@ -0,0 +1,116 @@
+import pytest
+import config
+import utils
+from pipeline.step_4_chunking import parse_markdown_table, split_table
+from pipeline.step_6_compliance import merge_table_groups
+
+HEADER = ["| Поз. | Наименование | Кол. |", "|---|---|---|"]
+
+def table(n_rows, header=HEADER, caption="Таблица 1 - Спецификация", note="Примечание: размеры в мм"):
+    rows = [f"| {i} | Балка Б-{i} двутавровая | {i * 2} |" for i in range(1, n_rows + 1)]
+    return "\n".join(line for line in [caption, *header, *rows, note] if line)
+
+@pytest.fixture
+def small_budget(monkeypatch):
+    monkeypatch.setattr(config, "TABLE_CHUNK_TOKENS", 60)
+
+def test_parse_table_parts():
+    header, rows, before, after = parse_markdown_table(table(3))
+    assert header == HEADER
+    assert rows[0].startswith("| 1 |") and len(rows) == 3
+    assert before == "Таблица 1 - Спецификация"
+    assert after == "Примечание: размеры в мм"
+
+def test_parse_without_table():
+    assert parse_markdown_table("Просто текст\nбез таблицы") is None
+
+def test_small_table_is_one_group():
+    groups = split_table(table(3))
+    assert len(groups) == 1
+    assert groups[0]["row_start"] == 1 and groups[0]["row_end"] == 3
+    assert groups[0]["header_lines"] == 2
+
+def test_groups_fit_budget(small_budget):
+    groups = split_table(table(40))
+    assert len(groups) > 1
+    for group in groups:
+        rows = group["content"].splitlines()
+        rows = [row for row in rows if row.startswith("|")][len(HEADER):]
+        assert utils.estimate_tokens("\n".join(rows)) <= config.TABLE_CHUNK_TOKENS
+    # Row ranges cover the table without gaps
+    assert groups[0]["row_start"] == 1 and groups[-1]["row_end"] == 40
+    for prev, group in zip(groups, groups[1:]):
+        assert group["row_start"] == prev["row_end"] + 1
+
+def test_header_repeated_in_every_group(small_budget):
+    groups = split_table(table(40))
+    for k, group in enumerate(groups):
+        lines = group["content"].splitlines()
+        if k == 0:
+            assert lines[0] == "Таблица 1 - Спецификация"
+            lines = lines[1:]
+        assert lines[:2] == HEADER
+        assert group["header_lines"] == 2
+    assert groups[-1]["content"].endswith("Примечание: размеры в мм")
+    assert "Примечание" not in groups[0]["content"]
+
+def test_table_without_header(small_budget):
+    header, rows, _, _ = parse_markdown_table(table(5, header=[]))
+    assert header == [] and len(rows) == 5
+
+    groups = split_table(table(40, header=[], caption="", note=""))
+    assert len(groups) > 1
+    for group in groups:
+        assert group["header_lines"] == 0
+        first = group["content"].splitlines()[0]
+        assert first.startswith(f"| {group['row_start']} |")
+
+def test_ragged_rows_are_kept(small_budget):
+    rows = [f"| {i} | Балка Б-{i} |" if i % 3 else f"| {i} | Балка Б-{i} | {i} | лишняя ячейка |"
+            for i in range(1, 41)]
+    markdown = "\n".join([*HEADER, *rows])
+    groups = split_table(markdown)
+    assert len(groups) > 1
+    kept = [line for group in groups for line in group["content"].splitlines()[2:]]
+    assert kept == rows
+
+def candidates_from(groups, table_id="page_3_table_0", collection="doc_a"):
+    return [{
+        "document": group["content"],
+        "metadata": {"collection": collection, "table_id": table_id, "row_start": group["row_start"],
+                     "row_end": group["row_end"], "header_lines": group["header_lines"],
+                     "table_parts": len(groups)}
+    } for group in groups]
+
+def test_merge_sibling_groups_in_row_order(small_budget):
+    markdown = table(40, caption="", note="")
+    groups = split_table(markdown)
+    assert len(groups) >= 3
+    other = {"document": "Текст раздела", "metadata": {"collection": "doc_a"}}
+    # Retrieved out of order, with an unrelated chunk in between
+    candidates = candidates_from(groups)
+    retrieved = [candidates[2], other, candidates[0], candidates[1], *candidates[3:]]
+
+    merged = merge_table_groups(retrieved)
+    assert len(merged) == 2
+    # The table takes the place of its first retrieved group
+    assert merged[1] is other
+    assert merged[0]["document"] == markdown
+    assert merged[0]["metadata"]["row_start"] == 1 and merged[0]["metadata"]["row_end"] == 40
+
+def test_merge_keeps_gaps_apart(small_budget):
+    groups = split_table(table(40, caption="", note=""))
+    candidates = candidates_from(groups)
+    merged = merge_table_groups([candidates[0], candidates[2]])
+    assert len(merged) == 2
+    assert [item["metadata"]["row_start"] for item in merged] == [1, groups[2]["row_start"]]
+    # Input candidates aren't modified
+    assert candidates[0]["metadata"]["row_end"] == groups[0]["row_end"]
+
+def test_merge_separates_documents(small_budget):
+    groups = split_table(table(40, caption="", note=""))
+    first = candidates_from(groups[:2], collection="doc_a")
+    second = candidates_from(groups[:2], collection="doc_b")
+    merged = merge_table_groups([first[0], second[1], first[1], second[0]])
+    assert [item["metadata"]["collection"] for item in merged] == ["doc_a", "doc_b"]
+    assert all(item["metadata"]["row_end"] == groups[1]["row_end"] for item in merged)
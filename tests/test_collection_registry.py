@@ -0,0 +1,113 @@
+import re
+import sys
+import types
+import pytest
+import config
+from pipeline.collection_registry import collection_name, register_collection, resolve_collections
+from pipeline.step_6_compliance import merge_shards, retrieve_candidates
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "COLLECTION_REGISTRY_PATH", tmp_path / "collections.json")
+
+def test_collection_name_is_chroma_safe():
+    for project, document in [("ЖК Северный", "Раздел 3. Архитектурные решения (ред. 2)"),
+                              ("p", "d"),
+                              ("project" * 20, "document" * 20)]:
+        name = collection_name(project, document)
+        assert re.fullmatch(r"[A-Za-z0-9_]{3,63}", name)
+        assert name == collection_name(project, document)
+
+def test_collection_name_is_unique_per_document():
+    # Cyrillic names share the fallback slug, the hash tells them apart
+    names = {collection_name("Проект", doc) for doc in ["Раздел 1", "Раздел 2", "Раздел 3"]}
+    assert len(names) == 3
+    assert collection_name("a", "b_c") != collection_name("a_b", "c")
+
+def test_resolve_collections(registry, monkeypatch):
+    monkeypatch.setattr(config, "DEFAULT_PROJECT", "alpha")
+    register_collection("alpha_pz", "alpha", "pz", 10)
+    register_collection("alpha_ar", "alpha", "ar", 10)
+    register_collection("beta_pz", "beta", "pz", 10)
+    assert resolve_collections() == ["alpha_ar", "alpha_pz"]
+    assert resolve_collections("beta") == ["beta_pz"]
+    assert resolve_collections("gamma") == []
+    # Explicit names win, in the given order
+    assert resolve_collections("beta", names=["alpha_pz", "missing"]) == ["alpha_pz", "missing"]
+
+def shard(*per_query):
+    """
+    Chroma query result: per query a list of (document, distance).
+    """
+    return {
+        "documents": [[doc for doc, _ in hits] for hits in per_query],
+        "metadatas": [[{"page_number": 1} for _ in hits] for hits in per_query],
+        "distances": [[dist for _, dist in hits] for hits in per_query]
+    }
+
+def test_merge_keeps_closest_hits_across_collections():
+    shards = [
+        ("a", shard([("a1", 0.1), ("a2", 0.5)], [("a3", 0.4)])),
+        ("b", shard([("b1", 0.2), ("b2", 0.3)], [("b3", 0.1)])),
+        ("missing", None)
+    ]
+    merged = merge_shards(shards, 2, 2, {"a": "ПЗ", "b": "АР"})
+    assert [(item["document"], item["distance"]) for item in merged] == [
+        ("a1", 0.1), ("b1", 0.2), ("b3", 0.1), ("a3", 0.4)
+    ]
+    assert merged[0]["metadata"] == {"page_number": 1, "collection": "a", "document": "ПЗ"}
+    assert merged[2]["metadata"]["collection"] == "b"
+
+def test_merge_deduplicates_content():
+    # The same chunk text found by two queries (and in two collections) is kept once
+    shards = [
+        ("a", shard([("общий", 0.3)], [("общий", 0.1), ("a2", 0.2)])),
+        ("b", shard([("общий", 0.2)], [("b2", 0.5)]))
+    ]
+    merged = merge_shards(shards, 2, 2, {})
+    assert [item["document"] for item in merged] == ["общий", "a2"]
+    assert merged[0]["metadata"]["collection"] == "b" and merged[0]["distance"] == 0.2
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+        self.calls = []
+
+    def query(self, query_embeddings, n_results, where=None):
+        self.calls.append(where)
+        return shard(*[[(f"{self.name}-q{q}", 0.1 * (q + 1))] for q in range(len(query_embeddings))])
+
+@pytest.fixture
+def fake_chroma(monkeypatch):
+    """
+    Replaces pipeline.embeddings (chromadb + the embedding model) with an
+    in-memory client whose get_collection raises ValueError for unknown names.
+    """
+    collections = {name: FakeCollection(name) for name in ["pz", "ar"]}
+    def get_collection(name, embedding_function=None):
+        if name not in collections:
+            raise ValueError(f"Collection {name} does not exist.")
+        return collections[name]
+    module = types.ModuleType("pipeline.embeddings")
+    module.COLLECTION_NOT_FOUND = (ValueError,)
+    module.get_client = lambda: types.SimpleNamespace(get_collection=get_collection)
+    module.get_embedding_function = lambda: lambda texts: [[0.0] for _ in texts]
+    monkeypatch.setitem(sys.modules, "pipeline.embeddings", module)
+    return collections
+
+def test_fanout_skips_missing_collection(registry, fake_chroma, capsys):
+    register_collection("pz", "p", "ПЗ", 10)
+    results = retrieve_candidates(["q0", "q1"], n_results=2, collections=["pz", "gone", "ar"],
+                                  page_filters={"ar": [4, 5]})
+    assert "Collection 'gone' not found" in capsys.readouterr().out
+    assert [item["document"] for item in results] == ["pz-q0", "ar-q0", "pz-q1", "ar-q1"]
+    assert results[0]["metadata"]["document"] == "ПЗ"
+    assert fake_chroma["pz"].calls == [None]
+    assert fake_chroma["ar"].calls == [{"page_number": {"$in": [4, 5]}}]
+
+def test_fanout_does_not_hide_other_errors(registry, fake_chroma):
+    def broken(name, embedding_function=None):
+        raise RuntimeError("database is locked")
+    sys.modules["pipeline.embeddings"].get_client = lambda: types.SimpleNamespace(get_collection=broken)
+    with pytest.raises(RuntimeError, match="database is locked"):
+        retrieve_candidates(["q0"], collections=["pz"])
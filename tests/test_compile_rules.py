@@ -0,0 +1,54 @@
+import sys
+import types
+import pytest
+import config
+import compile_rules
+from pipeline import rule_plans
+from pipeline import step_6_compliance
+
+RULES = [{"id": "1", "text": "Пояснительная записка должна содержать исходные данные."}]
+
+@pytest.fixture
+def compiler(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "COMPILED_RULES_PATH", tmp_path / "compiled_rules.json")
+    monkeypatch.setattr(config, "METRICS_PATH", tmp_path / "metrics")
+    monkeypatch.setattr(compile_rules, "load_rules", lambda: RULES)
+    # Fake embedding model: the test is about which plans get saved
+    embeddings = types.ModuleType("pipeline.embeddings")
+    embeddings.get_embedding_function = lambda: (lambda texts: [[0.0, 1.0] for _ in texts])
+    monkeypatch.setitem(sys.modules, "pipeline.embeddings", embeddings)
+
+def set_generator(monkeypatch, answer):
+    def ask_llm_json(prompt, schema, label="LLM"):
+        if isinstance(answer, Exception):
+            raise answer
+        return answer, None
+    monkeypatch.setattr(step_6_compliance, "ask_llm_json", ask_llm_json)
+
+def test_generate_queries_flags_the_fallback(monkeypatch):
+    set_generator(monkeypatch, ValueError("no valid JSON"))
+    queries, _, generated = step_6_compliance.generate_queries("rule")
+    assert queries == ["rule"] and not generated
+
+def test_fallback_is_not_compiled(compiler, monkeypatch):
+    set_generator(monkeypatch, ValueError("no valid JSON"))
+    assert compile_rules.compile_rules() == 1
+    assert rule_plans.load_artifact()["plans"] == {}
+
+    # The next run retries the rule instead of skipping it
+    set_generator(monkeypatch, ["исходные данные для проектирования"])
+    assert compile_rules.compile_rules() == 0
+    plans = rule_plans.load_artifact()["plans"]
+    assert [plan["queries"] for plan in plans.values()] == [["исходные данные для проектирования"]]
+
+def test_plan_key_follows_the_routed_model(compiler, monkeypatch):
+    set_generator(monkeypatch, ["запрос"])
+    compile_rules.compile_rules()
+    (key,) = rule_plans.load_artifact()["plans"]
+    assert key.endswith(f"@{config.QWEN_MODEL_NAME}")
+
+    # Routing query generation to another model invalidates the plan
+    monkeypatch.setitem(config.MODEL_ROUTES, "query_generation", {"endpoint": "main", "model": "other-model"})
+    assert rule_plans.generator_model() == "other-model"
+    compile_rules.compile_rules()
+    assert sorted(key.split("@")[1] for key in rule_plans.load_artifact()["plans"]) == sorted([config.QWEN_MODEL_NAME, "other-model"])
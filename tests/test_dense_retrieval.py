@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+import config
+from pipeline import dense_retrieval
+from pipeline.dense_retrieval import DenseIndex, export_embedding_matrix
+
+def brute_force(queries: np.ndarray, docs: np.ndarray, k: int) -> np.ndarray:
+    distances = ((queries[:, None, :] - docs[None, :, :]) ** 2).sum(axis=2)
+    return np.argsort(distances, axis=1, kind="stable")[:, :k]
+
+@pytest.fixture
+def index_factory(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "DENSE_INDEX_PATH", tmp_path)
+    monkeypatch.setattr(dense_retrieval, "SEARCH_BLOCK_ROWS", 64) # Several blocks per search
+
+    def build(dtype: str, n: int = 300, dim: int = 16):
+        monkeypatch.setattr(config, "DENSE_INDEX_DTYPE", dtype)
+        rng = np.random.default_rng(0)
+        embeddings = rng.normal(size=(n, dim)).astype(np.float32)
+        metadatas = [{"page_number": row % 10} for row in range(n)]
+        export_embedding_matrix("docs", [f"id{row}" for row in range(n)], [""] * n, metadatas, embeddings.tolist())
+        # Compare against what is stored (float16 rounds the embeddings)
+        index = DenseIndex.load("docs")
+        return index, np.asarray(index.matrix, dtype=np.float32), rng.normal(size=(5, dim)).astype(np.float32)
+    return build
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_top_k_matches_brute_force(index_factory, dtype):
+    index, docs, queries = index_factory(dtype)
+    assert isinstance(index.matrix, np.memmap)
+    indices, distances = index.search(queries, 10)
+    assert indices.tolist() == brute_force(queries, docs, 10).tolist()
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+def test_page_filter_matches_brute_force(index_factory):
+    index, docs, queries = index_factory("float16")
+    rows = index.rows_on_pages([2, 7])
+    indices, _ = index.search(queries, 8, rows=rows)
+    assert indices.tolist() == rows[brute_force(queries, docs[rows], 8)].tolist()
+    assert all(index.metadatas[row]["page_number"] in (2, 7) for row in indices.ravel())
+
+def test_k_larger_than_index(index_factory):
+    index, docs, queries = index_factory("float32", n=5)
+    indices, _ = index.search(queries[0], 10)
+    assert indices.shape == (1, 5)
+    assert indices.tolist() == brute_force(queries[:1], docs, 5).tolist()
@@ -0,0 +1,84 @@
+import pytest
+import config
+import query_rag
+from pipeline.collection_registry import register_collection
+from pipeline.drawing_index import (classify_text, find_marks, page_marks, parse_mark_query,
+                                    save_drawing_index, split_drawing, drawing_text)
+
+def drawing(*texts, description="План 1 этажа"):
+    return {"description": description, "content": [{"text": t, "box": [0, 0, 10, 10]} for t in texts]}
+
+@pytest.mark.parametrize("text, expected", [
+    ("ось Б", ("axis", "Б")),
+    ("ось B", ("axis", "В")),     # Latin lookalike
+    ("Найти ось 12", ("axis", "12")),
+    ("размер 3 600", ("dimension", "3600")),
+    ("размер 6х600=3600", ("dimension", "6x600=3600")),
+    ("отметка +3.300", ("level", "+3.300")),
+    ("отметка 3,300", ("level", "3.300")),
+    ("разрез 1-1", ("cut", "1-1")),
+    ("разрез а–а", ("cut", "А-А")),
+])
+def test_mark_queries(text, expected):
+    assert parse_mark_query(text) == expected
+
+@pytest.mark.parametrize("text", [
+    "Размер санитарно-защитной зоны",
+    "отметка пола первого этажа",
+    "размеры помещений",
+    "ось симметрии здания",
+    "разрез по лестничной клетке",
+    "требования к пожарной безопасности",
+])
+def test_questions_are_not_mark_queries(text):
+    assert parse_mark_query(text) is None
+
+def test_split_drawing():
+    description, labels, marks = split_drawing(drawing(
+        "А", "Б", "1", "2", "3600", "3 600", "+3.300", "1-1", "Разрез 1-1", "Тамбур", "Тамбур", "—"
+    ))
+    assert description == "План 1 этажа"
+    assert labels == ["Разрез 1-1", "Тамбур"]
+    assert [(m["kind"], m["value"]) for m in marks] == [
+        ("axis", "А"), ("axis", "Б"), ("axis", "1"), ("axis", "2"),
+        ("dimension", "3600"), ("dimension", "3600"), ("level", "+3.300"), ("cut", "1-1")
+    ]
+
+def test_stray_letter_is_not_an_axis():
+    # A lone OCR'd letter line is not an axis series; a lone short number is a dimension
+    _, _, marks = split_drawing(drawing("В", "50", "3600"))
+    assert [(m["kind"], m["value"]) for m in marks] == [("dimension", "50"), ("dimension", "3600")]
+    assert classify_text("в") is None
+
+def test_letters_not_used_for_axes():
+    _, _, marks = split_drawing(drawing("А", "З", "Б"))
+    assert [m["value"] for m in marks] == ["А", "Б"]
+
+def test_drawing_text_has_no_dimensions():
+    text = drawing_text(drawing("А", "Б", "3600", "6000", "Лестничная клетка"))
+    assert text == "Описание чертежа: План 1 этажа\nТекст на чертеже: Лестничная клетка"
+
+def test_find_marks():
+    marks = page_marks([drawing("А", "Б", "1", "2", "+3.300", "1200")], 4)
+    assert [m["text"] for m in find_marks(marks, "3.300", "level")] == ["+3.300"]
+    # 1-2 digit values match axes and short dimensions alike
+    assert [m["text"] for m in find_marks(marks, "2", "dimension")] == ["2"]
+    assert find_marks(marks, "В", "axis") == []
+
+@pytest.fixture
+def indexed_project(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "COLLECTION_REGISTRY_PATH", tmp_path / "collections.json")
+    save_drawing_index(page_marks([drawing("А", "Б", "3600")], 7), tmp_path / "drawings.json")
+    register_collection("doc", "p", "doc", 3, drawing_index=str(tmp_path / "drawings.json"))
+
+def test_query_uses_side_index(indexed_project, monkeypatch, capsys):
+    monkeypatch.setattr(query_rag, "semantic_search", lambda *args: pytest.fail("semantic search called"))
+    query_rag.query_database("ось Б", project="p")
+    assert "Page: 7" in capsys.readouterr().out
+
+@pytest.mark.parametrize("text", ["ось Ж", "Размер санитарно-защитной зоны"])
+def test_query_falls_back_to_semantic_search(indexed_project, monkeypatch, text):
+    calls = []
+    monkeypatch.setattr(query_rag, "semantic_search", lambda query, *args: calls.append(query))
+    query_rag.query_database(text, project="p")
+    assert calls == [text]
@@ -0,0 +1,138 @@
+import threading
+import pytest
+import config
+import utils
+from openai import APIConnectionError
+
+WAIT = 5 # Upper bound on event waits, only reached if the code under test hangs
+
+def test_hedged_request_returns_the_faster_duplicate():
+    release_primary = threading.Event()
+    loser_done = threading.Event()
+    losers = []
+    calls = iter(["primary", "duplicate"])
+    def send():
+        name = next(calls)
+        if name == "primary":
+            assert release_primary.wait(WAIT)
+        return name
+    def on_loser(future):
+        losers.append(future)
+        loser_done.set()
+
+    # The primary blocks until released, so the hedge timeout always fires
+    result, hedged = utils.run_hedged(send, 0.01, on_loser)
+    assert (result, hedged) == ("duplicate", True)
+    assert not losers
+    release_primary.set()
+    assert loser_done.wait(WAIT)
+    assert losers[0].result() == "primary"
+
+def test_failed_primary_falls_back_to_duplicate():
+    duplicate_started = threading.Event()
+    calls = iter(["primary", "duplicate"])
+    def send():
+        if next(calls) == "primary":
+            assert duplicate_started.wait(WAIT)
+            raise RuntimeError("primary failed")
+        duplicate_started.set()
+        return "duplicate"
+    assert utils.run_hedged(send, 0.01, lambda future: None) == ("duplicate", True)
+
+def test_both_failures_raise():
+    started = threading.Barrier(2, timeout=WAIT)
+    def send():
+        started.wait()
+        raise RuntimeError("endpoint down")
+    with pytest.raises(RuntimeError, match="endpoint down"):
+        utils.run_hedged(send, 0.01, lambda future: None)
+
+def test_fast_request_is_not_hedged():
+    calls = []
+    def send():
+        calls.append(1)
+        return "ok"
+    assert utils.run_hedged(send, WAIT, lambda future: None) == ("ok", False)
+    assert len(calls) == 1
+
+class FakeCompletions:
+    """
+    chat.completions of a client whose first `failures` calls fail to connect.
+    """
+    def __init__(self, slots, failures=0, response="ok"):
+        self.slots, self.failures, self.response = slots, failures, response
+        self.free_slots = [] # Slots available at each call
+
+    def create(self, **kwargs):
+        self.free_slots.append(self.slots._value)
+        if self.failures:
+            self.failures -= 1
+            raise APIConnectionError(request=None)
+        return self.response
+
+class FakeClient:
+    def __init__(self, completions):
+        self.chat = type("Chat", (), {"completions": completions})()
+
+@pytest.fixture
+def fake_sleep(monkeypatch):
+    slept = []
+    monkeypatch.setattr(utils.time, "sleep", slept.append)
+    return slept
+
+def test_slot_is_released_during_backoff(monkeypatch):
+    slots = threading.BoundedSemaphore(1)
+    completions = FakeCompletions(slots, failures=2)
+    free_while_sleeping = []
+    monkeypatch.setattr(utils.time, "sleep", lambda seconds: free_while_sleeping.append(slots._value))
+
+    response, retries = utils.create_completion_with_retries(FakeClient(completions), slots)
+    assert (response, retries) == ("ok", 2)
+    assert completions.free_slots == [0, 0, 0] # Held during every attempt
+    assert free_while_sleeping == [1, 1]       # ...but not while backing off
+    assert slots._value == 1
+
+def test_final_failure_releases_slot(monkeypatch, fake_sleep):
+    monkeypatch.setattr(config, "LLM_MAX_RETRIES", 1)
+    slots = threading.BoundedSemaphore(1)
+    with pytest.raises(APIConnectionError) as error:
+        utils.create_completion_with_retries(FakeClient(FakeCompletions(slots, failures=5)), slots)
+    assert error.value.retries == 1
+    assert slots._value == 1
+
+def test_keep_slot_holds_it_for_the_caller(fake_sleep):
+    slots = threading.BoundedSemaphore(1)
+    completions = FakeCompletions(slots, failures=1)
+    utils.create_completion_with_retries(FakeClient(completions), slots, keep_slot=True)
+    assert slots._value == 0
+    slots.release()
+
+class FakeStream:
+    def __init__(self, deltas, slots):
+        self.deltas, self.slots = deltas, slots
+        self.closed = False
+
+    def __iter__(self):
+        for delta in self.deltas:
+            assert self.slots._value == 0 # The slot is held while the stream is read
+            yield type("Chunk", (), {
+                "usage": None,
+                "choices": [type("Choice", (), {"delta": type("Delta", (), {"content": delta})()})()]
+            })()
+
+    def close(self):
+        self.closed = True
+
+def test_stream_holds_slot_per_attempt(monkeypatch, tmp_path, fake_sleep):
+    monkeypatch.setattr(config, "METRICS_PATH", tmp_path / "metrics")
+    slots = threading.BoundedSemaphore(1)
+    stream = FakeStream(['["запрос 1", ', '"запрос 2"]', ' хвост'], slots)
+    completions = FakeCompletions(slots, failures=1, response=stream)
+    monkeypatch.setattr(utils, "endpoint_client", lambda name: (FakeClient(completions), slots))
+
+    text, timings = utils.call_llm_json_stream("prompt", expect="[")
+    assert text == '["запрос 1", "запрос 2"]'
+    assert timings["early_stop"]
+    assert stream.closed
+    assert completions.free_slots == [0, 0]
+    assert slots._value == 1
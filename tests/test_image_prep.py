@@ -0,0 +1,87 @@
+import pytest
+from PIL import Image, ImageDraw, ImageFilter
+import config
+import image_prep
+
+TEXT_PROFILE = {"trim": True, "mode": "auto", "max_side": 1000, "dense_max_side": 1400, "quality": 80}
+
+def block(size=(1600, 600), ink_box=(400, 200, 900, 300), blur=False):
+    """
+    White crop with a solid ink rectangle (one "word"); blurred edges add mid-gray.
+    """
+    image = Image.new("RGB", size, "white")
+    ImageDraw.Draw(image).rectangle(ink_box, fill="black")
+    return image.filter(ImageFilter.GaussianBlur(2)) if blur else image
+
+def test_trim_keeps_padding_around_ink():
+    trimmed = image_prep.trim_margins(block())
+    pad = image_prep.TRIM_PADDING
+    assert trimmed.size == (900 - 400 + 1 + 2 * pad, 300 - 200 + 1 + 2 * pad)
+
+def test_trim_clamps_to_image_edges():
+    trimmed = image_prep.trim_margins(block(ink_box=(0, 0, 100, 50)))
+    assert trimmed.size == (100 + 1 + image_prep.TRIM_PADDING, 50 + 1 + image_prep.TRIM_PADDING)
+
+def test_trim_blank_image_is_unchanged():
+    image = Image.new("RGB", (300, 200), "white")
+    assert image_prep.trim_margins(image).size == (300, 200)
+
+def test_profile_trims_and_binarizes_clean_text():
+    prepared, image_format, quality = image_prep.prepare_image(block(), TEXT_PROFILE)
+    assert prepared.mode == "1" and image_format == "PNG" and quality is None
+    assert prepared.size == image_prep.trim_margins(block()).size
+
+def test_untrimmed_profile_keeps_margins():
+    profile = {**TEXT_PROFILE, "trim": False, "max_side": 2000, "mode": "RGB"}
+    prepared, image_format, quality = image_prep.prepare_image(block(), profile)
+    assert prepared.size == (1600, 600) and prepared.mode == "RGB"
+    assert (image_format, quality) == ("JPEG", 80)
+
+def test_max_side_downscale():
+    # Ink spans the crop, so trimming keeps the size: 3000 px -> max_side
+    image = block(size=(3000, 800), ink_box=(0, 0, 2999, 799), blur=True)
+    profile = {**TEXT_PROFILE, "trim": False, "dense_max_side": 1000}
+    prepared, image_format, _ = image_prep.prepare_image(image, profile)
+    assert max(prepared.size) == 1000
+    assert prepared.size == (1000, 267)
+    # Downscaled strokes turn gray: no binarization
+    assert prepared.mode == "L" and image_format == "JPEG"
+
+def test_dense_content_keeps_more_resolution(monkeypatch):
+    image = block(size=(3000, 800), ink_box=(0, 0, 2999, 799))
+    profile = {**TEXT_PROFILE, "trim": False, "mode": "L"}
+    monkeypatch.setattr(config, "IMAGE_DENSE_INK", 0.5)
+    assert max(image_prep.prepare_image(image, profile)[0].size) == 1400
+    monkeypatch.setattr(config, "IMAGE_DENSE_INK", 1.0)
+    assert max(image_prep.prepare_image(image, profile)[0].size) == 1000
+
+def test_small_images_are_not_upscaled():
+    image = block(size=(400, 200), ink_box=(50, 50, 350, 150))
+    prepared, _, _ = image_prep.prepare_image(image, {**TEXT_PROFILE, "trim": False, "mode": "L"})
+    assert prepared.size == (400, 200)
+
+def test_baseline_without_profile():
+    image = block(size=(4000, 1000), ink_box=(100, 100, 3900, 900))
+    prepared, image_format, quality = image_prep.prepare_image(image, None)
+    assert prepared.size == image_prep.baseline_size(image.size) == (2000, 500)
+    assert prepared.mode == "RGB" and (image_format, quality) == ("JPEG", image_prep.BASELINE_QUALITY)
+    assert image.size == (4000, 1000) # The input is not modified
+
+def test_disabled_prep_passes_through(monkeypatch):
+    tags = {"stage": "extraction", "block_type": "text_block"}
+    assert image_prep.profile_for(tags) == config.IMAGE_PROFILES["text_block"]
+    monkeypatch.setattr(config, "IMAGE_PREP_ENABLED", False)
+    assert image_prep.profile_for(tags) is None
+
+    image = block()
+    prepared, _, _ = image_prep.prepare_image(image, image_prep.profile_for(tags))
+    assert prepared.size == image.size # No trim, no downscale below the baseline cap
+
+@pytest.mark.parametrize("tags, expected", [
+    ({"stage": "extraction", "block_type": "table"}, "table"),
+    ({"stage": "text_batch"}, "text_batch"),
+    ({"stage": "layout"}, None),
+    ({}, None),
+])
+def test_profile_lookup(tags, expected):
+    assert image_prep.profile_for(tags) == config.IMAGE_PROFILES.get(expected)
@@ -0,0 +1,23 @@
+import utils
+
+def scan(chunks, **kwargs):
+    scanner = utils.JsonStreamScanner(**kwargs)
+    for i, chunk in enumerate(chunks):
+        if scanner.feed(chunk):
+            return scanner, i
+    return scanner, None
+
+def test_scanner_stops_at_first_complete_value():
+    scanner, stopped_at = scan(['Ответ: [{"a": "x]"', ', "b": [1, 2]}', '] и ещё текст', ' [3]'])
+    assert stopped_at == 2
+    assert scanner.value == [{"a": "x]", "b": [1, 2]}]
+    assert scanner.json_text == '[{"a": "x]", "b": [1, 2]}]'
+
+def test_scanner_handles_escaped_quotes():
+    scanner, _ = scan(['{"reason": "см. \\"п. 3\\"", "status": "ВЫПОЛНЕНО"}'])
+    assert scanner.value == {"reason": 'см. "п. 3"', "status": "ВЫПОЛНЕНО"}
+
+def test_scanner_accept_skips_footnotes():
+    scanner, _ = scan(['См. [1]. ', '["запрос 1", "запрос 2"]'],
+                      accept=lambda value: isinstance(value, list) and all(isinstance(item, str) for item in value))
+    assert scanner.value == ["запрос 1", "запрос 2"]
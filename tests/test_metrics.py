@@ -0,0 +1,120 @@
+import pytest
+import config
+import metrics
+
+def record(stage="extraction", block_type=None, latency_s=1.0, status="ok", **extra):
+    return {"kind": "vl", "stage": stage, "block_type": block_type, "latency_s": latency_s,
+            "prompt_tokens": 100, "completion_tokens": 10, "image_pixels": 1000, "retries": 0,
+            "status": status, **extra}
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "METRICS_PATH", tmp_path / "metrics")
+    return tmp_path / "metrics"
+
+def test_percentile_single_sample():
+    for q in (0, 1, 50, 95, 99, 100):
+        assert metrics.percentile([2.5], q) == 2.5
+
+def test_percentile_nearest_rank():
+    values = list(range(10, 0, -1)) # Unsorted input
+    assert metrics.percentile(values, 50) == 5
+    assert metrics.percentile(values, 95) == 10
+    assert metrics.percentile(values, 10) == 1
+    assert metrics.percentile(values, 0) == 1
+    assert metrics.percentile([1, 2], 50) == 1
+
+def test_percentile_empty():
+    assert metrics.percentile([], 95) == 0.0
+
+def test_summarize_empty_log():
+    summary = metrics.summarize([])
+    assert summary["stages"] == {} and summary["block_types"] == {}
+    total = summary["total"]
+    assert total["calls"] == 0 and total["errors"] == 0
+    assert total["latency_p50_s"] == 0.0 and total["latency_p95_s"] == 0.0
+    assert total["cost"] == 0
+
+def test_summarize_groups(monkeypatch):
+    monkeypatch.setattr(config, "COST_PER_1K_PROMPT_TOKENS", 1.0)
+    monkeypatch.setattr(config, "COST_PER_1K_COMPLETION_TOKENS", 2.0)
+    records = [
+        record("layout", latency_s=4.0),
+        record("extraction", "table", latency_s=2.0, retries=1),
+        record("extraction", "table", latency_s=6.0, status="error"),
+        record("extraction", "text_block", latency_s=1.0, hedged=True),
+        record(None, latency_s=0.5, reask=True),
+    ]
+    summary = metrics.summarize(records)
+    assert list(summary["stages"]) == ["extraction", "layout", "unknown"]
+    assert list(summary["block_types"]) == ["extraction/table", "extraction/text_block"]
+
+    table = summary["block_types"]["extraction/table"]
+    assert (table["calls"], table["errors"], table["retries"]) == (2, 1, 1)
+    assert (table["latency_p50_s"], table["latency_p95_s"], table["latency_total_s"]) == (2.0, 6.0, 8.0)
+
+    total = summary["total"]
+    assert (total["calls"], total["hedged"], total["reasks"]) == (5, 1, 1)
+    assert total["prompt_tokens"] == 500 and total["completion_tokens"] == 50
+    assert total["cost"] == pytest.approx(0.5 + 0.1)
+
+def test_single_sample_summary():
+    stage = metrics.summarize([record("validation", latency_s=3.2)])["stages"]["validation"]
+    assert stage["latency_p50_s"] == stage["latency_p95_s"] == 3.2
+
+def test_prometheus_output(metrics_dir):
+    summary = metrics.summarize([record("extraction", "table", latency_s=2.0), record("layout", latency_s=1.0)])
+    path = metrics.write_prometheus(summary)
+    assert path == metrics_dir / "model_calls.prom"
+    lines = path.read_text(encoding="utf-8").splitlines()
+
+    assert 'ocr_model_calls_total{stage="extraction",block_type=""} 1' in lines
+    assert 'ocr_model_calls_total{stage="extraction",block_type="table"} 1' in lines
+    assert 'ocr_model_latency_seconds{stage="layout",block_type="",quantile="0.95"} 1.0' in lines
+    assert 'ocr_model_latency_seconds_count{stage="layout",block_type=""} 1' in lines
+    assert 'ocr_model_tokens_total{stage="layout",block_type="",kind="prompt"} 100' in lines
+    # Every metric has HELP and TYPE, every sample line is "name{labels} value"
+    names = {line.split()[2] for line in lines if line.startswith("# TYPE")}
+    assert {line.split()[2] for line in lines if line.startswith("# HELP")} == names
+    for line in lines:
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            assert name.split("{")[0].removesuffix("_sum").removesuffix("_count") in names
+            float(value)
+    assert not (metrics_dir / "model_calls.prom.tmp").exists()
+
+def test_prometheus_empty_summary(metrics_dir):
+    path = metrics.write_prometheus(metrics.summarize([]))
+    assert all(line.startswith("#") for line in path.read_text(encoding="utf-8").splitlines())
+
+def test_prometheus_label_escaping(metrics_dir):
+    summary = metrics.summarize([record('rule "3.1"', 'C:\\tmp\nx')])
+    text = metrics.write_prometheus(summary).read_text(encoding="utf-8")
+    assert 'ocr_model_calls_total{stage="rule \\"3.1\\"",block_type="C:\\\\tmp\\nx"} 1' in text
+    # The raw newline doesn't break the sample onto two lines
+    assert all(line.startswith(("#", "ocr_model_")) for line in text.splitlines())
+
+def test_run_summary_without_calls_writes_nothing(metrics_dir, monkeypatch):
+    monkeypatch.setattr(metrics, "_records", [])
+    assert metrics.write_run_summary()["total"]["calls"] == 0
+    assert not metrics_dir.exists()
+
+def test_load_records_skips_blank_lines(tmp_path):
+    path = tmp_path / "calls.jsonl"
+    path.write_text('{"latency_s": 1.0}\n\n{"latency_s": 2.0}\n', encoding="utf-8")
+    assert [r["latency_s"] for r in metrics.load_records(path)] == [1.0, 2.0]
+    path.write_text("", encoding="utf-8")
+    assert metrics.load_records(path) == []
+
+def test_recorded_latencies(metrics_dir):
+    assert metrics.recorded_latencies() == {}
+    metrics_dir.mkdir()
+    (metrics_dir / "calls_1.jsonl").write_text(
+        '{"block_type": "table", "latency_s": 2.0, "status": "ok"}\n'
+        '{"block_type": "table", "latency_s": 9.0, "status": "error"}\n'
+        '{"stage": "layout", "latency_s": 1.0, "status": "ok"}\n'
+        '{"block_type": "table", "latency_s": 7.0, "status": "ok", "hedge_lost": true}\n'
+        'not json\n',
+        encoding="utf-8"
+    )
+    assert metrics.recorded_latencies() == {"table": [2.0], "layout": [1.0]}
@@ -0,0 +1,86 @@
+import threading
+import pytest
+import config
+import metrics
+import utils
+
+MAIN = {"endpoint": "main", "model": "qwen-vl-72b"}
+SMALL = {"endpoint": "small", "model": "qwen-vl-7b"}
+TEXT = {"endpoint": "main", "model": "qwen-text"}
+
+@pytest.fixture
+def routes(monkeypatch):
+    monkeypatch.setattr(config, "MODEL_ROUTES", {
+        "default": MAIN,
+        "text_block": SMALL,
+        "header": SMALL,
+        "validation": TEXT,
+        "extraction": TEXT
+    })
+
+@pytest.fixture
+def endpoints(monkeypatch):
+    monkeypatch.setattr(config, "MODEL_ENDPOINTS", {
+        "main": {"base_url": "http://main.local/v1", "api_key": "key-main", "max_concurrency": 2},
+        "small": {"base_url": "http://small.local/v1", "api_key": "key-small"},
+        "nokey": {"base_url": "http://nokey.local/v1", "api_key": ""}
+    })
+    monkeypatch.setattr(utils, "_endpoints", {})
+
+def test_route_by_block_type(routes):
+    assert utils.model_route({"block_type": "text_block"}) == SMALL
+
+def test_route_by_stage(routes):
+    assert utils.model_route({"stage": "validation"}) == TEXT
+
+def test_block_type_wins_over_stage(routes):
+    assert utils.model_route({"stage": "extraction", "block_type": "header"}) == SMALL
+    # Block types without a route fall back to their stage
+    assert utils.model_route({"stage": "extraction", "block_type": "table"}) == TEXT
+
+def test_unrouted_calls_use_default(routes):
+    assert utils.model_route({}) == MAIN
+    assert utils.model_route({"stage": "layout", "block_type": "drawing"}) == MAIN
+
+def test_route_follows_current_tags(routes):
+    with metrics.tags(stage="extraction", block_type="text_block"):
+        assert utils.model_route() == SMALL
+    with metrics.tags(stage="validation"):
+        assert utils.model_route() == TEXT
+    assert utils.model_route() == MAIN
+
+def test_endpoint_client_is_pooled(endpoints):
+    client, slots = utils.endpoint_client("main")
+    assert utils.endpoint_client("main") == (client, slots)
+    assert str(client.base_url).startswith("http://main.local/v1")
+    assert client.max_retries == 0 # Retries are counted by create_completion_with_retries
+
+    small_client, small_slots = utils.endpoint_client("small")
+    assert small_client is not client and small_slots is not slots
+
+def test_endpoint_concurrency_limit(endpoints):
+    _, slots = utils.endpoint_client("main")
+    assert slots.acquire(blocking=False) and slots.acquire(blocking=False)
+    assert not slots.acquire(blocking=False)
+    slots.release()
+    slots.release()
+    # Endpoints without a limit get the default of 8
+    assert utils.endpoint_client("small")[1]._value == 8
+
+def test_endpoint_client_is_shared_across_threads(endpoints):
+    barrier = threading.Barrier(8)
+    clients = []
+    def get():
+        barrier.wait()
+        clients.append(utils.endpoint_client("main"))
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(client) for client, _ in clients}) == 1
+
+def test_endpoint_without_key(endpoints):
+    with pytest.raises(ValueError, match="nokey"):
+        utils.endpoint_client("nokey")
+    assert "nokey" not in utils._endpoints
@@ -0,0 +1,91 @@
+import random
+import pytest
+from PIL import Image, ImageDraw
+import config
+from benchmarks.synthetic_pdf import PAGE_SIZE, draw_page
+from pipeline.page_routing import page_features, route_page
+
+def sheet():
+    """
+    Empty A4 sheet with the frame and title block grid (both ignored by routing).
+    """
+    width, height = PAGE_SIZE
+    image = Image.new("RGB", PAGE_SIZE, "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([118, 30, width - 30, height - 30], outline="black", width=3)
+    tb = [width - 730, height - 230, width - 30, height - 30]
+    draw.rectangle(tb, outline="black", width=3)
+    for k in range(1, 5):
+        draw.line([tb[0], tb[1] + k * 40, tb[2], tb[1] + k * 40], fill="black", width=1)
+    return image, draw
+
+def text_lines(draw, rows=40, top=200):
+    for r in range(rows):
+        draw.text((200, top + r * 24), "Пояснительная записка, класс бетона B25 " * 2, fill="black")
+
+def save(image, tmp_path, name="page.png"):
+    path = tmp_path / name
+    image.save(path)
+    return path
+
+def test_frame_and_title_block_are_ignored(tmp_path):
+    image, _ = sheet()
+    mode, features = route_page(save(image, tmp_path))
+    assert mode == "single_pass"
+    assert features["h_lines"] == 0 and features["v_lines"] == 0
+    assert features["ink_ratio"] < 0.01 # Only the title block's corner reaches the body
+
+def test_text_page_is_single_pass(tmp_path):
+    image, draw = sheet()
+    text_lines(draw)
+    mode, features = route_page(save(image, tmp_path))
+    assert mode == "single_pass"
+    assert 0 < features["ink_ratio"] <= config.SINGLE_PASS_MAX_INK
+    assert features["h_lines"] == 0 and features["v_lines"] == 0
+
+def test_table_page_is_targeted(tmp_path):
+    image, draw = sheet()
+    text_lines(draw, rows=5)
+    for r in range(8): # Horizontal rules of a table
+        draw.line([200, 500 + r * 40, 1100, 500 + r * 40], fill="black", width=2)
+    mode, features = route_page(save(image, tmp_path))
+    assert mode == "targeted"
+    assert features["h_lines"] == 8
+
+def test_vertical_rules_are_targeted(tmp_path):
+    image, draw = sheet()
+    for x in (300, 500, 700, 900):
+        draw.line([x, 200, x, 1200], fill="black", width=2)
+    mode, features = route_page(save(image, tmp_path))
+    assert mode == "targeted"
+    assert features["v_lines"] == 4 and features["h_lines"] == 0
+
+def test_dense_ink_is_targeted(tmp_path):
+    # Hatched drawing without long straight rules
+    image, draw = sheet()
+    rng = random.Random(0)
+    for _ in range(4000):
+        x, y = rng.randint(200, 1100), rng.randint(200, 1300)
+        draw.line([x, y, x + 20, y + 20], fill="black", width=3)
+    mode, features = route_page(save(image, tmp_path))
+    assert features["h_lines"] <= config.SINGLE_PASS_MAX_LINES
+    assert features["ink_ratio"] > config.SINGLE_PASS_MAX_INK
+    assert mode == "targeted"
+
+def test_native_text_layer_is_targeted(tmp_path):
+    image, draw = sheet()
+    text_lines(draw)
+    path = save(image, tmp_path)
+    assert route_page(path, {"words": [{"text": "Пояснительная", "box": [0, 0, 10, 10]}]})[0] == "targeted"
+    # An empty layer (scanned page) doesn't count
+    assert route_page(path, {"words": []})[0] == "single_pass"
+
+def test_adjacent_rows_count_as_one_line():
+    image, draw = sheet()
+    draw.line([200, 600, 1100, 600], fill="black", width=12)
+    assert page_features(image)["h_lines"] == 1
+
+@pytest.mark.parametrize("page_number, expected", [(1, "targeted"), (3, "single_pass")])
+def test_synthetic_pages(tmp_path, page_number, expected):
+    path = save(draw_page(page_number, random.Random(0)), tmp_path)
+    assert route_page(path)[0] == expected
@@ -0,0 +1,20 @@
+import config
+import planner
+
+def test_fractional_block_counts_carry_over():
+    stats = {"table": (0.5, 0.04), "title_block": (1.0, 0.01)}
+    carry = {}
+    pages = [planner.planned_page_blocks(stats, carry) for _ in range(4)]
+    assert sum(1 for page in pages for block_type, _ in page if block_type == "table") == 2
+    assert all(sum(1 for block_type, _ in page if block_type == "title_block") == 1 for page in pages)
+
+def test_small_text_blocks_are_batched(monkeypatch):
+    monkeypatch.setattr(config, "BATCH_SMALL_BLOCKS", True)
+    monkeypatch.setattr(config, "BATCH_MAX_BLOCKS", 6)
+    plan = planner.Plan("test")
+    small = [0, 0, 50, 500]   # 2.5% of the page
+    blocks = [("text_block", small)] * 7 + [("table", [0, 0, 500, 900])]
+    planner.plan_blocks(plan, blocks, (2480, 3508))
+    assert plan.rows["extraction/text_batch"]["requests"] == 1
+    assert plan.rows["extraction/text_block"]["requests"] == 1
+    assert plan.rows["extraction/table"]["requests"] == 1
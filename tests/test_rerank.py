@@ -0,0 +1,99 @@
+import pytest
+import config
+import utils
+from pipeline import step_6_compliance as step6
+
+RULE = "Указан класс бетона фундаментов"
+
+class FakeCrossEncoder:
+    """
+    Scores a pair by the number of rule words in the candidate text.
+    """
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, pairs, batch_size=None, show_progress_bar=None):
+        self.calls += 1
+        return [sum(word.lower() in doc.lower() for word in rule.split()) for rule, doc in pairs]
+
+def candidate(text, page=1):
+    return {"document": text, "metadata": {"page_number": page, "type": "text"}, "distance": 0.5}
+
+CANDIDATES = [
+    candidate("Кровля из профнастила", 1),
+    candidate("Класс бетона фундаментов B25", 2),
+    candidate("Бетон класса B15 для подготовки", 3),
+    candidate("Указан класс бетона фундаментов: B30", 4),
+    candidate("Окна ПВХ", 5),
+]
+
+@pytest.fixture
+def reranker(monkeypatch):
+    model = FakeCrossEncoder()
+    monkeypatch.setattr(step6, "get_reranker", lambda: model)
+    return model
+
+@pytest.fixture
+def validator(monkeypatch):
+    """
+    Replaces the validator LLM call, records the prompts it was given.
+    """
+    prompts = []
+    def ask(prompt, schema, label="LLM"):
+        prompts.append(prompt)
+        return {"status": "ВЫПОЛНЕНО", "reason": "", "evidence": None}, None
+    monkeypatch.setattr(step6, "ask_llm_json", ask)
+    return prompts
+
+def test_rerank_orders_by_score(reranker):
+    kept, stats = step6.rerank_candidates(RULE, CANDIDATES, top_k=5)
+    assert [item["metadata"]["page_number"] for item in kept[:2]] == [4, 2]
+    assert [item["rerank_score"] for item in kept] == sorted((item["rerank_score"] for item in kept), reverse=True)
+    assert stats["candidates"] == 5 and stats["kept"] == 5
+
+def test_rerank_keeps_top_k(reranker):
+    kept, stats = step6.rerank_candidates(RULE, CANDIDATES, top_k=2)
+    assert [item["document"] for item in kept] == [CANDIDATES[3]["document"], CANDIDATES[1]["document"]]
+    assert stats["kept"] == 2
+    # Candidates are copied, not modified
+    assert "rerank_score" not in CANDIDATES[3]
+
+def test_rerank_top_k_larger_than_candidates(reranker):
+    kept, stats = step6.rerank_candidates(RULE, CANDIDATES[:2], top_k=6)
+    assert len(kept) == 2 and stats["kept"] == 2
+
+def test_rerank_without_candidates_skips_model(reranker):
+    assert step6.rerank_candidates(RULE, [], top_k=3) == ([], {"candidates": 0, "kept": 0, "latency_ms": 0.0})
+    assert reranker.calls == 0
+
+def test_disabled_rerank_passes_all_candidates(monkeypatch, reranker, validator):
+    monkeypatch.setattr(config, "RERANK_ENABLED", False)
+    monkeypatch.setattr(config, "LLM_STREAM_JSON", False)
+    result = step6.validate_rule(RULE, CANDIDATES)
+    assert reranker.calls == 0
+    assert "rerank" not in result
+    assert all(item["document"] in validator[0] for item in CANDIDATES)
+    assert step6.candidates_per_query() == 3
+
+def test_enabled_rerank_shrinks_validator_prompt(monkeypatch, reranker, validator):
+    monkeypatch.setattr(config, "RERANK_ENABLED", True)
+    monkeypatch.setattr(config, "RERANK_TOP_K", 2)
+    monkeypatch.setattr(config, "LLM_STREAM_JSON", False)
+    result = step6.validate_rule(RULE, CANDIDATES)
+    assert result["rerank"]["kept"] == 2
+    assert "Окна ПВХ" not in validator[0] and "B30" in validator[0]
+    assert step6.candidates_per_query() == config.RERANK_CANDIDATES_PER_QUERY
+
+def test_tokens_saved_measured_before_truncation(monkeypatch, reranker, validator):
+    monkeypatch.setattr(config, "RERANK_ENABLED", True)
+    monkeypatch.setattr(config, "RERANK_TOP_K", 1)
+    monkeypatch.setattr(config, "LLM_STREAM_JSON", False)
+    # Far more context than MAX_CONTEXT_CHARS: truncating both sides would hide the savings
+    filler = [candidate("Пояснительная записка. " * 200, page) for page in range(10, 20)]
+    result = step6.validate_rule(RULE, [CANDIDATES[3], *filler])
+
+    all_context = "\n\n".join(step6.format_context([CANDIDATES[3], *filler]))
+    kept_context = "\n\n".join(step6.format_context([CANDIDATES[3]]))
+    assert len(all_context) > 2 * step6.MAX_CONTEXT_CHARS
+    saved = utils.estimate_tokens(all_context) - utils.estimate_tokens(kept_context)
+    assert result["rerank"]["prompt_tokens_saved"] == saved
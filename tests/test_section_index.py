@@ -0,0 +1,50 @@
+import pytest
+import config
+from pipeline.artifact_store import open_store
+from pipeline.collection_registry import register_collection, section_pages
+from pipeline.section_index import build_section_index, load_section_index, rule_section_id
+from pipeline.step_3_assembly import run_assembly
+from pipeline.step_6_compliance import section_scopes
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "COLLECTION_REGISTRY_PATH", tmp_path / "collections.json")
+
+def test_unmarked_pages_inherit_previous_section():
+    index = build_section_index({1: set(), 2: {"1"}, 3: set(), 4: {"3"}, 5: set()})
+    assert index == {"1": [1, 2, 3], "3": [4, 5]}
+
+def test_rule_section_id():
+    assert rule_section_id("Раздел 1. Пояснительная записка") == "1"
+    assert rule_section_id("Архитектурные решения") == "3"
+    assert rule_section_id("") is None
+
+def test_section_pages(registry):
+    register_collection("pz", "p", "pz", 10, sections={"1": [1, 2]})
+    register_collection("old", "p", "old", 10, sections=None)
+    assert section_pages("1", ["pz", "old"]) == {"pz": [1, 2], "old": None}
+    assert section_pages("3", ["pz", "old"]) == {"old": None}
+    assert section_pages("3", ["pz"]) == {}
+
+def test_empty_section_index_is_unknown(registry):
+    # Detection found no marks: that must not turn every section into "missing"
+    register_collection("doc", "p", "doc", 10, sections={})
+    assert section_pages("3", ["doc"]) == {"doc": None}
+    assert section_scopes(["Раздел 3. Архитектурные решения"], ["doc"]) == [{"doc": None}]
+
+def test_assembly_without_marks_saves_no_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "ARTIFACT_BACKEND", "folder")
+    with open_store(tmp_path) as store:
+        store.put("extraction", 1, [{"type": "text_block", "content": "Общие данные"}])
+    run_assembly(tmp_path, tmp_path)
+    with open_store(tmp_path) as store:
+        assert load_section_index(store.meta_path("sections")) is None
+
+def test_assembly_saves_detected_sections(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "ARTIFACT_BACKEND", "folder")
+    with open_store(tmp_path) as store:
+        store.put("extraction", 1, [{"type": "title_block", "content": {"Номер_проекта": "123-2024-ПЗ"}}])
+        store.put("extraction", 2, [{"type": "text_block", "content": "Текст"}])
+    run_assembly(tmp_path, tmp_path)
+    with open_store(tmp_path) as store:
+        assert load_section_index(store.meta_path("sections")) == {"1": [1, 2]}
@@ -0,0 +1,30 @@
+import pytest
+import config
+import schemas
+import utils
+
+def test_validate_reports_path():
+    with pytest.raises(schemas.SchemaError, match=r"\$\[1\]\.box"):
+        schemas.validate([{"type": "table", "box": [0, 0, 1, 1]}, {"type": "table", "box": [0, 0]}], schemas.LAYOUT_SCHEMA)
+
+def test_request_json_reasks_once(monkeypatch):
+    monkeypatch.setattr(config, "STRUCTURED_MAX_REASKS", 1)
+    answers = iter(['[{"type": "table", "box": [0, 0]}]', '[{"type": "table", "box": [0, 0, 10, 10]}]'])
+    prompts_sent = []
+    def send(prompt, schema):
+        prompts_sent.append(prompt)
+        return next(answers)
+    assert utils.request_json(send, "layout", schemas.LAYOUT_SCHEMA) == [{"type": "table", "box": [0, 0, 10, 10]}]
+    assert len(prompts_sent) == 2 and "box" in prompts_sent[1]
+
+def test_request_json_gives_up(monkeypatch):
+    monkeypatch.setattr(config, "STRUCTURED_MAX_REASKS", 1)
+    with pytest.raises(ValueError) as error:
+        utils.request_json(lambda prompt, schema: "no json here", "layout", schemas.LAYOUT_SCHEMA)
+    assert error.value.response_text == "no json here"
+
+def test_structured_output_is_opt_in(monkeypatch):
+    monkeypatch.setattr(config, "STRUCTURED_OUTPUT", None)
+    assert utils.structured_output_kwargs(schemas.VERDICT_SCHEMA) == {}
+    monkeypatch.setattr(config, "STRUCTURED_OUTPUT", "guided_json")
+    assert utils.structured_output_kwargs(schemas.VERDICT_SCHEMA) == {"extra_body": {"guided_json": schemas.VERDICT_SCHEMA}}
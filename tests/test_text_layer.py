@@ -0,0 +1,150 @@
+import subprocess
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+import config
+from pipeline import text_layer
+
+SCALE = 2 # Image pixels per PDF point
+PAGE_W, PAGE_H = 600, 800
+LINES = [["Пояснительная", "записка"], ["Класс", "бетона", "B25"], ["Марка", "по", "морозостойкости", "F150"]]
+
+def render_text_page():
+    """
+    A rendered page with a text block and its pdftotext -bbox-layout XHTML
+    (word boxes measured from the rendering).
+    """
+    image = Image.new("RGB", (PAGE_W * SCALE, PAGE_H * SCALE), "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=28)
+    lines_xml = []
+    y = 200
+    for line in LINES:
+        x = 120
+        words_xml = []
+        for word in line:
+            x0, y0, x1, y1 = draw.textbbox((x, y), word, font=font)
+            draw.text((x, y), word, fill="black", font=font)
+            words_xml.append(f'<word xMin="{x0 / SCALE}" yMin="{y0 / SCALE}" xMax="{x1 / SCALE}" '
+                             f'yMax="{y1 / SCALE}">{word}</word>')
+            x = x1 + 16
+        lines_xml.append(f"<line>{''.join(words_xml)}</line>")
+        y += 50
+    page_xml = f'<page width="{PAGE_W}" height="{PAGE_H}"><flow><block>{"".join(lines_xml)}</block></flow></page>'
+    return image, page_xml
+
+def xhtml(*pages):
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml"><head><title></title></head><body>'
+            f'<doc>{"".join(pages)}</doc></body></html>')
+
+EMPTY_PAGE = f'<page width="{PAGE_W}" height="{PAGE_H}"></page>'
+BLOCK_BOX = [110, 80, 300, 850] # [ymin, xmin, ymax, xmax] of the text block, 0-1000
+
+def crop(image, box):
+    ymin, xmin, ymax, xmax = box
+    return image.crop((xmin * image.width // 1000, ymin * image.height // 1000,
+                       xmax * image.width // 1000, ymax * image.height // 1000))
+
+@pytest.fixture
+def fake_pdftotext(monkeypatch):
+    """
+    Replaces the pdftotext call: writes `fake_pdftotext.output` as the XHTML.
+    """
+    class Fake:
+        output = None
+        commands = []
+    fake = Fake()
+    def run(command, check=False, capture_output=False):
+        fake.commands.append(command)
+        with open(command[-1], "w", encoding="utf-8") as f:
+            f.write(fake.output)
+        return subprocess.CompletedProcess(command, 0)
+    monkeypatch.setattr(text_layer.subprocess, "run", run)
+    return fake
+
+def test_parse_bbox_layout(tmp_path):
+    _, page_xml = render_text_page()
+    path = tmp_path / "bbox.html"
+    path.write_text(xhtml(page_xml, EMPTY_PAGE), encoding="utf-8")
+    pages = text_layer.parse_bbox_layout(path)
+
+    assert len(pages) == 2
+    words = pages[0]["words"]
+    assert [word["text"] for word in words] == [word for line in LINES for word in line]
+    assert [word["line"] for word in words] == [1, 1, 2, 2, 2, 3, 3, 3, 3]
+    assert {word["block"] for word in words} == {1}
+    # Boxes are [ymin, xmin, ymax, xmax] in 0-1000 of the page
+    ymin, xmin, ymax, xmax = words[0]["box"]
+    assert 0 <= xmin < xmax <= 1000 and 0 <= ymin < ymax <= 1000
+    assert xmin == pytest.approx(120 / SCALE / PAGE_W * 1000, abs=2)
+    assert pages[1] == {"width": PAGE_W, "height": PAGE_H, "words": []}
+
+def test_extract_text_rich_and_empty_pages(tmp_path, fake_pdftotext, capsys):
+    _, page_xml = render_text_page()
+    fake_pdftotext.output = xhtml(page_xml, EMPTY_PAGE)
+    layer_dir = text_layer.extract_text_layer(tmp_path / "doc.pdf", tmp_path)
+
+    assert layer_dir == tmp_path / "text_layer"
+    assert fake_pdftotext.commands[0][:2] == ["pdftotext", "-bbox-layout"]
+    assert not (layer_dir / "bbox_layout.html").exists()
+    assert "1/2 pages have embedded text" in capsys.readouterr().out
+
+    page = text_layer.load_page_text_layer(tmp_path, "page_1")
+    assert len(page["words"]) == 9
+    # A page without words has no usable layer
+    assert (layer_dir / "page_2.json").exists()
+    assert text_layer.load_page_text_layer(tmp_path, "page_2") is None
+    assert text_layer.load_page_text_layer(tmp_path, "page_3") is None
+
+@pytest.mark.parametrize("error", [
+    FileNotFoundError(2, "No such file or directory", "pdftotext"),
+    subprocess.CalledProcessError(1, ["pdftotext"], stderr=b"Syntax Error")
+])
+def test_missing_pdftotext(tmp_path, monkeypatch, capsys, error):
+    def run(command, check=False, capture_output=False):
+        raise error
+    monkeypatch.setattr(text_layer.subprocess, "run", run)
+    assert text_layer.extract_text_layer(tmp_path / "doc.pdf", tmp_path) is None
+    assert "All blocks will use the VLM" in capsys.readouterr().out
+
+@pytest.fixture
+def rendered(tmp_path):
+    image, page_xml = render_text_page()
+    path = tmp_path / "bbox.html"
+    path.write_text(xhtml(page_xml), encoding="utf-8")
+    return image, text_layer.parse_bbox_layout(path)[0]
+
+def test_covered_block_uses_native_text(rendered):
+    image, layer = rendered
+    cropped = crop(image, BLOCK_BOX)
+    assert text_layer.ink_coverage(cropped, BLOCK_BOX, text_layer.words_in_box(layer, BLOCK_BOX)) > 0.99
+    assert text_layer.native_block_text(layer, BLOCK_BOX, cropped) == \
+        "Пояснительная записка\nКласс бетона B25\nМарка по морозостойкости F150"
+
+def test_uncovered_ink_falls_back_to_vlm(rendered):
+    # A stamp / handwritten note the text layer doesn't know about
+    image, layer = rendered
+    image = image.copy()
+    ImageDraw.Draw(image).ellipse((700, 380, 980, 460), outline="black", width=10)
+    cropped = crop(image, BLOCK_BOX)
+    coverage = text_layer.ink_coverage(cropped, BLOCK_BOX, text_layer.words_in_box(layer, BLOCK_BOX))
+    assert coverage < config.TEXT_LAYER_MIN_COVERAGE
+    assert text_layer.native_block_text(layer, BLOCK_BOX, cropped) is None
+
+def test_coverage_threshold(rendered, monkeypatch):
+    image, layer = rendered
+    image = image.copy()
+    ImageDraw.Draw(image).ellipse((700, 380, 980, 460), outline="black", width=10)
+    cropped = crop(image, BLOCK_BOX)
+    coverage = text_layer.ink_coverage(cropped, BLOCK_BOX, text_layer.words_in_box(layer, BLOCK_BOX))
+    monkeypatch.setattr(config, "TEXT_LAYER_MIN_COVERAGE", coverage)
+    assert text_layer.native_block_text(layer, BLOCK_BOX, cropped) is not None
+    monkeypatch.setattr(config, "TEXT_LAYER_MIN_COVERAGE", coverage + 0.01)
+    assert text_layer.native_block_text(layer, BLOCK_BOX, cropped) is None
+
+def test_block_without_words(rendered):
+    image, layer = rendered
+    box = [600, 100, 900, 900] # Below the text
+    assert text_layer.words_in_box(layer, box) == []
+    assert text_layer.native_block_text(layer, box, crop(image, box)) is None
+    assert text_layer.native_block_text(None, BLOCK_BOX, crop(image, BLOCK_BOX)) is None
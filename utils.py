@@ -2,92 +2,450 @@ import base64
 import json
 import os
 from pathlib import Path
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
 from PIL import Image
 import io
 import config
+import image_prep
+import metrics
+import prompts
+import schemas
 import traceback
+import time
+import re
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, TimeoutError as FutureTimeout, wait
+
+def encode_image(image_path: Path, profile: dict = None) -> tuple:
+    """
+    Encodes an image file to base64 after preprocessing (image_prep.prepare_image):
+    without a profile, the baseline (longest side <= 2000 px, JPEG q85).
+    Returns (base64_string, mime_type, size_sent, baseline_size).
+    """
+    with Image.open(image_path) as img:
+        prepared, image_format, quality = image_prep.prepare_image(img, profile)
+        buffer = io.BytesIO()
+        if image_format == "JPEG":
+            prepared.save(buffer, format="JPEG", quality=quality)
+        else:
+            prepared.save(buffer, format=image_format)
+        mime = f"image/{image_format.lower()}"
+        return base64.b64encode(buffer.getvalue()).decode('utf-8'), mime, prepared.size, image_prep.baseline_size(img.size)
 
 def encode_image_to_base64(image_path: Path) -> str:
     """
     Encodes an image file to a base64 string.
     Resizes if too large to avoid timeouts/errors.
     """
-    with Image.open(image_path) as img:
-        # Resize if max dimension > 2000 (safe limit for most VL models)
-        max_size = 2000
-        if max(img.size) > max_size:
-            img.thumbnail((max_size, max_size))
-        
-        # Save to buffer as JPEG (lighter than PNG)
-        buffer = io.BytesIO()
-        img.convert("RGB").save(buffer, format="JPEG", quality=85)
-        return base64.b64encode(buffer.getvalue()).decode('utf-8')
+    return encode_image(image_path)[0]
 
-def call_qwen_vl(image_path: Path, prompt: str) -> str:
+_endpoints = {} # endpoint name -> (client, semaphore)
+_endpoints_lock = threading.Lock()
+# Threads are started on demand, so the pool costs nothing while hedging is off
+_hedge_pool = ThreadPoolExecutor(max_workers=config.HEDGE_POOL_WORKERS, thread_name_prefix="vl-hedge")
+
+def model_route(tags: dict = None) -> dict:
     """
-    Calls the Qwen-VL model with an image and a prompt.
+    Endpoint and model of a call (config.MODEL_ROUTES): by block type, then
+    stage of the current metrics tags, then "default".
+    """
+    tags = metrics.current_tags() if tags is None else tags
+    for key in (tags.get("block_type"), tags.get("stage")):
+        if key in config.MODEL_ROUTES:
+            return config.MODEL_ROUTES[key]
+    return config.MODEL_ROUTES["default"]
+
+def endpoint_client(name: str) -> tuple:
+    """
+    Shared client of an endpoint (one connection pool per endpoint, reused by all
+    calls) and the semaphore limiting its requests in flight.
+
+    Returns:
+        tuple: (OpenAI client, threading.Semaphore)
+    """
+    with _endpoints_lock:
+        if name not in _endpoints:
+            endpoint = config.MODEL_ENDPOINTS[name]
+            if not endpoint.get("api_key"):
+                raise ValueError(f"API key of endpoint '{name}' is not set. Please check your .env file.")
+            client = OpenAI(api_key=endpoint["api_key"], base_url=endpoint["base_url"], max_retries=0)
+            _endpoints[name] = (client, threading.BoundedSemaphore(endpoint.get("max_concurrency", 8)))
+        return _endpoints[name]
+
+def structured_output_kwargs(schema: dict) -> dict:
+    """
+    Request arguments that constrain the answer to a JSON schema (config.STRUCTURED_OUTPUT).
+    """
+    if schema is None or not config.STRUCTURED_OUTPUT:
+        return {}
+    if config.STRUCTURED_OUTPUT == "guided_json":
+        return {"extra_body": {"guided_json": schema}}
+    if config.STRUCTURED_OUTPUT == "json_schema":
+        return {"response_format": {"type": "json_schema",
+                                    "json_schema": {"name": schema.get("title", "answer"), "schema": schema}}}
+    raise ValueError(f"Unknown structured output mode: {config.STRUCTURED_OUTPUT}")
+
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
+def create_completion_with_retries(client: OpenAI, slots: threading.Semaphore = None, keep_slot: bool = False,
+                                   **kwargs) -> tuple:
     """
-    if not config.QWEN_API_KEY:
-         raise ValueError("QWEN_API_KEY is not set. Please check your .env file.")
+    chat.completions.create with our own retry loop (the client's built-in
+    retries are disabled so that retries can be counted).
+    `slots` (the endpoint's semaphore) is held while a request is in flight, not
+    during the backoff sleeps. With `keep_slot` it stays held after a successful
+    call and the caller releases it (a stream is in flight until it is closed).
+    Returns (response, retries). On final failure the exception gets a `retries` attribute.
+    """
+    retries = 0
+    while True:
+        held = slots is not None and slots.acquire()
+        try:
+            response = client.chat.completions.create(**kwargs)
+            held = held and not keep_slot
+            return response, retries
+        except RETRYABLE_ERRORS as e:
+            if retries >= config.LLM_MAX_RETRIES:
+                e.retries = retries
+                raise
+            retries += 1
+        finally:
+            if held:
+                slots.release()
+        time.sleep(config.LLM_RETRY_BACKOFF * 2 ** (retries - 1))
 
-    client = OpenAI(
-        api_key=config.QWEN_API_KEY,
-        base_url=config.QWEN_BASE_URL,
-        timeout=180.0, # Increased timeout for heavy models
+def record_model_call(kind: str, start: float, usage=None, image_pixels: int = 0, retries: int = 0,
+                      status: str = "ok", prompt_tokens: int = None, completion_tokens: int = None,
+                      model: str = None, **extra):
+    """
+    Records latency and token usage of a finished model call (see metrics.py).
+    """
+    if usage is not None:
+        prompt_tokens = getattr(usage, "prompt_tokens", prompt_tokens)
+        completion_tokens = getattr(usage, "completion_tokens", completion_tokens)
+    metrics.record_call(
+        kind=kind,
+        model=model or config.QWEN_MODEL_NAME,
+        latency_s=time.perf_counter() - start,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        image_pixels=image_pixels,
+        retries=retries,
+        status=status,
+        **extra
     )
 
+def vl_timeout(key: str) -> float:
+    """
+    Request timeout for a class of VL calls (block type or stage): the configured
+    ceiling, tightened to a multiple of the observed p99 once enough calls are recorded.
+    """
+    ceiling = config.VLM_TIMEOUTS.get(key, config.VLM_DEFAULT_TIMEOUT)
+    if config.ADAPTIVE_TIMEOUTS:
+        p99 = metrics.observed_latency(key, 99, config.LATENCY_MIN_SAMPLES)
+        if p99 is not None:
+            return min(ceiling, max(config.VLM_MIN_TIMEOUT, p99 * config.TIMEOUT_P99_FACTOR))
+    return ceiling
+
+def run_hedged(send, hedge_after: float, on_loser) -> tuple:
+    """
+    Runs send() and, if it hasn't answered after `hedge_after` seconds, a
+    duplicate of it; returns the first successful result.
+    The slower request can't be cancelled, `on_loser(future)` is called when it finishes.
+
+    Returns:
+        tuple: (result, hedged)
+    """
+    primary = _hedge_pool.submit(contextvars.copy_context().run, send)
+    try:
+        return primary.result(timeout=hedge_after), False
+    except FutureTimeout:
+        pass
+
+    duplicate = _hedge_pool.submit(contextvars.copy_context().run, send)
+    pending = {primary, duplicate}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    other.add_done_callback(on_loser)
+                return future.result(), True
+            error = future.exception()
+    raise error
+
+def call_qwen_vl_multi(labeled_images: list, prompt: str, schema: dict = None) -> str:
+    """
+    Calls the Qwen-VL model with several images in one message.
+    Each image is preceded by a text label, so the model can key its answer.
+    The endpoint and model are chosen per block type / stage (model_route).
+    The timeout adapts per block type (vl_timeout); with config.HEDGE_REQUESTS a
+    duplicate request is sent once the call is slower than the observed p95.
+
+    Args:
+        labeled_images (list): [(label, image_path), ...]; label may be None for a single image.
+        schema (dict): JSON schema of the expected answer (see structured_output_kwargs).
+    """
+    route = model_route()
+    client, slots = endpoint_client(route["endpoint"])
+    key = metrics.latency_key({"kind": "vl", **metrics.current_tags()})
+    profile = image_prep.profile_for(metrics.current_tags())
+    timeout = vl_timeout(key)
+    client = client.with_options(timeout=timeout) # Same connection pool
+
+    start = time.perf_counter()
+    usage = None
+    image_pixels = 0
+    image_tokens = 0
+    baseline_tokens = 0 # What the baseline encoding would have sent
+    retries = 0
+    status = "ok"
+    hedged = False
+    content = None
+    names = ", ".join(Path(path).name for _, path in labeled_images)
     try:
-        base64_image = encode_image_to_base64(image_path)
+        content_parts = [{"type": "text", "text": prompt}]
+        for label, image_path in labeled_images:
+            base64_image, mime, size, base_size = encode_image(image_path, profile)
+            image_pixels += size[0] * size[1]
+            image_tokens += image_prep.image_tokens(*size)
+            baseline_tokens += image_prep.image_tokens(*base_size)
+            if label is not None:
+                content_parts.append({"type": "text", "text": f"{label}:"})
+            content_parts.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:{mime};base64,{base64_image}" 
+                },
+            })
         
-        response = client.chat.completions.create(
-            model=config.QWEN_MODEL_NAME,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}" 
-                            },
-                        },
-                    ],
-                }
-            ],
-            temperature=0.1, 
-            max_tokens=4096
-        )
+        def send():
+            return create_completion_with_retries(
+                client,
+                slots,
+                model=route["model"],
+                messages=[
+                    {
+                        "role": "user",
+                        "content": content_parts,
+                    }
+                ],
+                temperature=0.1, 
+                max_tokens=4096,
+                **structured_output_kwargs(schema)
+            )
+
+        hedge_after = None
+        if config.HEDGE_REQUESTS:
+            hedge_after = metrics.observed_latency(key, config.HEDGE_PERCENTILE, config.LATENCY_MIN_SAMPLES)
+
+        if hedge_after is None:
+            response, retries = send()
+        else:
+            tags = metrics.current_tags()
+            def record_loser(future):
+                # The slower duplicate still used tokens, record it (outside the latency window)
+                if future.exception() is None:
+                    with metrics.tags(**tags):
+                        record_model_call("vl", start, future.result()[0].usage, image_pixels=image_pixels,
+                                          model=route["model"], images=len(labeled_images), hedge_lost=True)
+            (response, retries), hedged = run_hedged(send, hedge_after, record_loser)
+        usage = response.usage
         
         content = response.choices[0].message.content
-        # Debug print to see what model returns
-        print(f"\nDEBUG MODEL RESPONSE:\n{content}\n------------------")
         return content
 
     except Exception as e:
-        print(f"Error calling Qwen-VL API for {image_path.name}:")
+        status = "error"
+        retries = getattr(e, "retries", retries)
+        print(f"Error calling Qwen-VL API for {names}:")
         traceback.print_exc()
         raise e
+    finally:
+        record_model_call("vl", start, usage, image_pixels=image_pixels, retries=retries, status=status,
+                          model=route["model"], images=len(labeled_images), timeout_s=round(timeout, 1), hedged=hedged,
+                          image_tokens=image_tokens, image_tokens_saved=baseline_tokens - image_tokens,
+                          **({"response": content} if config.LOG_MODEL_RESPONSES else {}))
 
-def call_llm_text(prompt: str, system_message: str = "Ты полезный ассистент.") -> str:
-    client = OpenAI(
-        api_key=config.QWEN_API_KEY,
-        base_url=config.QWEN_BASE_URL,
-    )
+def call_qwen_vl(image_path: Path, prompt: str, schema: dict = None) -> str:
+    """
+    Calls the Qwen-VL model with an image and a prompt.
+    """
+    return call_qwen_vl_multi([(None, image_path)], prompt, schema)
+
+def call_llm_text(prompt: str, system_message: str = "Ты полезный ассистент.", schema: dict = None) -> str:
+    route = model_route()
+    client, slots = endpoint_client(route["endpoint"])
+    start = time.perf_counter()
+    usage = None
+    retries = 0
+    status = "ok"
     try:
-        response = client.chat.completions.create(
-            model=config.QWEN_MODEL_NAME,
+        response, retries = create_completion_with_retries(
+            client,
+            slots,
+            model=route["model"],
             messages=[
                 {"role": "system", "content": system_message},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.2,
+            **structured_output_kwargs(schema)
         )
+        usage = response.usage
         return response.choices[0].message.content
     except Exception as e:
+        status = "error"
+        retries = getattr(e, "retries", retries)
         print(f"Error calling LLM API (Text): {e}")
         return ""
+    finally:
+        record_model_call("text", start, usage, retries=retries, status=status, model=route["model"])
+
+class JsonStreamScanner:
+    """
+    Incrementally scans streamed text for the first complete JSON value.
+    Tracks bracket depth outside of string literals, so the stream can be
+    closed as soon as the value is balanced and parses.
+    An optional `accept` predicate rejects values of the wrong shape
+    (e.g. a "[1]" footnote in prose before the real answer).
+    """
+    def __init__(self, openers: str = "[{", accept=None):
+        self.openers = openers
+        self.accept = accept
+        self.buffer = ""
+        self.value = None
+        self.done = False
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> bool:
+        """
+        Adds a piece of streamed text. Returns True once a JSON value is complete.
+        """
+        self.buffer += text
+        while not self.done and self._pos < len(self.buffer):
+            ch = self.buffer[self._pos]
+            if self._start == -1:
+                if ch in self.openers:
+                    self._start = self._pos
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = self.buffer[self._start : self._pos + 1]
+                    try:
+                        value = json.loads(candidate)
+                        if self.accept is not None and not self.accept(value):
+                            raise ValueError("Rejected JSON value")
+                        self.value = value
+                        self.done = True
+                    except ValueError:
+                        # Not the JSON we want after all - rescan after this opener
+                        self._pos = self._start
+                        self._start = -1
+            self._pos += 1
+        return self.done
+
+    @property
+    def json_text(self) -> str:
+        """
+        The raw text of the complete JSON value (empty until done).
+        """
+        if not self.done:
+            return ""
+        return self.buffer[self._start : self._pos]
+
+def call_llm_json_stream(prompt: str, system_message: str = "Ты полезный ассистент.", expect: str = "[{", accept=None,
+                         schema: dict = None) -> tuple:
+    """
+    Streams a text completion and stops reading as soon as a complete JSON value
+    (starting with one of the `expect` characters and passing `accept`) has been received.
+
+    Returns:
+        tuple: (text, timings) where text is the JSON slice (or the whole response
+        if no JSON value was found) and timings holds ttft_ms, total_ms, early_stop.
+    """
+    route = model_route()
+    client, slots = endpoint_client(route["endpoint"])
+    timings = {"ttft_ms": None, "total_ms": None, "early_stop": False}
+    scanner = JsonStreamScanner(expect, accept)
+    start = time.perf_counter()
+    usage = None
+    retries = 0
+    status = "ok"
+    delta_count = 0
+    try:
+        # The endpoint slot is taken per attempt and held until the stream is closed
+        stream, retries = create_completion_with_retries(
+            client,
+            slots,
+            keep_slot=True,
+            model=route["model"],
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.2,
+            stream=True,
+            stream_options={"include_usage": True}, # Usage arrives only if we read to the end
+            **structured_output_kwargs(schema)
+        )
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                delta_count += 1
+                if timings["ttft_ms"] is None:
+                    timings["ttft_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                if scanner.feed(delta):
+                    timings["early_stop"] = True
+                    break
+        finally:
+            # Closing the stream drops the connection, so the server stops generating
+            stream.close()
+            slots.release()
+    except Exception as e:
+        status = "error"
+        retries = getattr(e, "retries", retries)
+        print(f"Error calling LLM API (Text, streaming): {e}")
+        return "", timings
+    finally:
+        timings["total_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        # Early-stopped streams carry no usage: estimate (one delta ~ one token)
+        record_model_call(
+            "text_stream", start, usage, retries=retries, status=status, model=route["model"],
+            prompt_tokens=estimate_tokens(system_message + prompt),
+            completion_tokens=delta_count,
+            usage_estimated=usage is None,
+            ttft_ms=timings["ttft_ms"],
+            early_stop=timings["early_stop"]
+        )
+
+    if scanner.done:
+        return scanner.json_text, timings
+    return scanner.buffer, timings
 
 def parse_json_from_response(response_text: str):
     """
@@ -139,3 +497,46 @@ def parse_json_from_response(response_text: str):
             
         print(f"FAILED TO PARSE JSON. Raw response:\n{response_text}")
         raise
+
+def request_json(send, prompt: str, schema: dict):
+    """
+    Asks for a JSON answer matching `schema` and validates it. An invalid answer
+    re-asks only this request (up to config.STRUCTURED_MAX_REASKS times), with
+    the validation error appended to the prompt.
+
+    Args:
+        send: callable(prompt, schema) -> response text (e.g. a call_qwen_vl wrapper).
+
+    Returns the parsed value. Raises ValueError (schemas.SchemaError or a JSON
+    error, with the last answer in `response_text`) if every attempt is invalid.
+    """
+    attempt_prompt = prompt
+    for reask in range(config.STRUCTURED_MAX_REASKS + 1):
+        with metrics.tags(**({"reask": reask} if reask else {})):
+            response_text = send(attempt_prompt, schema)
+        try:
+            value = parse_json_from_response(response_text or "")
+            schemas.validate(value, schema)
+            return value
+        except ValueError as e:
+            error = e
+            error.response_text = response_text
+        print(f"  Invalid {schema.get('title', 'JSON')} answer: {error}")
+        attempt_prompt = prompt + prompts.SCHEMA_REASK_SUFFIX.format(error=error)
+    raise error
+
+def page_number_from_path(path: Path) -> int:
+    """
+    Parses the page number from names like page_12.png / page_12_data.json (0 if absent).
+    """
+    match = re.search(r"page_(\d+)", Path(path).name)
+    return int(match.group(1)) if match else 0
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for prompt-size reporting.
+    Qwen's tokenizer averages ~3 characters per token on mixed Russian text.
+    """
+    if not text:
+        return 0
+    return max(1, len(text) // 3)